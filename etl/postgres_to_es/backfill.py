@@ -0,0 +1,351 @@
+"""
+Re-index the data modified in a time range.
+
+The range is split into time slices, which are extracted and loaded in parallel
+workers with the components of the ETL process. Every worker has its own Postgres
+connection and keeps its producer states in memory, so the checkpoints of the
+running ETL process are left untouched. Documents are written with the indexing
+mode of the ETL process, so with external versioning a backfill never overwrites
+a newer document.
+
+Usage:
+    python backfill.py --from 2023-05-01T00:00 --to 2023-05-02T00:00 --slices 24 --workers 4
+"""
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import closing
+from datetime import datetime, timedelta, tzinfo
+from threading import Lock
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+
+from etl_settings import (
+    ENTITIES_UPDATE_SCHEMA,
+    get_elasticsearch_host,
+    get_loader_settings,
+    get_postgres_dsn,
+    load_elasticsearch_indices,
+)
+from extractor import MultipleQueryExtractor
+from extractor.source_database.postgres import PostgresConnection
+from loader import ElasticsearchLoader
+from pipeline import create_batch_size_controllers, create_retry_policies
+from state.persistent_state_manager import MemoryStorage
+from util.configuration import LOGGER, read_app_config
+
+
+class BackfillProgress:
+    """
+    Progress of the time slices of a backfill.
+
+    The progress of a slice is the share of its time range the producers
+    have passed, averaged over the update schemas. Timestamps without a time
+    zone are taken in the session time zone of Postgres, like Postgres compares
+    them with the `modified` columns.
+    """
+
+    def __init__(
+        self,
+        slices: List[Tuple[datetime, datetime]],
+        session_time_zone: Optional[tzinfo] = None,
+    ):
+        """
+        Initialize a BackfillProgress object.
+
+        Args:
+            slices (List[Tuple[datetime, datetime]]): The exclusive start and
+                inclusive end of every slice.
+            session_time_zone (tzinfo, optional): The session time zone of Postgres.
+                Defaults to None (all timestamps are in the same time zone).
+        """
+        self.slices = slices
+        self.session_time_zone = session_time_zone
+        self.lock = Lock()
+        self.started_at = monotonic()
+
+        self.slice_progress: Dict[int, float] = {}
+        self.loaded_documents = 0
+
+    def update(self, slice_index: int, producer_states: dict, loaded_documents: int) -> None:
+        """
+        Record the progress of a slice.
+
+        Args:
+            slice_index (int): The index of the slice.
+            producer_states (dict): The modified timestamp and id of the last extracted record
+                of the producers of the slice by state key.
+            loaded_documents (int): The number of documents loaded since the last update.
+        """
+        slice_start, slice_end = self.slices[slice_index]
+        slice_duration = (slice_end - slice_start).total_seconds()
+
+        schema_progress = []
+        for update_schema in ENTITIES_UPDATE_SCHEMA.values():
+            position = producer_states.get(f"producer.{update_schema['producer']['entity_name']}")
+            if position is None:
+                schema_progress.append(0)
+                continue
+
+            modified_timestamp, _ = position
+            passed = (
+                self._in_session_time_zone(modified_timestamp)
+                - self._in_session_time_zone(slice_start)
+            )
+            schema_progress.append(min(max(passed.total_seconds() / slice_duration, 0), 1))
+
+        with self.lock:
+            self.slice_progress[slice_index] = sum(schema_progress) / len(schema_progress)
+            self.loaded_documents += loaded_documents
+
+    def _in_session_time_zone(self, timestamp: datetime) -> datetime:
+        """Return a timestamp in the session time zone, without a time zone if it's unknown."""
+        if self.session_time_zone is None:
+            return timestamp.replace(tzinfo=None)
+        if timestamp.tzinfo is None:
+            return timestamp.replace(tzinfo=self.session_time_zone)
+        return timestamp.astimezone(self.session_time_zone)
+
+    def finish(self, slice_index: int) -> None:
+        """
+        Mark a slice as done.
+
+        Args:
+            slice_index (int): The index of the slice.
+        """
+        with self.lock:
+            self.slice_progress[slice_index] = 1
+
+    def summary(self) -> dict:
+        """
+        Return the overall progress.
+
+        Returns:
+            dict: done slices, progress in percent, loaded documents, documents
+                per second and the estimated remaining time in seconds.
+        """
+        with self.lock:
+            progress = sum(self.slice_progress.values()) / len(self.slices)
+            done_slices = sum(1 for value in self.slice_progress.values() if value == 1)
+            loaded_documents = self.loaded_documents
+
+        elapsed = monotonic() - self.started_at
+        return {
+            'done_slices': f'{done_slices}/{len(self.slices)}',
+            'progress_percent': round(progress * 100, 1),
+            'loaded_documents': loaded_documents,
+            'documents_per_second': round(loaded_documents / max(elapsed, 1e-9), 1),
+            'eta_s': round(elapsed / progress * (1 - progress)) if progress else None,
+        }
+
+
+def split_time_range(
+    range_start: datetime,
+    range_end: datetime,
+    slice_count: int,
+) -> List[Tuple[datetime, datetime]]:
+    """
+    Split a time range into slices of equal duration.
+
+    Args:
+        range_start (datetime): The inclusive start of the range.
+        range_end (datetime): The inclusive end of the range.
+        slice_count (int): The number of slices.
+
+    Returns:
+        List[Tuple[datetime, datetime]]: The exclusive start and inclusive end of every slice.
+    """
+    slice_duration = (range_end - range_start) / slice_count
+    # The producers select `modified > start`, the first slice must include the range start.
+    boundaries = [range_start - timedelta(microseconds=1)]
+    boundaries.extend(range_start + slice_duration * index for index in range(1, slice_count))
+    boundaries.append(range_end)
+
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def backfill_slice(slice_index: int, progress: BackfillProgress, settings: dict) -> int:
+    """
+    Extract and load the data modified in one time slice.
+
+    Args:
+        slice_index (int): The index of the slice.
+        progress (BackfillProgress): The progress to report to.
+        settings (dict): The application configurations and the connection
+            and index settings of the ETL process.
+
+    Returns:
+        int: The number of loaded documents.
+    """
+    slice_start, slice_end = progress.slices[slice_index]
+    configurations = settings['configurations']
+
+    pg_connection = PostgresConnection(
+        dsn=settings['dsn_postgres'],
+        package_limit=configurations['PAGE_DATA_SIZE_LIMIT'],
+        statement_timeout=configurations['STATEMENT_TIMEOUT'],
+    )
+
+    with closing(pg_connection) as pg_conn:
+        postgres_policy, elasticsearch_policy = create_retry_policies(pg_conn)
+
+        producer_states = {
+            f"producer.{update_schema['producer']['entity_name']}": [slice_start.isoformat(), None]
+            for update_schema in ENTITIES_UPDATE_SCHEMA.values()
+        }
+        extractor = MultipleQueryExtractor(
+            db_connection=pg_conn,
+            entities_update_schema=ENTITIES_UPDATE_SCHEMA,
+            persistant_state_storage=MemoryStorage(producer_states),
+            retry_policy=postgres_policy,
+            coalescer_settings={'window': 0},
+            batch_size_controllers=create_batch_size_controllers(configurations),
+            derived_documents=(
+                MultipleQueryExtractor.PERSON_DOCUMENT,
+                MultipleQueryExtractor.GENRE_DOCUMENT,
+            ),
+            modified_until=slice_end,
+        )
+
+        elasticsearch_index_schema = settings['elasticsearch_index_schema']
+        loader = ElasticsearchLoader(
+            host=settings['elasticsearch_host'],
+            index_name=elasticsearch_index_schema['index_name'],
+            index_settings=elasticsearch_index_schema['index_settings'],
+            derived_indices=settings['derived_elasticsearch_indices'],
+            **settings['loader_settings'],
+        )
+
+        with closing(loader):
+            loaded_count = 0
+            while True:
+                previous_states = dict(extractor.last_state)
+
+                documents = extractor.extract_data()
+                if documents:
+                    elasticsearch_policy.call(loader.load_data, documents=documents)
+                extractor.commit_state()
+
+                loaded_count += len(documents)
+                progress.update(slice_index, extractor.last_state, len(documents))
+
+                if extractor.last_state == previous_states:
+                    progress.finish(slice_index)
+                    return loaded_count
+
+
+def run_backfill(
+    range_start: datetime,
+    range_end: datetime,
+    slice_count: int,
+    worker_count: int,
+    report_interval: float,
+) -> bool:
+    """
+    Backfill a time range with parallel workers and report the progress.
+
+    Args:
+        range_start (datetime): The inclusive start of the range.
+        range_end (datetime): The inclusive end of the range.
+        slice_count (int): The number of time slices.
+        worker_count (int): The number of parallel workers.
+        report_interval (float): The interval of the progress reports in seconds.
+
+    Returns:
+        bool: True if all slices were loaded.
+    """
+    # Read once, the config parser isn't safe to use from the worker threads.
+    configurations = read_app_config()
+    elasticsearch_index_schema, derived_elasticsearch_indices = load_elasticsearch_indices()
+    settings = {
+        'configurations': configurations,
+        'dsn_postgres': get_postgres_dsn(),
+        'elasticsearch_host': get_elasticsearch_host(),
+        'loader_settings': get_loader_settings(),
+        'elasticsearch_index_schema': elasticsearch_index_schema,
+        'derived_elasticsearch_indices': derived_elasticsearch_indices,
+    }
+
+    with closing(PostgresConnection(dsn=settings['dsn_postgres'])) as pg_conn:
+        session_time_zone = pg_conn.select_current_timestamp().tzinfo
+
+    slices = split_time_range(range_start, range_end, slice_count)
+    progress = BackfillProgress(slices, session_time_zone=session_time_zone)
+    LOGGER.info(
+        'Backfill %s - %s in %s slices with %s workers',
+        range_start, range_end, slice_count, worker_count,
+    )
+
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        futures = {
+            executor.submit(backfill_slice, slice_index, progress, settings): slice_index
+            for slice_index in range(len(slices))
+        }
+
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=report_interval)
+            LOGGER.info('Backfill progress: %s', progress.summary())
+
+    failed_slices = []
+    for future, slice_index in futures.items():
+        if future.exception():
+            slice_start, slice_end = slices[slice_index]
+            LOGGER.error(
+                'Slice %s - %s failed, run it again: %s',
+                slice_start, slice_end, future.exception(),
+            )
+            failed_slices.append(slice_index)
+
+    LOGGER.info('Backfill finished: %s', progress.summary())
+    return not failed_slices
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        '--from',
+        dest='range_start',
+        type=datetime.fromisoformat,
+        required=True,
+        help='inclusive start of the modified range, ISO 8601',
+    )
+    parser.add_argument(
+        '--to',
+        dest='range_end',
+        type=datetime.fromisoformat,
+        required=True,
+        help='inclusive end of the modified range, ISO 8601',
+    )
+    parser.add_argument('--workers', type=int, default=4, help='number of parallel workers')
+    parser.add_argument(
+        '--slices',
+        type=int,
+        help='number of time slices, defaults to four per worker',
+    )
+    parser.add_argument(
+        '--report-interval',
+        type=float,
+        default=10,
+        help='seconds between progress reports',
+    )
+    arguments = parser.parse_args()
+
+    if arguments.range_end <= arguments.range_start:
+        parser.error('--to must be after --from')
+
+    is_successful = run_backfill(
+        range_start=arguments.range_start,
+        range_end=arguments.range_end,
+        slice_count=arguments.slices or arguments.workers * 4,
+        worker_count=arguments.workers,
+        report_interval=arguments.report_interval,
+    )
+    sys.exit(0 if is_successful else 1)
+
+
+if __name__ == '__main__':
+    main()
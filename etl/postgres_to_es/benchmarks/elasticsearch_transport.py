@@ -0,0 +1,244 @@
+"""
+Benchmark of the Elasticsearch transport options of the loader.
+
+Loads the same generated movies with every transport option and reports
+the bytes on the wire and the bulk latency. By default the documents are sent
+to local stand-in nodes, which answer bulk requests like Elasticsearch and
+count the received bytes. With `--hosts` a real cluster is used, the bytes on
+the wire are not measured then.
+
+Usage:
+    python -m benchmarks.elasticsearch_transport --documents 20000
+    python -m benchmarks.elasticsearch_transport --hosts localhost:9200
+"""
+import argparse
+import gzip
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+from typing import List
+
+from data.dataclasses import Movie
+from loader import ElasticsearchLoader
+from loader.elasticsearch.transport import NODE_LATENCY_TRACKER, parse_hosts
+
+TRANSPORT_OPTIONS = {
+    'baseline': {
+        'nodes': 1,
+        'thread_count': 1,
+        'transport_settings': {},
+    },
+    'http_compress': {
+        'nodes': 1,
+        'thread_count': 1,
+        'transport_settings': {'http_compress': True},
+    },
+    'connection_pool': {
+        'nodes': 1,
+        'thread_count': 4,
+        'transport_settings': {'connections_per_node': 8},
+    },
+    'round_robin': {
+        'nodes': 2,
+        'thread_count': 4,
+        'transport_settings': {'connections_per_node': 8, 'node_selector_class': 'round_robin'},
+    },
+    'all': {
+        'nodes': 2,
+        'thread_count': 4,
+        'transport_settings': {
+            'http_compress': True,
+            'connections_per_node': 8,
+            'node_selector_class': 'round_robin',
+        },
+    },
+}
+
+
+class StandInNodeHandler(BaseHTTPRequestHandler):
+    """Answer index and bulk requests like an Elasticsearch node."""
+
+    received_bytes = 0
+    lock = threading.Lock()
+
+    def do_HEAD(self):
+        self._send_json({})
+
+    def do_GET(self):
+        self._send_json({'version': {'number': '8.6.2'}, 'tagline': 'You Know, for Search'})
+
+    def do_PUT(self):
+        if self.path.split('?')[0].endswith('/_bulk'):
+            self._answer_bulk()
+        else:
+            self._read_body()
+            self._send_json({'acknowledged': True})
+
+    def do_POST(self):
+        self._answer_bulk()
+
+    def _answer_bulk(self):
+        body = self._read_body()
+        if 'gzip' in self.headers.get('Content-Encoding', ''):
+            body = gzip.decompress(body)
+
+        lines = [json.loads(line) for line in body.splitlines() if line]
+        items = []
+        for line in lines:
+            op_type, metadata = next(iter(line.items()))
+            if op_type in {'index', 'create', 'update', 'delete'}:
+                items.append({op_type: {'_id': metadata.get('_id'), 'status': 200}})
+
+        self._send_json({'took': 1, 'errors': False, 'items': items})
+
+    def log_message(self, *args):
+        """Keep the benchmark output clean."""
+
+    def _read_body(self) -> bytes:
+        content_length = int(self.headers.get('Content-Length', 0))
+        with self.lock:
+            StandInNodeHandler.received_bytes += content_length
+        return self.rfile.read(content_length)
+
+    def _send_json(self, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('X-Elastic-Product', 'Elasticsearch')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+
+def start_stand_in_nodes(count: int) -> List[dict]:
+    """
+    Start stand-in nodes on free local ports.
+
+    Args:
+        count (int): The number of nodes.
+
+    Returns:
+        List[dict]: The host connection parameters of the nodes.
+    """
+    hosts = []
+    for _ in range(count):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StandInNodeHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        hosts.append({'scheme': 'http', 'host': '127.0.0.1', 'port': server.server_port})
+
+    return hosts
+
+
+def generate_movies(count: int) -> List[Movie]:
+    """
+    Generate movies with realistic field sizes.
+
+    Args:
+        count (int): The number of movies.
+
+    Returns:
+        List[Movie]: The movies.
+    """
+    movies = []
+    for number in range(count):
+        actors = [
+            {'id': str(uuid.uuid4()), 'name': f'Actor {number}-{index}'} for index in range(8)
+        ]
+        writers = [
+            {'id': str(uuid.uuid4()), 'name': f'Writer {number}-{index}'} for index in range(2)
+        ]
+        movies.append(
+            Movie(
+                id=str(uuid.uuid4()),
+                imdb_rating=7.5,
+                title=f'Star Journey {number}',
+                description='A crew travels through space and discovers new worlds. ' * 5,
+                director=f'Director {number}',
+                genre=['Sci-Fi', 'Adventure'],
+                actors_names=[actor['name'] for actor in actors],
+                writers_names=[writer['name'] for writer in writers],
+                actors=actors,
+                writers=writers,
+                version=number,
+            ),
+        )
+
+    return movies
+
+
+def run_benchmark(documents: List[Movie], hosts: List[dict], option: dict) -> dict:
+    """
+    Load the documents with one transport option.
+
+    Args:
+        documents (List[Movie]): The documents to load.
+        hosts (List[dict]): The hosts, None to start stand-in nodes.
+        option (dict): The transport option.
+
+    Returns:
+        dict: The measured bytes on the wire and latencies.
+    """
+    is_stand_in = hosts is None
+    if is_stand_in:
+        hosts = start_stand_in_nodes(option['nodes'])
+    StandInNodeHandler.received_bytes = 0
+    NODE_LATENCY_TRACKER.reset()
+
+    loader = ElasticsearchLoader(
+        host=hosts,
+        index_name='movies_benchmark',
+        index_settings={},
+        indexing_mode=ElasticsearchLoader.EXTERNAL_VERSION_MODE,
+        thread_count=option['thread_count'],
+        transport_settings=option['transport_settings'],
+    )
+
+    started_at = perf_counter()
+    loader.load_data(documents=documents)
+    elapsed = perf_counter() - started_at
+
+    node_latencies = NODE_LATENCY_TRACKER.summary().values()
+    return {
+        'wire_bytes': StandInNodeHandler.received_bytes if is_stand_in else None,
+        'elapsed_s': round(elapsed, 2),
+        'requests': sum(node['requests'] for node in node_latencies),
+        'p50_ms': max(node['p50_ms'] for node in node_latencies),
+        'p99_ms': max(node['p99_ms'] for node in node_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--documents', type=int, default=20000, help='number of movies to load')
+    parser.add_argument('--hosts', help='comma separated host:port list of a real cluster')
+    parser.add_argument(
+        '--options',
+        nargs='*',
+        default=list(TRANSPORT_OPTIONS),
+        help='transport options to run',
+    )
+    arguments = parser.parse_args()
+
+    hosts = parse_hosts(arguments.hosts) if arguments.hosts else None
+    documents = generate_movies(arguments.documents)
+
+    print(
+        f"{'option':<16}{'wire bytes':>14}{'elapsed s':>11}"
+        f"{'requests':>10}{'p50 ms':>9}{'p99 ms':>9}",
+    )
+    for option_name in arguments.options:
+        result = run_benchmark(documents, hosts, TRANSPORT_OPTIONS[option_name])
+        print(
+            f"{option_name:<16}{str(result['wire_bytes']):>14}{result['elapsed_s']:>11}"
+            f"{result['requests']:>10}{result['p50_ms']:>9}{result['p99_ms']:>9}",
+        )
+
+
+if __name__ == '__main__':
+    main()
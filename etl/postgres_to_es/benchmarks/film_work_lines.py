@@ -0,0 +1,139 @@
+"""
+Benchmark of the film work transform to spool lines.
+
+Transforms the same generated merger rows to the NDJSON lines of the spool
+with the Movie path (Movie objects, bulk action dictionaries, serialized by
+the spool) and with the lines the loader builds straight from the rows,
+checks that both produce identical lines and reports the CPU time per 10k films
+in both indexing modes.
+
+Usage:
+    python -m benchmarks.film_work_lines --films 10000
+"""
+import argparse
+import random
+import uuid
+from time import process_time
+from typing import Callable, List
+
+from elasticsearch import Elasticsearch
+
+from extractor.extractor import BaseExtractor
+from loader import ElasticsearchLoader
+from spool.write_ahead_spool import encode_record
+
+ROLES = ('actor', 'actor', 'actor', 'writer', 'director')
+
+
+def generate_film_works(count: int) -> List[dict]:
+    """
+    Generate rows shaped like the result of the merger query.
+
+    Args:
+        count (int): The number of film works.
+
+    Returns:
+        List[dict]: The film work rows.
+    """
+    film_works = []
+    for number in range(count):
+        persons = [
+            {
+                'person_id': str(uuid.uuid4()),
+                'full_name': f'Person {number}-{index}',
+                'person_role': random.choice(ROLES),
+            }
+            for index in range(random.randint(0, 20))
+        ]
+        film_works.append({
+            'fw_id': str(uuid.uuid4()),
+            'title': f'Star Journey {number}',
+            'description': 'A crew travels through space and discovers new worlds.',
+            'rating': round(random.uniform(1, 10), 1),
+            'persons': persons,
+            'genres': ['Sci-Fi', 'Adventure'],
+            'genre_ids': [],
+            'version': number,
+        })
+
+    return film_works
+
+
+def movie_lines(loader: ElasticsearchLoader, film_works: List[dict]) -> List[str]:
+    """
+    Transform rows to spool lines through Movie objects and bulk action dictionaries.
+
+    Args:
+        loader (ElasticsearchLoader): The loader.
+        film_works (List[dict]): The film work rows.
+
+    Returns:
+        List[str]: The spool lines.
+    """
+    movies = BaseExtractor._transform_film_works_to_dataclass(None, film_works=film_works)
+    return [encode_record(action) for action in loader.prepare_actions(documents=movies)]
+
+
+def measure(transform: Callable, film_works: List[dict], repeat: int) -> tuple:
+    """
+    Measure the best CPU time of a transform.
+
+    Args:
+        transform (Callable): The transform function.
+        film_works (List[dict]): The film work rows.
+        repeat (int): The number of runs.
+
+    Returns:
+        tuple: The best CPU time in seconds and the spool lines.
+    """
+    timings = []
+    for _ in range(repeat):
+        started_at = process_time()
+        lines = transform(film_works)
+        timings.append(process_time() - started_at)
+
+    return min(timings), lines
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--films', type=int, default=10000, help='number of film works')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs per transform')
+    arguments = parser.parse_args()
+
+    film_works = generate_film_works(arguments.films)
+    per_10k = 10000 / arguments.films
+
+    indexing_modes = (ElasticsearchLoader.UPDATE_MODE, ElasticsearchLoader.EXTERNAL_VERSION_MODE)
+    for indexing_mode in indexing_modes:
+        loader = ElasticsearchLoader(
+            host={'scheme': 'http', 'host': 'localhost', 'port': 9200},
+            index_name='movies',
+            index_settings={},
+            indexing_mode=indexing_mode,
+            client=Elasticsearch('http://localhost:9200'),
+        )
+
+        movie_time, expected_lines = measure(
+            lambda rows: movie_lines(loader, rows),
+            film_works,
+            arguments.repeat,
+        )
+        lines_time, lines = measure(
+            lambda rows: loader.prepare_film_work_lines(film_works=rows),
+            film_works,
+            arguments.repeat,
+        )
+
+        print(f'{indexing_mode}:')
+        print(f'  movie path:   {movie_time * per_10k * 1000:.1f} ms CPU per 10k films')
+        print(f'  direct lines: {lines_time * per_10k * 1000:.1f} ms CPU per 10k films')
+        print(f'  speedup: {movie_time / lines_time:.1f}x')
+        print(f'  identical output: {lines == expected_lines}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""
+Benchmark of the logging overhead of the ETL process.
+
+Emits the log records of a catch-up, one cycle per batch: the bulk request
+of the transport, the found and loaded counts, the coalescer, lane and spool
+metrics and the deleted documents. Every logging setup writes to a file, the
+time spent in the logging thread and until the log is written is reported
+per 100k documents. The `legacy` setup logs like the ETL process did before:
+eagerly formatted messages and the full list of deleted IDs.
+
+Usage:
+    python -m benchmarks.logging_overhead --documents 100000 --batch-size 100
+"""
+import argparse
+import logging
+import os
+import tempfile
+import uuid
+from time import perf_counter
+
+from util.logger.logger import (
+    ASYNC_MODE,
+    JSON_FORMAT,
+    SYNC_MODE,
+    TEXT_FORMAT,
+    create_log_handler,
+)
+
+LOGGING_SETUPS = {
+    'legacy': {'mode': SYNC_MODE, 'log_format': TEXT_FORMAT, 'rate_limit': 0},
+    'sync_text': {'mode': SYNC_MODE, 'log_format': TEXT_FORMAT, 'rate_limit': 0},
+    'sync_json': {'mode': SYNC_MODE, 'log_format': JSON_FORMAT, 'rate_limit': 0},
+    'async_text': {'mode': ASYNC_MODE, 'log_format': TEXT_FORMAT, 'rate_limit': 0},
+    'async_json': {'mode': ASYNC_MODE, 'log_format': JSON_FORMAT, 'rate_limit': 0},
+    'async_json_limited': {'mode': ASYNC_MODE, 'log_format': JSON_FORMAT, 'rate_limit': 1},
+    'async_json_sampled': {
+        'mode': ASYNC_MODE,
+        'log_format': JSON_FORMAT,
+        'rate_limit': 0,
+        'sample_rate': 0.1,
+    },
+}
+
+MESSAGE_FORMAT = '[%(name)s] >> [%(levelname)s] %(asctime)s >> %(message)s'
+
+
+def log_cycle(logger: logging.Logger, batch_size: int, deleted_ids: list, is_legacy: bool):
+    """
+    Emit the log records of one cycle.
+
+    Args:
+        logger (logging.Logger): The logger.
+        batch_size (int): The number of documents of the cycle.
+        deleted_ids (list): The IDs of the deleted documents.
+        is_legacy (bool): Log like the ETL process did before.
+    """
+    metrics = {'queued': 120, 'served': batch_size, 'oldest_wait_s': 0.4, 'p99_latency_s': 1.2}
+    # The per-batch records opt in to the rate limit and sampling, the transport's are limited
+    # by its logger.
+    transport_extra = {} if is_legacy else {'rate_limited': True}
+    metrics_extra = {} if is_legacy else {'pipeline': 'movies', 'rate_limited': True}
+
+    logger.info(
+        'POST %s [status:%s duration:%.3fs]',
+        'http://es-1:9200/_bulk',
+        200,
+        0.042,
+        extra=transport_extra,
+    )
+    logger.info('[%s] Number of found data to be load: %s', 'movies', batch_size)
+    logger.info('[%s] Coalescer metrics: %s', 'movies', metrics, extra=metrics_extra)
+    logger.info(
+        '[%s] Lane metrics: %s',
+        'movies',
+        {'film': metrics, 'person': metrics},
+        extra=metrics_extra,
+    )
+    logger.info('[%s] Spool metrics: %s', 'movies', metrics, extra=metrics_extra)
+
+    if is_legacy:
+        logger.info(
+            f'ETL process finished.\n \
+              Number of data loaded: {batch_size}\n \
+              Next processing in {0} seconds.',
+        )
+        logger.warning(
+            'The following obsolete documents were deleted from %s: %s',
+            'movies',
+            deleted_ids,
+        )
+    else:
+        logger.info(
+            '[%s] ETL process finished. Number of data loaded: %s. '
+            'Next processing in %s seconds.',
+            'movies',
+            batch_size,
+            0,
+            extra={'pipeline': 'movies', 'loaded_count': batch_size},
+        )
+        logger.warning(
+            '%s obsolete documents were deleted from %s, e.g. %s',
+            len(deleted_ids),
+            'movies',
+            deleted_ids[:5],
+            extra={'index': 'movies', 'deleted_count': len(deleted_ids)},
+        )
+
+
+def run_benchmark(setup_name: str, documents: int, batch_size: int, deleted: int) -> dict:
+    """
+    Log a catch-up with one logging setup.
+
+    Args:
+        setup_name (str): The name of the logging setup.
+        documents (int): The number of documents of the catch-up.
+        batch_size (int): The number of documents per cycle.
+        deleted (int): The number of deleted documents per cycle.
+
+    Returns:
+        dict: The logging thread and total time per 100k documents and the log size.
+    """
+    deleted_ids = [str(uuid.uuid4()) for _ in range(deleted)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_filepath = os.path.join(directory, 'etl.log')
+        handler, listener = create_log_handler(
+            log_filepath=log_filepath,
+            message_format=MESSAGE_FORMAT,
+            **LOGGING_SETUPS[setup_name],
+        )
+
+        logger = logging.getLogger(f'benchmark.{setup_name}')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+
+        started_at = perf_counter()
+        for _ in range(0, documents, batch_size):
+            log_cycle(logger, batch_size, deleted_ids, is_legacy=setup_name == 'legacy')
+        logging_thread_time = perf_counter() - started_at
+
+        if listener:
+            listener.stop()
+        handler.close()
+        for listener_handler in listener.handlers if listener else ():
+            listener_handler.close()
+        total_time = perf_counter() - started_at
+
+        logger.removeHandler(handler)
+        log_bytes = os.path.getsize(log_filepath)
+
+    per_100k = 100000 / documents
+    return {
+        'logging_thread_ms': round(logging_thread_time * per_100k * 1000, 1),
+        'total_ms': round(total_time * per_100k * 1000, 1),
+        'log_kib': round(log_bytes * per_100k / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--documents', type=int, default=100000, help='number of documents')
+    parser.add_argument('--batch-size', type=int, default=100, help='documents per cycle')
+    parser.add_argument('--deleted', type=int, default=50, help='deleted documents per cycle')
+    parser.add_argument(
+        '--setups',
+        nargs='*',
+        default=list(LOGGING_SETUPS),
+        help='logging setups to run',
+    )
+    arguments = parser.parse_args()
+
+    print(f"{'setup':<20}{'thread ms/100k':>16}{'total ms/100k':>15}{'log KiB/100k':>14}")
+    for setup_name in arguments.setups:
+        result = run_benchmark(
+            setup_name,
+            documents=arguments.documents,
+            batch_size=arguments.batch_size,
+            deleted=arguments.deleted,
+        )
+        print(
+            f"{setup_name:<20}{result['logging_thread_ms']:>16}"
+            f"{result['total_ms']:>15}{result['log_kib']:>14}",
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+"""
+Benchmark of the shard-routed bulk requests of the loader.
+
+Loads the same generated movies into indices with a growing number of shards,
+once in extraction order and once per bulk routing mode, and reports the bulk
+request p50/p99 latency. By default a stand-in cluster is used, run in a
+process of its own: its nodes own the shards round-robin, answer the routing
+requests of the loader and delay every bulk request by the slowest shard it
+touches. Every shard has a service time per document and rare stalls, e.g. of
+a merge or a GC pause, so requests that fan out to many shards hit the stalls
+of all of them. With `--hosts` the indices are created on a real cluster instead.
+
+Usage:
+    python -m benchmarks.shard_routed_bulk --documents 20000 --shards 1 5 20 50
+    python -m benchmarks.shard_routed_bulk --hosts localhost:9200
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter, sleep
+from typing import List
+
+from benchmarks.elasticsearch_transport import generate_movies
+from data.dataclasses import Movie
+from loader import ElasticsearchLoader
+from loader.elasticsearch.shard_routing import calculate_routing_shards, shard_for_id
+from loader.elasticsearch.transport import NODE_LATENCY_TRACKER, parse_hosts
+
+BULK_ROUTINGS = (
+    ElasticsearchLoader.NO_BULK_ROUTING,
+    ElasticsearchLoader.SHARD_BULK_ROUTING,
+    ElasticsearchLoader.PRIMARY_NODE_BULK_ROUTING,
+)
+
+# The stand-in shard service time: a base time, a time per document and rare stalls.
+SHARD_BASE_SECONDS = 0.002
+SHARD_DOCUMENT_SECONDS = 0.0001
+SHARD_STALL_PROBABILITY = 0.01
+SHARD_STALL_SECONDS = 0.1
+
+# A document of a shard on another node is forwarded by the coordinating node.
+FORWARD_SECONDS = 0.001
+
+
+class StandInCluster:
+    """The nodes of the stand-in cluster, the shard count is part of the index name."""
+
+    node_ports: List[int] = []
+
+    @classmethod
+    def node_of_shard(cls, shard: int) -> int:
+        return shard % len(cls.node_ports)
+
+    @staticmethod
+    def number_of_shards(index_name: str) -> int:
+        return int(index_name.split('_')[-2])
+
+
+class StandInClusterNodeHandler(BaseHTTPRequestHandler):
+    """Answer the index, routing and bulk requests of the loader like an Elasticsearch node."""
+
+    def do_HEAD(self):
+        self._send_json({})
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path.startswith('/_cluster/state'):
+            self._send_json(self._cluster_state(index_name=path.rstrip('/').split('/')[-1]))
+        elif path.startswith('/_nodes'):
+            self._send_json(self._node_infos())
+        else:
+            self._send_json({'version': {'number': '8.6.2'}, 'tagline': 'You Know, for Search'})
+
+    def do_PUT(self):
+        if self.path.split('?')[0].endswith('/_bulk'):
+            self._answer_bulk()
+        else:
+            self._read_body()
+            self._send_json({'acknowledged': True})
+
+    def do_POST(self):
+        self._answer_bulk()
+
+    def log_message(self, *args):
+        """Keep the benchmark output clean."""
+
+    def _cluster_state(self, index_name: str) -> dict:
+        number_of_shards = StandInCluster.number_of_shards(index_name)
+        return {
+            'metadata': {'indices': {index_name: {
+                'settings': {'index': {'number_of_shards': str(number_of_shards)}},
+                'routing_num_shards': calculate_routing_shards(number_of_shards),
+            }}},
+            'routing_table': {'indices': {index_name: {'shards': {
+                str(shard): [{
+                    'primary': True,
+                    'state': 'STARTED',
+                    'node': f'node-{StandInCluster.node_of_shard(shard)}',
+                }]
+                for shard in range(number_of_shards)
+            }}}},
+        }
+
+    def _node_infos(self) -> dict:
+        return {'nodes': {
+            f'node-{node}': {'http': {'publish_address': f'localhost/127.0.0.1:{port}'}}
+            for node, port in enumerate(StandInCluster.node_ports)
+        }}
+
+    def _answer_bulk(self):
+        lines = [json.loads(line) for line in self._read_body().splitlines() if line]
+        node = StandInCluster.node_ports.index(self.server.server_port)
+
+        items = []
+        shard_documents = {}
+        for line in lines:
+            op_type, metadata = next(iter(line.items()))
+            if op_type not in {'index', 'create', 'update', 'delete'}:
+                continue
+            items.append({op_type: {'_id': metadata.get('_id'), 'status': 200}})
+            number_of_shards = StandInCluster.number_of_shards(metadata['_index'])
+            shard = shard_for_id(
+                metadata['_id'],
+                number_of_shards,
+                calculate_routing_shards(number_of_shards),
+            )
+            shard_documents[shard] = shard_documents.get(shard, 0) + 1
+
+        shard_seconds = []
+        for shard, documents in shard_documents.items():
+            seconds = SHARD_BASE_SECONDS + documents * SHARD_DOCUMENT_SECONDS
+            if random.random() < SHARD_STALL_PROBABILITY:
+                seconds += SHARD_STALL_SECONDS
+            if StandInCluster.node_of_shard(shard) != node:
+                seconds += FORWARD_SECONDS
+            shard_seconds.append(seconds)
+        sleep(max(shard_seconds, default=0))
+
+        self._send_json({'took': 1, 'errors': False, 'items': items})
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _send_json(self, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('X-Elastic-Product', 'Elasticsearch')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+
+def serve_stand_in_cluster(node_count: int, connection) -> None:
+    """
+    Serve the stand-in nodes on free local ports and send the ports to the connection.
+
+    Args:
+        node_count (int): The number of nodes.
+        connection (multiprocessing.connection.Connection): The pipe to the benchmark.
+    """
+    random.seed(0)
+    servers = [
+        ThreadingHTTPServer(('127.0.0.1', 0), StandInClusterNodeHandler)
+        for _ in range(node_count)
+    ]
+    StandInCluster.node_ports = [server.server_port for server in servers]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    connection.send(StandInCluster.node_ports)
+    threading.Event().wait()
+
+
+def start_stand_in_cluster(node_count: int) -> List[dict]:
+    """
+    Start the stand-in cluster in a process of its own.
+
+    The nodes don't compete with the benchmarked loader for the interpreter lock then.
+
+    Args:
+        node_count (int): The number of nodes.
+
+    Returns:
+        List[dict]: The host connection parameters of the nodes.
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    multiprocessing.Process(
+        target=serve_stand_in_cluster,
+        args=(node_count, sender),
+        daemon=True,
+    ).start()
+
+    return [
+        {'scheme': 'http', 'host': '127.0.0.1', 'port': port} for port in receiver.recv()
+    ]
+
+
+def run_benchmark(
+    documents: List[Movie],
+    hosts: List[dict],
+    number_of_shards: int,
+    bulk_routing: str,
+    thread_count: int,
+) -> dict:
+    """
+    Load the documents into an index with the given number of shards.
+
+    Args:
+        documents (List[Movie]): The documents to load.
+        hosts (List[dict]): The hosts of the cluster.
+        number_of_shards (int): The number of primary shards of the index.
+        bulk_routing (str): The bulk routing mode of the loader.
+        thread_count (int): The number of parallel bulk threads.
+
+    Returns:
+        dict: The elapsed time, the number of bulk requests and their latencies.
+    """
+    NODE_LATENCY_TRACKER.reset()
+
+    loader = ElasticsearchLoader(
+        host=hosts,
+        index_name=f'movies_benchmark_{number_of_shards}_shards',
+        index_settings={
+            'settings': {'number_of_shards': number_of_shards, 'number_of_replicas': 0},
+        },
+        indexing_mode=ElasticsearchLoader.EXTERNAL_VERSION_MODE,
+        thread_count=thread_count,
+        transport_settings={'connections_per_node': thread_count},
+        bulk_routing=bulk_routing,
+    )
+
+    started_at = perf_counter()
+    loader.load_data(documents=documents)
+    elapsed = perf_counter() - started_at
+
+    # The requests of the routing lookups are answered in no time, only bulk requests count.
+    node_latencies = NODE_LATENCY_TRACKER.summary().values()
+    return {
+        'elapsed_s': round(elapsed, 2),
+        'requests': sum(node['requests'] for node in node_latencies),
+        'p50_ms': max(node['p50_ms'] for node in node_latencies),
+        'p99_ms': max(node['p99_ms'] for node in node_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--documents', type=int, default=20000, help='number of movies to load')
+    parser.add_argument('--hosts', help='comma separated host:port list of a real cluster')
+    parser.add_argument('--nodes', type=int, default=3, help='number of stand-in nodes')
+    parser.add_argument('--threads', type=int, default=4, help='number of bulk threads')
+    parser.add_argument(
+        '--shards',
+        type=int,
+        nargs='*',
+        default=[1, 5, 20, 50],
+        help='primary shard counts of the indices',
+    )
+    arguments = parser.parse_args()
+
+    hosts = parse_hosts(arguments.hosts) if arguments.hosts else start_stand_in_cluster(
+        arguments.nodes,
+    )
+    documents = generate_movies(arguments.documents)
+
+    print(
+        f"{'shards':>6}  {'bulk routing':<14}{'elapsed s':>11}"
+        f"{'requests':>10}{'p50 ms':>9}{'p99 ms':>9}",
+    )
+    for number_of_shards in arguments.shards:
+        for bulk_routing in BULK_ROUTINGS:
+            result = run_benchmark(
+                documents,
+                hosts,
+                number_of_shards,
+                bulk_routing,
+                arguments.threads,
+            )
+            print(
+                f"{number_of_shards:>6}  {bulk_routing:<14}{result['elapsed_s']:>11}"
+                f"{result['requests']:>10}{result['p50_ms']:>9}{result['p99_ms']:>9}",
+            )
+
+
+if __name__ == '__main__':
+    main()
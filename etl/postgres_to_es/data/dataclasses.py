@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import List
+from typing import List, Optional
 from uuid import UUID
 
 
@@ -15,3 +15,21 @@ class Movie:
     writers_names: List[str] = field(default_factory=list)
     actors: List[dict] = field(default_factory=list)
     writers: List[dict] = field(default_factory=list)
+    version: Optional[int] = None
+
+
+@dataclass
+class Person:
+    id: UUID
+    full_name: str
+    films: List[dict] = field(default_factory=list)
+    version: Optional[int] = None
+
+
+@dataclass
+class Genre:
+    id: UUID
+    name: str
+    description: str = ''
+    films_count: int = 0
+    version: Optional[int] = None
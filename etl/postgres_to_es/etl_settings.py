@@ -0,0 +1,157 @@
+"""Settings of the ETL process shared by the `main`, `backfill` and `verify` entry points."""
+import json
+import os
+from typing import Dict, List, Tuple, Union
+
+from data.dataclasses import Genre, Person
+from loader import ElasticsearchLoader
+from loader.elasticsearch.transport import parse_hosts
+
+RETRY_SETTINGS = {
+    'postgres': {
+        'retry': {'max_attempts': 5, 'base_delay': 0.1, 'max_delay': 5},
+        'circuit_breaker': {'failure_threshold': 5, 'recovery_timeout': 10},
+    },
+    'elasticsearch': {
+        'retry': {'max_attempts': 5, 'base_delay': 0.1, 'max_delay': 5},
+        'circuit_breaker': {'failure_threshold': 5, 'recovery_timeout': 10},
+    },
+}
+
+SPOOL_SETTINGS = {
+    'segment_max_bytes': 16 * 1024 * 1024,
+    'max_spool_bytes': 1024 * 1024 * 1024,
+}
+
+# In priority order, a film changed in several lanes is extracted in the first one.
+LANE_SETTINGS = {
+    'film': {'weight': 8, 'slo': 5},
+    'person': {'weight': 3, 'slo': 60},
+    'genre': {'weight': 1, 'slo': 300},
+    'reconciliation': {'weight': 1, 'slo': 3600},
+}
+
+ENTITIES_UPDATE_SCHEMA = {
+    'updateMovie': {
+        'producer': {
+            'entity_name': 'film_work',
+        },
+        'enricher': None,
+        'lane': 'film',
+    },
+    'updatePerson': {
+        'producer': {
+            'entity_name': 'person',
+        },
+        'enricher': {
+            'entity_name': 'film_work',
+            'relation_table': 'person_film_work',
+            'parent_key': 'film_work_id',
+            'child_key': 'person_id',
+        },
+        'derived_document': 'person',
+        'lane': 'person',
+    },
+    'updateGenre': {
+        'producer': {
+            'entity_name': 'genre',
+        },
+        'enricher': {
+            'entity_name': 'film_work',
+            'relation_table': 'genre_film_work',
+            'parent_key': 'film_work_id',
+            'child_key': 'genre_id',
+        },
+        'derived_document': 'genre',
+        'lane': 'genre',
+    },
+}
+
+
+def get_postgres_dsn() -> dict:
+    """
+    Read the Postgres connection parameters from the environment.
+
+    Returns:
+        dict: the data source name for the postgres connection
+    """
+    return {
+        'dbname': os.getenv('PG_DB_NAME'),
+        'user': os.getenv('PG_USER'),
+        'password': os.getenv('PG_PASSWORD'),
+        'host': os.getenv('PG_HOST'),
+        'port': os.getenv('PG_PORT'),
+        'options': '-c search_path=content',
+    }
+
+
+def get_elasticsearch_host() -> Union[dict, List[dict]]:
+    """
+    Read the Elasticsearch hosts from the environment.
+
+    `ELASTICSEARCH_HOSTS` takes precedence over `ELASTICSEARCH_HOST` and `ELASTICSEARCH_PORT`.
+
+    Returns:
+        Union[dict, List[dict]]: the host connection parameters
+    """
+    if os.getenv('ELASTICSEARCH_HOSTS'):
+        return parse_hosts(os.getenv('ELASTICSEARCH_HOSTS'))
+
+    return {
+        'scheme': 'http',
+        'host': os.getenv('ELASTICSEARCH_HOST'),
+        'port': int(os.getenv('ELASTICSEARCH_PORT')),
+    }
+
+
+def get_loader_settings() -> dict:
+    """
+    Return the settings of the Elasticsearch loader.
+
+    Returns:
+        dict: the indexing mode, bulk threads, bulk routing and transport settings of the loader
+    """
+    sniff_elasticsearch_nodes = os.getenv('ELASTICSEARCH_SNIFF', 'false').lower() == 'true'
+    bulk_routing = os.getenv('ELASTICSEARCH_BULK_ROUTING', ElasticsearchLoader.NO_BULK_ROUTING)
+
+    return {
+        'indexing_mode': ElasticsearchLoader.EXTERNAL_VERSION_MODE,
+        'thread_count': 4,
+        'bulk_routing': bulk_routing,
+        'transport_settings': {
+            'http_compress': True,
+            'connections_per_node': 8,
+            'node_selector_class': 'round_robin',
+            'sniff_on_start': sniff_elasticsearch_nodes,
+            'sniff_on_node_failure': sniff_elasticsearch_nodes,
+        },
+    }
+
+
+def load_elasticsearch_indices() -> Tuple[dict, Dict[type, dict]]:
+    """
+    Load the index settings of the movies index and of the derived indices.
+
+    Returns:
+        Tuple[dict, Dict[type, dict]]: the movies index schema and the derived
+            index schemas by document class
+    """
+    with open('loader/elasticsearch/settings/movies_schema.json') as index_schema:
+        elasticsearch_index_schema = {
+            'index_name': 'movies',
+            'index_settings': json.load(index_schema),
+        }
+
+    derived_elasticsearch_indices = {}
+    for document_class, index_name, source_entity in (
+        (Person, 'persons', 'person'),
+        (Genre, 'genres', 'genre'),
+    ):
+        with open(f'loader/elasticsearch/settings/{index_name}_schema.json') as index_schema:
+            derived_elasticsearch_indices[document_class] = {
+                'index_name': index_name,
+                'index_settings': json.load(index_schema),
+                'source_entity': source_entity,
+            }
+
+    return elasticsearch_index_schema, derived_elasticsearch_indices
@@ -0,0 +1,88 @@
+from time import monotonic
+from typing import Dict, Iterable, List
+
+from util.configuration import LOGGER
+
+
+class ChangeCoalescer:
+    """
+    Debounce buffer collapsing repeated changes of the same document.
+
+    A document ID is released once it was not changed again for `window` seconds,
+    or at the latest `max_delay` seconds after its first buffered change.
+    Changes of the same film coming from different update schemas are collapsed too.
+    """
+
+    def __init__(self, window: float = 0, max_delay: float = 30) -> None:
+        """
+        Initialize a ChangeCoalescer object.
+
+        Args:
+            window (float): The quiet period in seconds before a document is released.
+                Defaults to 0, which releases documents in the same cycle.
+            max_delay (float): The maximum time in seconds a document is held back.
+                Defaults to 30.
+        """
+        LOGGER.debug("Initialize %s", type(self).__name__)
+        self.window = window
+        self.max_delay = max_delay
+
+        self.first_seen: Dict[str, float] = {}
+        self.last_seen: Dict[str, float] = {}
+
+        self.received_count = 0
+        self.released_count = 0
+
+    def __contains__(self, entity_id: str) -> bool:
+        return entity_id in self.last_seen
+
+    def add(self, entity_ids: Iterable[str]) -> None:
+        """
+        Buffer changed document IDs.
+
+        Args:
+            entity_ids (Iterable[str]): The IDs of the changed documents.
+        """
+        now = monotonic()
+        for entity_id in entity_ids:
+            self.received_count += 1
+            self.first_seen.setdefault(entity_id, now)
+            self.last_seen[entity_id] = now
+
+    def release(self) -> List[str]:
+        """
+        Remove and return the document IDs that are due.
+
+        Returns:
+            List[str]: The IDs of the documents to process, oldest first.
+        """
+        now = monotonic()
+        released_ids = [
+            entity_id
+            for entity_id, first_seen in self.first_seen.items()
+            if now - self.last_seen[entity_id] >= self.window or now - first_seen >= self.max_delay
+        ]
+
+        for entity_id in released_ids:
+            del self.first_seen[entity_id]
+            del self.last_seen[entity_id]
+
+        self.released_count += len(released_ids)
+        return released_ids
+
+    def metrics(self) -> dict:
+        """
+        Return the coalescing metrics.
+
+        Returns:
+            dict: received and released changes, buffered documents and the coalesce ratio.
+        """
+        return {
+            'received': self.received_count,
+            'released': self.released_count,
+            'buffered': len(self.last_seen),
+            'coalesce_ratio': round(
+                (self.received_count - len(self.last_seen)) / max(self.released_count, 1),
+                2,
+            ),
+        }
@@ -1,4 +1,4 @@
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 from util.configuration import LOGGER
 
@@ -15,23 +15,37 @@ class Enricher:
             *,
             parent_entity_ids: List[int],
             entity_parameters: Dict,
-    ) -> List[int]:
+            limit: Optional[int] = None,
+            after: Optional[tuple] = None,
+    ) -> Tuple[Optional[tuple], List[int]]:
         """
-        Extract the child entity IDs based on the provided parent entity IDs and entity parameters.
+        Extract a page of the child entity IDs of the provided parent entity IDs.
 
         Args:
             parent_entity_ids: A list of integers representing parent entity IDs.
             entity_parameters: A dictionary containing parameters to filter the child entities.
+            limit: The maximum number of child entity IDs of the page.
+            after: The key of the page returned for the previous page, None for the first page.
 
         Returns:
-            related child entity IDs.
+            The key of the next page, None for the last page, and the related child entity IDs.
         """
-
-        child_entity_ids = self.db_connection.select_related_entity_ids(
-            **entity_parameters,
-            parent_entity_ids=parent_entity_ids,
+        limit = limit or self.db_connection.package_limit
+
+        child_entity_rows = list(
+            self.db_connection.select_related_entity_ids(
+                **entity_parameters,
+                parent_entity_ids=parent_entity_ids,
+                limit=limit,
+                after=after,
+            ),
         )
 
-        child_entity_ids = [row['id'] for row in child_entity_ids]
+        next_page_key = None
+        if len(child_entity_rows) >= limit:
+            last_row = child_entity_rows[-1]
+            next_page_key = (last_row['modified'], last_row['id'])
+
+        child_entity_ids = [row['id'] for row in child_entity_rows]
 
-        return child_entity_ids
+        return (next_page_key, child_entity_ids)
@@ -0,0 +1,289 @@
+from collections import OrderedDict, deque
+from time import monotonic
+from typing import Deque, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from util.configuration import LOGGER
+
+
+class Lane:
+    """A FIFO queue of changed documents with a scheduling weight and a latency objective."""
+
+    def __init__(self, name: str, weight: int = 1, slo: Optional[float] = None):
+        """
+        Initialize a Lane object.
+
+        Args:
+            name (str): The lane name.
+            weight (int): The share of a cycle relative to the other lanes. Defaults to 1.
+            slo (float, optional): The latency objective in seconds from queueing
+                to the confirmed hand-over. Defaults to None (no objective).
+        """
+        self.name = name
+        self.weight = weight
+        self.slo = slo
+
+        self.queue: OrderedDict = OrderedDict()
+        self.deficit = 0
+
+        self.served_count = 0
+        self.slo_violations = 0
+        self.latencies: Deque[float] = deque(maxlen=1000)
+
+    def oldest_wait(self, now: float) -> float:
+        """Return the waiting time of the oldest queued document in seconds."""
+        if not self.queue:
+            return 0
+        return now - next(iter(self.queue.values()))
+
+    def take(self, count: int, queued_before: Optional[float] = None) -> List[Tuple]:
+        """
+        Remove up to `count` documents from the head of the queue.
+
+        Args:
+            count (int): The maximum number of documents.
+            queued_before (float, optional): Only take documents queued before this time.
+
+        Returns:
+            List[Tuple]: The documents and their queueing times.
+        """
+        taken = []
+        while self.queue and len(taken) < count:
+            key, queued_at = next(iter(self.queue.items()))
+            if queued_before is not None and queued_at >= queued_before:
+                break
+            del self.queue[key]
+            taken.append((key, queued_at))
+
+        return taken
+
+
+class LaneScheduler:
+    """
+    Prioritized scheduler of the documents released by the coalescer.
+
+    Documents wait in lanes, e.g. direct film edits, person and genre fan-outs
+    and reconciliation. Each cycle at most `budget` documents are served:
+    lanes whose oldest document exceeds the lane SLO are served first with up to
+    half of the budget, the rest is shared by deficit round robin in proportion to
+    the lane weights. A large fan-out is thereby spread over several cycles
+    instead of delaying the documents of the other lanes. The round robin goes on
+    where the previous cycle ran out of budget, so a budget below the sum of the
+    weights still serves every lane in turn.
+
+    A document queued in several lanes is kept once, in the lane listed first.
+    Served documents stay in flight until they are acknowledged or requeued.
+    """
+
+    def __init__(self, lanes: Optional[Dict[str, dict]] = None, budget: Optional[int] = None):
+        """
+        Initialize a LaneScheduler object.
+
+        Args:
+            lanes (Dict[str, dict], optional): The `weight` and `slo` per lane name,
+                in priority order. Defaults to a single lane.
+            budget (int, optional): The number of documents served per cycle.
+                Defaults to None (all queued documents).
+        """
+        LOGGER.debug("Initialize %s", type(self).__name__)
+        lanes = lanes or {'default': {}}
+
+        self.lanes = {name: Lane(name, **settings) for name, settings in lanes.items()}
+        self.priorities = {name: priority for priority, name in enumerate(self.lanes)}
+        self.default_lane = list(self.lanes)[-1]
+        self.budget = budget
+
+        self.queued_lanes: Dict[Hashable, str] = {}
+        self.in_flight: Dict[Hashable, Tuple[str, float]] = {}
+
+        # The lane the round robin starts with in the next cycle, and whether
+        # it was interrupted with its quantum granted already.
+        self.next_lane = list(self.lanes)[0]
+        self.is_next_lane_granted = False
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.queued_lanes
+
+    def lane_name(self, lane_name: Optional[str]) -> str:
+        """
+        Return the name of the lane used for a lane name.
+
+        Args:
+            lane_name (str, optional): The requested lane.
+
+        Returns:
+            str: The lane name, the lowest priority lane for unknown names.
+        """
+        return lane_name if lane_name in self.lanes else self.default_lane
+
+    def higher_priority(self, lane_name: Optional[str], other_lane_name: Optional[str]) -> str:
+        """
+        Return the lane with the higher priority of two lanes.
+
+        Args:
+            lane_name (str, optional): A lane name, None is ignored.
+            other_lane_name (str, optional): The other lane name, None is ignored.
+
+        Returns:
+            str: The lane name with the higher priority.
+        """
+        lane_names = [
+            self.lane_name(name) for name in (lane_name, other_lane_name) if name is not None
+        ]
+        return min(lane_names, key=self.priorities.get)
+
+    def add(self, keys: Iterable[Hashable], lane_name: Optional[str] = None) -> None:
+        """
+        Queue documents in a lane.
+
+        A document already queued in a lane with a lower priority
+        is moved to this lane and keeps its queueing time.
+
+        Args:
+            keys (Iterable[Hashable]): The document keys.
+            lane_name (str, optional): The lane. Defaults to the lowest priority lane.
+        """
+        lane_name = self.lane_name(lane_name)
+        lane = self.lanes[lane_name]
+        now = monotonic()
+
+        for key in keys:
+            queued_lane_name = self.queued_lanes.get(key)
+            if queued_lane_name is None:
+                lane.queue[key] = now
+            elif self.priorities[lane_name] < self.priorities[queued_lane_name]:
+                lane.queue[key] = self.lanes[queued_lane_name].queue.pop(key)
+            else:
+                continue
+            self.queued_lanes[key] = lane_name
+
+    def schedule(self) -> List[Hashable]:
+        """
+        Serve the documents of the cycle.
+
+        Returns:
+            List[Hashable]: The served document keys.
+        """
+        now = monotonic()
+        remaining = self.budget if self.budget is not None else len(self.queued_lanes)
+        served = []
+
+        overdue_lanes = sorted(
+            (
+                lane for lane in self.lanes.values()
+                if lane.slo is not None and lane.oldest_wait(now) > lane.slo
+            ),
+            key=lambda lane: lane.oldest_wait(now) / lane.slo,
+            reverse=True,
+        )
+        boost_remaining = remaining // 2 if self.budget is not None else remaining
+        for lane in overdue_lanes:
+            taken = lane.take(boost_remaining, queued_before=now - lane.slo)
+            self._serve(lane, taken, served)
+            boost_remaining -= len(taken)
+        remaining -= len(served)
+
+        lane_names = list(self.lanes)
+        start = lane_names.index(self.next_lane)
+        round_robin_lanes = [self.lanes[name] for name in lane_names[start:] + lane_names[:start]]
+        granted_lane = self.next_lane if self.is_next_lane_granted else None
+        self.is_next_lane_granted = False
+
+        while remaining > 0:
+            active_lanes = [lane for lane in round_robin_lanes if lane.queue]
+            if not active_lanes:
+                break
+
+            quantum = max(remaining // sum(lane.weight for lane in active_lanes), 1)
+            for lane in active_lanes:
+                if lane.name == granted_lane:
+                    granted_lane = None
+                else:
+                    lane.deficit += lane.weight * quantum
+                taken = lane.take(min(lane.deficit, remaining))
+                self._serve(lane, taken, served)
+
+                lane.deficit -= len(taken)
+                remaining -= len(taken)
+                if not lane.queue:
+                    lane.deficit = 0
+                if remaining <= 0:
+                    self._interrupt_round(lane)
+                    break
+
+        return served
+
+    def acknowledge(self) -> None:
+        """Record the latencies of the documents in flight, which were handed over safely."""
+        now = monotonic()
+        for lane_name, queued_at in self.in_flight.values():
+            lane = self.lanes[lane_name]
+            latency = now - queued_at
+            lane.latencies.append(latency)
+            lane.served_count += 1
+            if lane.slo is not None and latency > lane.slo:
+                lane.slo_violations += 1
+
+        self.in_flight = {}
+
+    def requeue(self) -> None:
+        """Put the documents in flight back to the head of their lanes."""
+        for key, (lane_name, queued_at) in reversed(list(self.in_flight.items())):
+            if key in self.queued_lanes:
+                continue
+            lane = self.lanes[lane_name]
+            lane.queue[key] = queued_at
+            lane.queue.move_to_end(key, last=False)
+            self.queued_lanes[key] = lane_name
+
+        self.in_flight = {}
+
+    def metrics(self) -> Dict[str, dict]:
+        """
+        Return the scheduling metrics per lane.
+
+        Returns:
+            Dict[str, dict]: queued and served documents, the oldest waiting time,
+                the p99 latency and the SLO violations per lane.
+        """
+        now = monotonic()
+        metrics = {}
+        for lane in self.lanes.values():
+            latencies = sorted(lane.latencies)
+            metrics[lane.name] = {
+                'queued': len(lane.queue),
+                'served': lane.served_count,
+                'oldest_wait_s': round(lane.oldest_wait(now), 1),
+                'p99_latency_s': (
+                    round(latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)], 1)
+                    if latencies else None
+                ),
+                'slo_s': lane.slo,
+                'slo_violations': lane.slo_violations,
+            }
+
+        return metrics
+
+    def _interrupt_round(self, lane: Lane) -> None:
+        """
+        Remember where the round robin goes on in the next cycle.
+
+        A lane with deficit left is resumed without a further quantum,
+        otherwise the next cycle starts with the following lane.
+
+        Args:
+            lane (Lane): The lane served last.
+        """
+        self.is_next_lane_granted = lane.deficit > 0
+        if self.is_next_lane_granted:
+            self.next_lane = lane.name
+            return
+
+        lane_names = list(self.lanes)
+        self.next_lane = lane_names[(lane_names.index(lane.name) + 1) % len(lane_names)]
+
+    def _serve(self, lane: Lane, taken: List[Tuple], served: List[Hashable]) -> None:
+        """Move taken documents in flight."""
+        for key, queued_at in taken:
+            del self.queued_lanes[key]
+            self.in_flight[key] = (lane.name, queued_at)
+            served.append(key)
@@ -26,3 +26,53 @@ class MovieMerger:
         )
 
         return aggregated_movies
+
+
+class PersonMerger:
+    """
+    Class to select the film works and roles of the selected persons.
+    """
+
+    def __init__(self, db_connection) -> None:
+        LOGGER.debug("Initialize %s", type(self).__name__)
+        self.db_connection = db_connection
+
+    def aggregate_person_related_fields(self, *, entity_ids: List[str]) -> Generator:
+        """Aggregate all the person related fields.
+
+        Args:
+            entity_ids (List[str]): A list of person IDs.
+
+        Returns:
+            Generator: A generator object of aggregated persons.
+        """
+        aggregated_persons = self.db_connection.select_person_related_fields(
+            person_ids=entity_ids,
+        )
+
+        return aggregated_persons
+
+
+class GenreMerger:
+    """
+    Class to select the film work counts of the selected genres.
+    """
+
+    def __init__(self, db_connection) -> None:
+        LOGGER.debug("Initialize %s", type(self).__name__)
+        self.db_connection = db_connection
+
+    def aggregate_genre_related_fields(self, *, entity_ids: List[str]) -> Generator:
+        """Aggregate all the genre related fields.
+
+        Args:
+            entity_ids (List[str]): A list of genre IDs.
+
+        Returns:
+            Generator: A generator object of aggregated genres.
+        """
+        aggregated_genres = self.db_connection.select_genre_related_fields(
+            genre_ids=entity_ids,
+        )
+
+        return aggregated_genres
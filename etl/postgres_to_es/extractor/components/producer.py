@@ -1,6 +1,6 @@
 from util.configuration import LOGGER
 from datetime import datetime
-from typing import Any, List
+from typing import Any, List, Optional, Tuple
 
 from state.state_manager import State
 
@@ -20,25 +20,48 @@ class Producer:
         self.db_connection = db_connection
         self.state = state
 
-    def extract_modified_entity_ids(self, *, entity: str, modified_timestamp) -> tuple[datetime, List[int]]:
+    def extract_modified_entity_ids(
+        self,
+        *,
+        entity: str,
+        position: Tuple[Any, Optional[str]],
+        limit: Optional[int] = None,
+        modified_until: Optional[datetime] = None,
+    ) -> Tuple[Optional[Tuple[datetime, str]], List[str]]:
         """
-        Extract the modified records ids for a given entity.
+        Extract the modified records ids for a given entity after a position.
+
+        The records are paged in `(modified, id)` order, so records sharing
+        a modified timestamp across a page boundary aren't skipped.
 
         Args:
             entity (str): The name of the entity to extract.
+            position (Tuple[Any, Optional[str]]): The modified timestamp and id of the last
+                extracted record, the id is None if all records of the timestamp were extracted.
+            limit (int, optional): The maximum number of ids to extract.
+            modified_until (datetime, optional): The inclusive upper bound of the modified
+                timestamp. Defaults to None (no upper bound).
 
         Returns:
-            Tuple[bool, List[int]]: last_modified_timestamp and a list of the modified entity ids.
+            Tuple[Optional[Tuple[datetime, str]], List[str]]: the modified timestamp and id
+                of the last record and the modified entity ids. The position is None
+                if no modified entities were found.
         """
+        modified_timestamp, after_id = position
         last_modified_entity_ids = self.db_connection.select_last_modified_entity_ids(
             entity=entity,
             modified_timestamp=modified_timestamp,
+            after_id=after_id,
+            limit=limit,
+            modified_until=modified_until,
         )
 
         last_modified_entity_ids = list(last_modified_entity_ids)
 
+        last_position = None
         if last_modified_entity_ids:
-            last_modified_timestamp = last_modified_entity_ids[-1].get('modified')
+            last_row = last_modified_entity_ids[-1]
+            last_position = (last_row['modified'], str(last_row['id']))
 
         last_modified_entity_ids = [row['id'] for row in last_modified_entity_ids]
-        return (last_modified_timestamp, last_modified_entity_ids)
+        return (last_position, last_modified_entity_ids)
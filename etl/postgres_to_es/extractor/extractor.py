@@ -2,17 +2,24 @@
 from abc import abstractmethod
 from collections import defaultdict
 from datetime import datetime
-from typing import Any, Generator, List
+from functools import wraps
+from itertools import islice
+from time import perf_counter
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional, Tuple
 
-import pytz
+from psycopg2.errors import QueryCanceled
 from psycopg2.extras import DictRow
 
-from data.dataclasses import Movie
+from data.dataclasses import Genre, Movie, Person
 from state.state_manager import State
+from util.common.batch_size_controller import AIMDBatchSizeController
+from util.common.retry_policy import RetryPolicy
 from util.configuration import LOGGER
 
+from .components.coalescer import ChangeCoalescer
 from .components.enricher import Enricher
-from .components.merger import MovieMerger
+from .components.lane_scheduler import LaneScheduler
+from .components.merger import GenreMerger, MovieMerger, PersonMerger
 from .components.producer import Producer
 
 
@@ -62,6 +69,7 @@ class BaseExtractor:
                 genre=film_work['genres'],
                 title=film_work['title'],
                 description=film_work['description'],
+                version=film_work.get('version'),
             )
 
             persons = film_work.get('persons')
@@ -84,14 +92,77 @@ class BaseExtractor:
 
         return movies
 
+    def _transform_persons_to_dataclass(self, persons: Iterable[DictRow]) -> List[Person]:
+        """
+        Groups data into a list of persons.
+
+        Args:
+            persons (Iterable[DictRow]): the extracted data
+
+        Returns:
+            List[Person]: a list of persons with their film works and roles
+        """
+        return [
+            Person(
+                id=person['id'],
+                full_name=person['full_name'],
+                films=person['films'],
+                version=person.get('version'),
+            )
+            for person in persons
+        ]
+
+    def _transform_genres_to_dataclass(self, genres: Iterable[DictRow]) -> List[Genre]:
+        """
+        Groups data into a list of genres.
+
+        Args:
+            genres (Iterable[DictRow]): the extracted data
+
+        Returns:
+            List[Genre]: a list of genres with their film work counts
+        """
+        return [
+            Genre(
+                id=genre['id'],
+                name=genre['name'],
+                description=genre['description'] or '',
+                films_count=genre['films_count'],
+                version=genre.get('version'),
+            )
+            for genre in genres
+        ]
+
 
 class MultipleQueryExtractor(BaseExtractor):
     """
     Implementation of extractor process using multiple database query strategy.
     """
-    last_state = defaultdict(lambda: datetime(1, 1, 1, tzinfo=pytz.timezone('UTC')))
 
-    def __init__(self, db_connection: Any, persistant_state_storage: dict, entities_update_schema: dict) -> None:
+    MOVIE_DOCUMENT = 'movie'
+    PERSON_DOCUMENT = 'person'
+    GENRE_DOCUMENT = 'genre'
+
+    RECONCILIATION_LANE = 'reconciliation'
+
+    # The derived document types by document class.
+    DERIVED_DOCUMENT_CLASSES = {Person: PERSON_DOCUMENT, Genre: GENRE_DOCUMENT}
+
+    def __init__(
+        self,
+        db_connection: Any,
+        persistant_state_storage: dict,
+        entities_update_schema: dict,
+        retry_policy: Optional[RetryPolicy] = None,
+        coalescer_settings: Optional[dict] = None,
+        batch_size_controllers: Optional[Dict[str, AIMDBatchSizeController]] = None,
+        derived_documents: Iterable[str] = (),
+        modified_until: Optional[datetime] = None,
+        lane_settings: Optional[Dict[str, dict]] = None,
+        lane_cycle_budget: Optional[int] = None,
+        linked_documents_provider: Optional[Callable[[List[str]], Dict[type, List[str]]]] = None,
+        film_work_transform: Optional[Callable[[List[DictRow]], List[Any]]] = None,
+    ) -> None:
         """
         Initializes the MultipleQueryExtractor class.
 
@@ -99,66 +170,487 @@ class MultipleQueryExtractor(BaseExtractor):
             db_connection (Any): the database connection object
             persistant_state_storage (dict): the persistent state storage object
             entities_update_schema (dict): the schema for updating entities
+            retry_policy (RetryPolicy, optional): the retry policy for database queries.
+                Only the failed query is retried, the extraction progress is kept.
+            coalescer_settings (dict, optional): the `window` and `max_delay` of the coalescer
+            batch_size_controllers (Dict[str, AIMDBatchSizeController], optional): the adaptive
+                batch sizes of the `producer`, `enricher` and `merger` queries. The sizes are
+                persisted in the state. Without a controller `package_limit` is used.
+            derived_documents (Iterable[str]): the derived documents to extract besides
+                movies, `person` and/or `genre`. They are fed by the producers with a matching
+                `derived_document` in the update schema and by the persons and genres
+                of the extracted movies.
+            modified_until (datetime, optional): the inclusive upper bound of the modified
+                timestamps the producers extract. Defaults to None (no upper bound).
+            lane_settings (Dict[str, dict], optional): the `weight` and `slo` of the priority
+                lanes in priority order. An update schema picks its lane with the `lane` key.
+                Defaults to a single lane.
+            lane_cycle_budget (int, optional): the number of released documents extracted
+                per cycle, the others wait in their lanes. Defaults to None (all).
+            linked_documents_provider (Callable, optional): returns the IDs of the derived
+                documents, by document class, that are still linked to the given films in
+                the index. They are extracted again with the films, so that persons and genres
+                unlinked from a film don't keep it. Defaults to None (current links only).
+            film_work_transform (Callable, optional): turns the merged film work rows of
+                `extract_data` into documents, e.g. the serialized bulk actions of the loader.
+                Defaults to None (Movie objects).
         """
         producer_state = State(storage=persistant_state_storage)
 
         self.producer = Producer(db_connection, producer_state)
         self.enricher = Enricher(db_connection)
         self.merger = MovieMerger(db_connection)
+        self.person_merger = PersonMerger(db_connection)
+        self.genre_merger = GenreMerger(db_connection)
+        self.coalescer = ChangeCoalescer(**(coalescer_settings or {}))
+        self.scheduler = LaneScheduler(lanes=lane_settings, budget=lane_cycle_budget)
 
         self.entities_update_schema = entities_update_schema
+        self.retry_policy = retry_policy
+        self.derived_documents = set(derived_documents)
+        self.modified_until = modified_until
+        self.linked_documents_provider = linked_documents_provider
+        self.film_work_transform = film_work_transform or self._transform_film_works_to_dataclass
+
+        self.last_state = {}
+        self.pending_state = []
+        self.released_ids = []
+        self.document_lanes = {}
+
+        self.batch_size_controllers = batch_size_controllers or {}
+        for query_name, controller in self.batch_size_controllers.items():
+            persisted_size = producer_state.get_state(key=f'batch_size.{query_name}')
+            if persisted_size:
+                controller.size = persisted_size
 
         super().__init__(db_connection)
 
-    def extract_data(self) -> tuple[bool, List[Movie]]:
+    def extract_data(self) -> List[Any]:
         """
         Extracts data.
 
+        The changed film work IDs of all update schemas are collected in the coalescer.
+        The due films are queued in the lane of their update schema and the films
+        the lane scheduler serves in this cycle are aggregated at once. The producer
+        states are kept pending until all their films are served and confirmed
+        with `commit_state`.
+
+        Persons and genres of the derived documents are extracted in the same pass,
+        the ones linked to the films in Postgres and the ones still linked to them
+        in the index.
+
         Returns:
-            - A list of Movie objects extracted from the database.
+            - A list of Movie objects, or the documents of `film_work_transform`,
+              extracted from the database, followed by the derived Person and Genre objects.
         """
         LOGGER.info('Extract data')
 
-        grouped_films = []
         for _, entity_update_schema in self.entities_update_schema.items():
             producer_schema = entity_update_schema.get('producer')
+            if not producer_schema:
+                continue
+
             entity_name = producer_schema['entity_name']
 
             state_key = f'producer.{entity_name}'
-            state_value = self.producer.state.get_state(key=state_key)
+            state_value = self.last_state.get(state_key)
 
             if not state_value:
-                state_value = datetime(1, 1, 1)
+                state_value = self._producer_position(self.producer.state.get_state(key=state_key))
+
+            new_state_value, entity_ids = self._query(
+                self.producer.extract_modified_entity_ids,
+                query_name='producer',
+                entity=entity_name,
+                sized_argument='limit',
+                position=state_value,
+                modified_until=self.modified_until,
+            )
+
+            if not new_state_value:
+                continue
+
+            LOGGER.debug('Next or new data found, continue extraction process')
+
+            changed_documents = []
+
+            derived_document = entity_update_schema.get('derived_document')
+            if derived_document in self.derived_documents:
+                changed_documents.extend((derived_document, entity_id) for entity_id in entity_ids)
+
+            enricher_schema = entity_update_schema.get('enricher')
+            if entity_ids and enricher_schema:
+                entity_ids = self._extract_child_entity_ids(
+                    parent_entity_ids=entity_ids,
+                    entity_parameters=enricher_schema,
+                )
+
+            changed_documents.extend((self.MOVIE_DOCUMENT, entity_id) for entity_id in entity_ids)
+            self.coalescer.add(changed_documents)
 
-            if producer_schema:
-                new_state_value, entity_ids = self.producer.extract_modified_entity_ids(
-                    entity=entity_name,
-                    modified_timestamp=state_value,
+            lane_name = entity_update_schema.get('lane')
+            for document in changed_documents:
+                self.document_lanes[document] = self.scheduler.higher_priority(
+                    self.document_lanes.get(document),
+                    lane_name,
                 )
 
-            is_new_updated_entity = new_state_value > self.last_state[state_key]
+            self.last_state[state_key] = new_state_value
+            modified_timestamp, last_id = new_state_value
+            self.pending_state.append(
+                (
+                    state_key,
+                    [modified_timestamp.isoformat(), last_id],
+                    frozenset(changed_documents),
+                ),
+            )
+
+        released_documents = defaultdict(list)
+        for document in self.coalescer.release():
+            released_documents[self.document_lanes.pop(document, None)].append(document)
+        for lane_name, documents in released_documents.items():
+            self.scheduler.add(documents, lane_name)
+
+        self.released_ids = self.scheduler.schedule()
+        if not self.released_ids:
+            return []
+
+        released_entity_ids = defaultdict(dict)
+        for document_type, entity_id in self.released_ids:
+            released_entity_ids[document_type][entity_id] = None
+
+        film_work_ids = list(released_entity_ids[self.MOVIE_DOCUMENT])
+        film_work_rows = self._aggregate(self._fetch_film_works, entity_ids=film_work_ids)
+        documents = self.film_work_transform(film_works=film_work_rows)
+
+        if self.derived_documents and self.linked_documents_provider and film_work_ids:
+            linked_document_ids = self.linked_documents_provider(film_work_ids)
+            for document_class, document_ids in linked_document_ids.items():
+                document_type = self.DERIVED_DOCUMENT_CLASSES[document_class]
+                released_entity_ids[document_type].update(dict.fromkeys(document_ids))
 
-            if is_new_updated_entity:
-                LOGGER.debug('Next or new data found, continue extraction process')
+        if self.PERSON_DOCUMENT in self.derived_documents:
+            person_ids = released_entity_ids[self.PERSON_DOCUMENT]
+            for film_work in film_work_rows:
+                person_ids.update((person['person_id'], None) for person in film_work['persons'])
 
-                self.last_state[state_key] = new_state_value
-                new_state_value = new_state_value.strftime('%Y-%m-%d %H:%M:%S')
-                self.producer.state.set_state(state_key, new_state_value)
+            person_rows = self._aggregate(self._fetch_persons, entity_ids=list(person_ids))
+            documents.extend(self._transform_persons_to_dataclass(persons=person_rows))
 
-                if entity_ids:
-                    enricher_schema = entity_update_schema.get('enricher')
+        if self.GENRE_DOCUMENT in self.derived_documents:
+            genre_ids = released_entity_ids[self.GENRE_DOCUMENT]
+            for film_work in film_work_rows:
+                genre_ids.update((genre_id, None) for genre_id in film_work['genre_ids'])
+
+            genre_rows = self._aggregate(self._fetch_genres, entity_ids=list(genre_ids))
+            documents.extend(self._transform_genres_to_dataclass(genres=genre_rows))
+
+        return documents
+
+    def reconcile(self, film_work_ids: Iterable[str]) -> None:
+        """
+        Queue film works in the `reconciliation` lane to extract them again.
+
+        Args:
+            film_work_ids (Iterable[str]): the film work ids
+        """
+        self.scheduler.add(
+            ((self.MOVIE_DOCUMENT, film_work_id) for film_work_id in film_work_ids),
+            self.RECONCILIATION_LANE,
+        )
+
+    def reconcile_derived_documents(self, document_ids: Dict[type, Iterable[str]]) -> None:
+        """
+        Queue derived documents in the `reconciliation` lane to extract them again.
+
+        Args:
+            document_ids (Dict[type, Iterable[str]]): the document ids by document class
+        """
+        self.scheduler.add(
+            (
+                (self.DERIVED_DOCUMENT_CLASSES[document_class], document_id)
+                for document_class, ids in document_ids.items()
+                if self.DERIVED_DOCUMENT_CLASSES[document_class] in self.derived_documents
+                for document_id in ids
+            ),
+            self.RECONCILIATION_LANE,
+        )
+
+    def extract_movies(self, film_work_ids: List[str]) -> List[Movie]:
+        """
+        Extracts the given film works, independent of the producer states.
+
+        Args:
+            film_work_ids (List[str]): the film work ids
+
+        Returns:
+            List[Movie]: the movies of the film works that exist
+        """
+        film_work_rows = self._aggregate(self._fetch_film_works, entity_ids=film_work_ids)
+        return self._transform_film_works_to_dataclass(film_works=film_work_rows)
+
+    def extract_movie_ranges(self, prefixes: List[str]) -> Generator[Movie, None, None]:
+        """
+        Extracts the film works with the given ID prefixes, `package_limit` movies at a time.
+
+        Args:
+            prefixes (List[str]): the film work ID prefixes, `['']` for all film works
+
+        Yields:
+            Movie: the movies of the film works
+        """
+        film_work_rows = self.db_connection.select_film_work_related_fields_by_prefixes(
+            prefixes=prefixes,
+        )
+        while True:
+            movies = self._transform_film_works_to_dataclass(
+                film_works=islice(film_work_rows, self.db_connection.package_limit),
+            )
+            if not movies:
+                return
+            yield from movies
+
+    def commit_state(self) -> None:
+        """
+        Persist the producer states of the extracted data.
+
+        Must be called once the extracted data has been handed over safely,
+        so that a failure in between re-extracts the data instead of losing it.
+        A state is kept pending while films of it are still buffered in the coalescer
+        or queued in a lane.
+        """
+        self.scheduler.acknowledge()
+
+        blocked_state_keys = set()
+        pending_state = []
+
+        for state_key, state_value, entity_ids in self.pending_state:
+            is_buffered = any(
+                entity_id in self.coalescer or entity_id in self.scheduler
+                for entity_id in entity_ids
+            )
 
-                    if enricher_schema:
-                        entity_ids = self.enricher.extract_child_entity_ids(
-                            parent_entity_ids=entity_ids,
-                            entity_parameters=enricher_schema,
-                        )
+            if is_buffered or state_key in blocked_state_keys:
+                blocked_state_keys.add(state_key)
+                pending_state.append((state_key, state_value, entity_ids))
+                continue
 
-                    film_work_rows = self.merger.aggregate_film_work_related_fields(
-                        entity_ids=entity_ids,
-                    )
+            self.producer.state.set_state(state_key, state_value)
 
-                    movies = self._transform_film_works_to_dataclass(film_works=film_work_rows)
-                    grouped_films.extend(movies)
+        self.pending_state = pending_state
+        self.released_ids = []
 
-        return grouped_films
+        for query_name, controller in self.batch_size_controllers.items():
+            state_key = f'batch_size.{query_name}'
+            if self.producer.state.get_state(key=state_key) != controller.size:
+                self.producer.state.set_state(state_key, controller.size)
+
+    def rollback_state(self) -> None:
+        """Put the films of the last extraction back to the head of their lanes."""
+        self.scheduler.requeue()
+        self.released_ids = []
+
+    @staticmethod
+    def _producer_position(state_value: Any) -> Tuple[Any, Optional[str]]:
+        """
+        Return the producer position of a persisted producer state.
+
+        Args:
+            state_value (Any): the modified timestamp and id of the last extracted record,
+                a timestamp alone in the states of earlier versions, or None
+
+        Returns:
+            Tuple[Any, Optional[str]]: the modified timestamp and id, the id is None
+                if all records of the timestamp were extracted
+        """
+        if not state_value:
+            return (datetime(1, 1, 1), None)
+        if isinstance(state_value, str):
+            return (state_value, None)
+        return tuple(state_value)
+
+    def _extract_child_entity_ids(
+        self,
+        *,
+        parent_entity_ids: List[str],
+        entity_parameters: dict,
+    ) -> List[str]:
+        """
+        Extract all child entity ids of the parents, page by page in the enricher batch size.
+
+        Args:
+            parent_entity_ids (List[str]): the parent entity ids
+            entity_parameters (dict): the enricher schema
+
+        Returns:
+            List[str]: the child entity ids
+        """
+        child_entity_ids = []
+
+        page_key = None
+        while True:
+            page_key, page_entity_ids = self._query(
+                self.enricher.extract_child_entity_ids,
+                query_name='enricher',
+                sized_argument='limit',
+                parent_entity_ids=parent_entity_ids,
+                entity_parameters=entity_parameters,
+                after=page_key,
+            )
+            child_entity_ids.extend(page_entity_ids)
+
+            if page_key is None:
+                return child_entity_ids
+
+    def _aggregate(self, fetch_function: Callable, *, entity_ids: List[str]) -> List[DictRow]:
+        """
+        Fetch aggregated documents in chunks of the merger batch size.
+
+        Args:
+            fetch_function (Callable): the merger query function
+            entity_ids (List[str]): the document ids
+
+        Returns:
+            List[DictRow]: the aggregated rows
+        """
+        film_work_rows = []
+
+        position = 0
+        while position < len(entity_ids):
+            chunk_rows, position = self._query(
+                self._fetch_chunk,
+                query_name='merger',
+                sized_argument='chunk_size',
+                fetch_function=fetch_function,
+                entity_ids=entity_ids,
+                position=position,
+            )
+            film_work_rows.extend(chunk_rows)
+
+        return film_work_rows
+
+    @staticmethod
+    def _fetch_chunk(
+        *,
+        fetch_function: Callable,
+        entity_ids: List[str],
+        position: int,
+        chunk_size: Optional[int] = None,
+    ) -> Tuple[List[DictRow], int]:
+        """
+        Fetch the aggregated documents of the chunk at a position.
+
+        Args:
+            fetch_function (Callable): the merger query function
+            entity_ids (List[str]): the document ids
+            position (int): the position of the chunk
+            chunk_size (int, optional): the size of the chunk. Defaults to None (all).
+
+        Returns:
+            Tuple[List[DictRow], int]: the aggregated rows and the position of the next chunk
+        """
+        end_position = position + chunk_size if chunk_size else len(entity_ids)
+        return fetch_function(entity_ids=entity_ids[position:end_position]), end_position
+
+    def _fetch_film_works(self, *, entity_ids: List[str]) -> List[DictRow]:
+        """
+        Fetch the aggregated film works at once, so that a failed query can be retried as a whole.
+
+        Args:
+            entity_ids (List[str]): the film work ids
+
+        Returns:
+            List[DictRow]: the aggregated film works
+        """
+        return list(self.merger.aggregate_film_work_related_fields(entity_ids=entity_ids))
+
+    def _fetch_persons(self, *, entity_ids: List[str]) -> List[DictRow]:
+        """
+        Fetch the aggregated persons at once, so that a failed query can be retried as a whole.
+
+        Args:
+            entity_ids (List[str]): the person ids
+
+        Returns:
+            List[DictRow]: the aggregated persons
+        """
+        return list(self.person_merger.aggregate_person_related_fields(entity_ids=entity_ids))
+
+    def _fetch_genres(self, *, entity_ids: List[str]) -> List[DictRow]:
+        """
+        Fetch the aggregated genres at once, so that a failed query can be retried as a whole.
+
+        Args:
+            entity_ids (List[str]): the genre ids
+
+        Returns:
+            List[DictRow]: the aggregated genres
+        """
+        return list(self.genre_merger.aggregate_genre_related_fields(entity_ids=entity_ids))
+
+    def _query(
+        self,
+        function: Callable,
+        *,
+        query_name: Optional[str] = None,
+        sized_argument: Optional[str] = None,
+        **kwargs,
+    ) -> Any:
+        """
+        Run a database query through the retry policy, if one is configured.
+
+        The latency of the query is reported to the batch size controller of the query type.
+
+        Args:
+            function (Callable): the query function
+            query_name (str, optional): the query type
+            sized_argument (str, optional): the argument of the query function which takes
+                the batch size. It is set to the current size of the controller on every
+                attempt, so a retry after a cancelled query runs with the decreased size.
+                Without a controller the argument is left to the query function's default.
+            **kwargs: the query arguments
+
+        Returns:
+            Any: the query result
+        """
+        controller = self.batch_size_controllers.get(query_name)
+        if controller:
+            function = self._measure_latency(function, controller, sized_argument)
+
+        if self.retry_policy:
+            return self.retry_policy.call(function, **kwargs)
+        return function(**kwargs)
+
+    @staticmethod
+    def _measure_latency(
+        function: Callable,
+        controller: AIMDBatchSizeController,
+        sized_argument: Optional[str] = None,
+    ) -> Callable:
+        """
+        Wrap a query function to report its latency to a batch size controller.
+
+        Args:
+            function (Callable): the query function
+            controller (AIMDBatchSizeController): the batch size controller
+            sized_argument (str, optional): the argument set to the current batch size
+
+        Returns:
+            Callable: the wrapped function
+        """
+        @wraps(function)
+        def measured_function(**kwargs):
+            if sized_argument:
+                kwargs[sized_argument] = controller.size
+
+            started_at = perf_counter()
+            try:
+                result = function(**kwargs)
+            except QueryCanceled:
+                controller.decrease()
+                raise
+
+            controller.observe(perf_counter() - started_at)
+            return result
+
+        return measured_function
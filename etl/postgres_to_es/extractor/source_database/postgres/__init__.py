@@ -1 +1,2 @@
 from .pg_db_handler import PostgresConnection
+from .preflight import PostgresPreflight
@@ -1,34 +1,184 @@
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Generator, List
+from time import monotonic, perf_counter
+from typing import Generator, List, Optional
 
 import psycopg2
-from psycopg2.extras import DictCursor
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+from psycopg2.extras import DictCursor, DictRow
 
+from profiling.slow_operations import SLOW_OPERATION_LOG
 from util.configuration import LOGGER
 
 
 class PostgresConnection:
     """PostgreSQL database handler."""
 
-    def __init__(self, dsn: dict, package_limit: int = 1000):
+    def __init__(
+        self,
+        dsn: dict,
+        package_limit: int = 1000,
+        statement_timeout: Optional[float] = None,
+        slow_query_threshold: Optional[float] = None,
+        plan_capture_interval: float = 60,
+    ):
         """Postgres database handler.
 
         Args:
             dsn (dict): data source name for postgres connection
             package_limit (int, optional): limit of the rows to fetch at once. Defaults to 1000.
+            statement_timeout (float, optional): the `statement_timeout` of the session in seconds.
+                Queries running longer are cancelled by postgres. Defaults to None (no timeout).
+            slow_query_threshold (float, optional): the duration in seconds after which
+                the plan of a query is captured with `EXPLAIN (ANALYZE, BUFFERS)`.
+                Defaults to None (disabled).
+            plan_capture_interval (float, optional): the minimum time in seconds between
+                two captured plans, as capturing runs the slow query again. Defaults to 60.
         """
         LOGGER.debug('initialize PostgresConnection')
 
+        self.dsn = dsn
         self.connection = psycopg2.connect(**dsn, cursor_factory=DictCursor)
 
         self.cursor = self.connection.cursor()
         self.package_limit = package_limit
         self.offset = 0
 
+        self.slow_query_threshold = slow_query_threshold
+        self.plan_capture_interval = plan_capture_interval
+        self.last_plan_captured_at = None
+
+        self.statement_timeout = None
+        self.set_statement_timeout(statement_timeout)
+
     def close(self):
         """Close postgres connection."""
         self.connection.close()
 
+    def reset(self, error: Exception = None):
+        """Make the connection usable again after a failed query.
+
+        Rolls back the aborted transaction and keeps the connection open.
+        A new connection is only opened if the current one is broken.
+
+        Args:
+            error (Exception, optional): the error that caused the reset
+        """
+        if not self.connection.closed:
+            try:
+                self.connection.rollback()
+                self.cursor = self.connection.cursor()
+                self.set_statement_timeout(self.statement_timeout)
+                return
+            except psycopg2.Error as rollback_error:
+                LOGGER.warning('Rollback failed, reconnect: %s', rollback_error)
+
+        LOGGER.warning('Reconnect to postgres after error: %s', error)
+        self.connection = psycopg2.connect(**self.dsn, cursor_factory=DictCursor)
+        self.cursor = self.connection.cursor()
+        self.set_statement_timeout(self.statement_timeout)
+
+    def set_statement_timeout(self, statement_timeout: Optional[float]):
+        """Set the `statement_timeout` of the session.
+
+        Args:
+            statement_timeout (float, optional): the timeout in seconds, None disables it
+        """
+        self.statement_timeout = statement_timeout
+        timeout_ms = int(statement_timeout * 1000) if statement_timeout else 0
+
+        self.cursor.execute('SET statement_timeout = %s', (timeout_ms, ))
+
+    @contextmanager
+    def statement_timeout_override(self, statement_timeout: Optional[float]):
+        """Run the queries of the block with another `statement_timeout`.
+
+        The session timeout is set again afterwards. After a failed query
+        it is set again by `reset`, as the aborted transaction rejects it.
+
+        Args:
+            statement_timeout (float, optional): the timeout in seconds, None disables it
+        """
+        session_timeout = self.statement_timeout
+        self.set_statement_timeout(statement_timeout)
+        try:
+            yield
+        finally:
+            if self.connection.get_transaction_status() in {
+                TRANSACTION_STATUS_IDLE,
+                TRANSACTION_STATUS_INTRANS,
+            }:
+                self.set_statement_timeout(session_timeout)
+            else:
+                self.statement_timeout = session_timeout
+
+    def _execute(self, cursor, sql_query: str, parameters: Optional[tuple] = None):
+        """Execute a query and capture its plan if it was slow.
+
+        Args:
+            cursor: the cursor to execute the query with
+            sql_query (str): the query
+            parameters (tuple, optional): the values bound to the `%s` placeholders
+        """
+        started_at = perf_counter()
+        cursor.execute(sql_query, parameters)
+        duration = perf_counter() - started_at
+
+        if self.slow_query_threshold and duration > self.slow_query_threshold:
+            if parameters is not None:
+                sql_query = cursor.mogrify(sql_query, parameters).decode()
+            SLOW_OPERATION_LOG.record(
+                'query',
+                duration,
+                query=' '.join(sql_query.split()),
+                plan=self._capture_query_plan(sql_query),
+            )
+
+    def _capture_query_plan(self, sql_query: str) -> Optional[str]:
+        """Return the `EXPLAIN (ANALYZE, BUFFERS)` output of a query.
+
+        The plan is captured in a savepoint with a separate cursor, so neither
+        a failed capture nor the new result set affects the running transaction.
+
+        Args:
+            sql_query (str): the query
+
+        Returns:
+            str, optional: the plan, None if it was captured too recently or the capture failed
+        """
+        now = monotonic()
+        last_captured_at = self.last_plan_captured_at
+        if last_captured_at and now - last_captured_at < self.plan_capture_interval:
+            return None
+        self.last_plan_captured_at = now
+
+        with self.connection.cursor() as plan_cursor:
+            try:
+                plan_cursor.execute('SAVEPOINT capture_query_plan')
+                plan_cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {sql_query}')
+                plan = '\n'.join(row[0] for row in plan_cursor.fetchall())
+                plan_cursor.execute('RELEASE SAVEPOINT capture_query_plan')
+            except psycopg2.Error as error:
+                LOGGER.warning('Could not capture the query plan: %s', error)
+                plan_cursor.execute('ROLLBACK TO SAVEPOINT capture_query_plan')
+                return None
+
+        return plan
+
+    def select_current_timestamp(self) -> datetime:
+        """Select the current timestamp.
+
+        Returns:
+            datetime: the timestamp in the session time zone
+        """
+        try:
+            self._execute(self.cursor, 'SELECT now()')
+        except psycopg2.Error as error:
+            LOGGER.error('%s: %s', error.__class__.__name__, error)
+            raise error
+
+        return self.cursor.fetchone()[0]
+
     def select_all_entity_ids(self, entity: str) -> Generator:
         """Select all entity IDs.
 
@@ -41,7 +191,7 @@ class PostgresConnection:
         cursor = self.cursor
 
         try:
-            cursor.execute(f"SELECT id FROM {entity}")
+            self._execute(cursor, f"SELECT id FROM {entity}")
         except psycopg2.Error as error:
             LOGGER.error('%s: %s', error.__class__.__name__, error)
             raise error
@@ -52,35 +202,72 @@ class PostgresConnection:
                 return
             yield from rows
 
-    def select_last_modified_entity_ids(self, *, entity: str, modified_timestamp: datetime) -> Generator:
-        """Select last modified entity IDs.
+    def select_existing_entity_ids(self, *, entity: str, entity_ids: List[str]) -> List[DictRow]:
+        """Select the given entity IDs that exist.
 
         Args:
             entity (str): entity name
-            modified_timestamp (datetime): modified timestamp
+            entity_ids (List[str]): the entity IDs to look up, UUIDs
+
+        Returns:
+            List[DictRow]: A row with the `id` of every existing entity.
+        """
+        try:
+            self._execute(
+                self.cursor,
+                f"SELECT id FROM {entity} WHERE id = ANY(%s::uuid[])",
+                (entity_ids, ),
+            )
+        except psycopg2.Error as error:
+            LOGGER.error('%s: %s', error.__class__.__name__, error)
+            raise error
+
+        return self.cursor.fetchall()
+
+    def select_last_modified_entity_ids(
+        self,
+        *,
+        entity: str,
+        modified_timestamp: datetime,
+        after_id: Optional[str] = None,
+        limit: Optional[int] = None,
+        modified_until: Optional[datetime] = None,
+    ) -> Generator:
+        """Select a page of last modified entity IDs in `(modified, id)` order.
+
+        Args:
+            entity (str): entity name
+            modified_timestamp (datetime): the modified timestamp of the last row
+                of the previous page
+            after_id (str, optional): the id of the last row of the previous page.
+                Defaults to None (all rows modified at the timestamp were selected).
+            limit (int, optional): the maximum number of rows. Defaults to `package_limit`.
+            modified_until (datetime, optional): the inclusive upper bound of the modified
+                timestamp. Defaults to None (no upper bound).
 
         Yields:
             dict: A dictionary with `id` and `modified` keys.
         """
 
+        limit = limit or self.package_limit
         cursor = self.cursor
 
-        sql_query = f"""
-        SELECT id, modified
-        FROM {entity}
-        WHERE modified > '{modified_timestamp}'
-        ORDER BY modified
-        LIMIT {self.package_limit}
-        """
+        sql_query = self.last_modified_entity_ids_query(
+            entity=entity,
+            modified_timestamp=modified_timestamp,
+            after_id=after_id,
+            limit=limit,
+            modified_until=modified_until,
+        )
         try:
-            cursor.execute(sql_query)
+            self._execute(cursor, sql_query)
         except psycopg2.Error as error:
             LOGGER.error('%s: %s', error.__class__.__name__, error)
             raise error
 
         rows = cursor.fetchall()
 
-        if self.package_limit > len(rows):
+        if limit > len(rows):
             yield from rows
             return
 
@@ -94,8 +281,10 @@ class PostgresConnection:
         parent_key: str,
         child_key: str,
         parent_entity_ids: List[str],
+        limit: Optional[int] = None,
+        after: Optional[tuple] = None,
     ):
-        """Select related entity IDs.
+        """Select a page of related entity IDs in `(modified, id)` order.
 
         Args:
             entity_name (str): entity name
@@ -103,23 +292,27 @@ class PostgresConnection:
             parent_key (str): parent key name
             child_key (str): child key name
             parent_entity_ids (List[str]): parent entity IDs
+            limit (int, optional): the maximum number of rows. Defaults to `package_limit`.
+            after (tuple, optional): the `(modified, id)` of the last row of the previous page.
+                Defaults to None (first page).
 
         Yields:
             dict: A dictionary with `id` and `modified` keys.
         """
-        parent_entity_ids = ','.join(f"'{field}'" for field in parent_entity_ids)
+        limit = limit or self.package_limit
 
         cursor = self.cursor
-        sql_query = f"""
-        SELECT sel_table.id, sel_table.modified
-            FROM {entity_name} sel_table
-            LEFT JOIN {relation_table} rel_table ON rel_table.{parent_key} = sel_table.id
-            WHERE rel_table.{child_key} IN ({parent_entity_ids})
-            ORDER BY sel_table.modified
-            LIMIT {self.package_limit};
-        """
+        sql_query = self.related_entity_ids_query(
+            entity_name=entity_name,
+            relation_table=relation_table,
+            parent_key=parent_key,
+            child_key=child_key,
+            parent_entity_ids=parent_entity_ids,
+            limit=limit,
+            after=after,
+        )
         try:
-            cursor.execute(sql_query)
+            self._execute(cursor, sql_query)
         except psycopg2.Error as error:
             LOGGER.error('%s: %s', error.__class__.__name__, error)
             raise error
@@ -127,9 +320,166 @@ class PostgresConnection:
         rows = cursor.fetchall()
 
         yield from rows
-        if self.package_limit > len(rows):
+        if limit > len(rows):
             return
 
+    @staticmethod
+    def last_modified_entity_ids_query(
+        *,
+        entity: str,
+        modified_timestamp: datetime,
+        limit: int,
+        after_id: Optional[str] = None,
+        modified_until: Optional[datetime] = None,
+    ) -> str:
+        """Return the query of `select_last_modified_entity_ids`.
+
+        Args:
+            entity (str): entity name
+            modified_timestamp (datetime): the modified timestamp of the last row
+                of the previous page
+            limit (int): the maximum number of rows
+            after_id (str, optional): the id of the last row of the previous page.
+                Defaults to None (all rows modified at the timestamp were selected).
+            modified_until (datetime, optional): the inclusive upper bound of the modified
+                timestamp. Defaults to None (no upper bound).
+
+        Returns:
+            str: the query
+        """
+        page_filter = f"modified > '{modified_timestamp}'"
+        if after_id:
+            page_filter = f"(modified, id) > ('{modified_timestamp}', '{after_id}')"
+
+        upper_bound = f"AND modified <= '{modified_until}'" if modified_until else ''
+
+        return f"""
+        SELECT id, modified
+        FROM {entity}
+        WHERE {page_filter} {upper_bound}
+        ORDER BY modified, id
+        LIMIT {limit}
+        """
+
+    @staticmethod
+    def related_entity_ids_query(
+        *,
+        entity_name: str,
+        relation_table: str,
+        parent_key: str,
+        child_key: str,
+        parent_entity_ids: List[str],
+        limit: int,
+        after: Optional[tuple] = None,
+    ) -> str:
+        """Return the query of `select_related_entity_ids`.
+
+        Args:
+            entity_name (str): entity name
+            relation_table (str): relation table name
+            parent_key (str): parent key name
+            child_key (str): child key name
+            parent_entity_ids (List[str]): parent entity IDs
+            limit (int): the maximum number of rows
+            after (tuple, optional): the `(modified, id)` of the last row of the previous page.
+                Defaults to None (first page).
+
+        Returns:
+            str: the query
+        """
+        parent_entity_ids = ','.join(f"'{field}'" for field in parent_entity_ids)
+
+        page_filter = ''
+        if after:
+            page_filter = f"AND (sel_table.modified, sel_table.id) > ('{after[0]}', '{after[1]}')"
+
+        return f"""
+        SELECT DISTINCT sel_table.id, sel_table.modified
+            FROM {entity_name} sel_table
+            LEFT JOIN {relation_table} rel_table ON rel_table.{parent_key} = sel_table.id
+            WHERE rel_table.{child_key} IN ({parent_entity_ids}) {page_filter}
+            ORDER BY sel_table.modified, sel_table.id
+            LIMIT {limit};
+        """
+
+    def select_table_indexes(self, table_name: str) -> List[dict]:
+        """Return the indexes of a table.
+
+        Reads the `pg_index` catalog, which `pg_indexes` is a view over,
+        to get the key columns in order instead of parsing the index definition.
+
+        Args:
+            table_name (str): name of the table, resolved with the `search_path`
+
+        Returns:
+            List[dict]: A dictionary with `name`, `columns` and `is_valid` keys per index.
+        """
+        sql_query = """
+        SELECT
+            i.relname AS name,
+            array_agg(a.attname::text ORDER BY k.ordinality) AS columns,
+            ix.indisvalid AS is_valid
+        FROM pg_index ix
+        JOIN pg_class i ON i.oid = ix.indexrelid
+        CROSS JOIN LATERAL unnest(ix.indkey) WITH ORDINALITY AS k(attnum, ordinality)
+        JOIN pg_attribute a ON a.attrelid = ix.indrelid AND a.attnum = k.attnum
+        WHERE ix.indrelid = %s::regclass
+        GROUP BY i.relname, ix.indisvalid;
+        """
+        self.cursor.execute(sql_query, (table_name, ))
+
+        return [
+            {'name': row['name'], 'columns': list(row['columns']), 'is_valid': row['is_valid']}
+            for row in self.cursor.fetchall()
+        ]
+
+    def create_index_concurrently(self, *, table_name: str, columns: List[str], index_name: str):
+        """Create an index without blocking writes to the table.
+
+        `CREATE INDEX CONCURRENTLY` can't run in a transaction block,
+        so it runs on a separate connection in autocommit mode.
+        It waits for all older transactions, so the open transaction
+        of this connection is committed first.
+        An invalid index left by a failed build with the same name is dropped first.
+
+        Args:
+            table_name (str): name of the table
+            columns (List[str]): the key columns
+            index_name (str): name of the index
+        """
+        self.connection.commit()
+
+        connection = psycopg2.connect(**self.dsn)
+        connection.autocommit = True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)',
+                    (index_name, ),
+                )
+                invalid_index = cursor.fetchone()
+                if invalid_index and invalid_index[0]:
+                    cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index_name}')
+
+                cursor.execute(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} '
+                    f'ON {table_name} ({", ".join(columns)})',
+                )
+        finally:
+            connection.close()
+
+    def explain_query(self, sql_query: str) -> dict:
+        """Return the estimated plan of a query without running it.
+
+        Args:
+            sql_query (str): the query
+
+        Returns:
+            dict: the root `Plan` node of `EXPLAIN (FORMAT JSON)`
+        """
+        self.cursor.execute(f'EXPLAIN (FORMAT JSON) {sql_query}')
+        return self.cursor.fetchone()[0][0]['Plan']
+
     def select_film_work_related_fields(
         self,
         film_work_ids: List[str],
@@ -139,13 +489,60 @@ class PostgresConnection:
         Args:
             film_work_ids (list[str]): a list of film work ids to fetch data for
 
+        The `version` field of the external versioning is the start time of the query,
+        or the greatest `modified` of the film work, its persons and genres in microseconds
+        since epoch if it lies in the future. The greatest `modified` alone decreases
+        when the newest person or genre is unlinked.
+
         Yields:
             Dict[str, Any]: a dictionary containing film work related fields for a single film work id
         """
         film_work_ids = ','.join(f"'{field}'" for field in film_work_ids)
 
         cursor = self.cursor
-        sql_query = f"""
+        sql_query = self._film_work_related_fields_query(f'fw.id IN ({film_work_ids})')
+        try:
+            self._execute(cursor, sql_query)
+        except psycopg2.Error as error:
+            LOGGER.error('%s: %s', error.__class__.__name__, error)
+            raise error
+
+        while True:
+            rows = cursor.fetchmany(size=self.package_limit)
+            yield from rows
+            if not rows:
+                return
+
+    def select_film_work_related_fields_by_prefixes(self, *, prefixes: List[str]) -> Generator:
+        """Return the film work related fields of the film works with the given ID prefixes.
+
+        The rows are fetched `package_limit` at a time with a server-side cursor,
+        so the film works of a range aren't held in memory at once.
+
+        Args:
+            prefixes (List[str]): the ID prefixes, `['']` for all film works
+
+        Yields:
+            Dict[str, Any]: the film work related fields of a single film work
+        """
+        prefix_filter = ' OR '.join(f"fw.id::text LIKE '{prefix}%'" for prefix in prefixes)
+
+        with self.connection.cursor(name='film_work_ranges') as cursor:
+            cursor.itersize = self.package_limit
+            self._execute(cursor, self._film_work_related_fields_query(prefix_filter))
+            yield from cursor
+
+    @staticmethod
+    def _film_work_related_fields_query(film_work_filter: str) -> str:
+        """Return the query of the film work related fields.
+
+        Args:
+            film_work_filter (str): the condition of the film works to select
+
+        Returns:
+            str: the query
+        """
+        return f"""
             SELECT
                 fw.id as fw_id,
                 fw.title,
@@ -161,17 +558,106 @@ class PostgresConnection:
                     ) FILTER (WHERE p.id is not null),
                     '[]'
                 ) as persons,
-                array_agg(DISTINCT g.name) as genres
+                array_agg(DISTINCT g.name) as genres,
+                COALESCE (
+                    array_agg(DISTINCT g.id::text) FILTER (WHERE g.id is not null),
+                    '{{}}'
+                ) as genre_ids,
+                (
+                    extract(epoch FROM GREATEST(
+                        fw.modified, MAX(p.modified), MAX(g.modified), statement_timestamp()
+                    ))
+                    * 1000000
+                )::bigint as version
             FROM content.film_work fw
             LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
             LEFT JOIN content.person p ON p.id = pfw.person_id
             LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id
             LEFT JOIN content.genre g ON g.id = gfw.genre_id
-            WHERE fw.id IN ({film_work_ids})
+            WHERE {film_work_filter}
             GROUP BY fw.id;
         """
+
+    def select_person_related_fields(
+        self,
+        person_ids: List[str],
+    ):
+        """Return the film works and roles of the given persons.
+
+        Args:
+            person_ids (list[str]): a list of person ids to fetch data for
+
+        Yields:
+            Dict[str, Any]: a dictionary containing person related fields for a single person id
+        """
+        person_ids = ','.join(f"'{field}'" for field in person_ids)
+
+        cursor = self.cursor
+        sql_query = f"""
+            SELECT
+                p.id,
+                p.full_name,
+                COALESCE (
+                    json_agg(
+                        jsonb_build_object(
+                            'id', pfw.film_work_id,
+                            'roles', pfw.roles
+                        )
+                    ) FILTER (WHERE pfw.film_work_id is not null),
+                    '[]'
+                ) as films,
+                (extract(epoch FROM p.modified) * 1000000)::bigint as version
+            FROM content.person p
+            LEFT JOIN (
+                SELECT person_id, film_work_id, array_agg(DISTINCT role) as roles
+                FROM content.person_film_work
+                WHERE person_id IN ({person_ids})
+                GROUP BY person_id, film_work_id
+            ) pfw ON pfw.person_id = p.id
+            WHERE p.id IN ({person_ids})
+            GROUP BY p.id;
+        """
+        try:
+            self._execute(cursor, sql_query)
+        except psycopg2.Error as error:
+            LOGGER.error('%s: %s', error.__class__.__name__, error)
+            raise error
+
+        while True:
+            rows = cursor.fetchmany(size=self.package_limit)
+            yield from rows
+            if not rows:
+                return
+
+    def select_genre_related_fields(
+        self,
+        genre_ids: List[str],
+    ):
+        """Return the genre fields and film work counts of the given genres.
+
+        Args:
+            genre_ids (list[str]): a list of genre ids to fetch data for
+
+        Yields:
+            Dict[str, Any]: a dictionary containing genre related fields for a single genre id
+        """
+        genre_ids = ','.join(f"'{field}'" for field in genre_ids)
+
+        cursor = self.cursor
+        sql_query = f"""
+            SELECT
+                g.id,
+                g.name,
+                g.description,
+                COUNT(gfw.film_work_id) as films_count,
+                (extract(epoch FROM g.modified) * 1000000)::bigint as version
+            FROM content.genre g
+            LEFT JOIN content.genre_film_work gfw ON gfw.genre_id = g.id
+            WHERE g.id IN ({genre_ids})
+            GROUP BY g.id;
+        """
         try:
-            cursor.execute(sql_query)
+            self._execute(cursor, sql_query)
         except psycopg2.Error as error:
             LOGGER.error('%s: %s', error.__class__.__name__, error)
             raise error
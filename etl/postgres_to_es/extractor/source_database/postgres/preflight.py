@@ -0,0 +1,189 @@
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from util.configuration import LOGGER
+
+from .pg_db_handler import PostgresConnection
+
+# Any UUID works, the plan of the enricher query doesn't depend on the value.
+SAMPLE_ENTITY_ID = '00000000-0000-0000-0000-000000000000'
+
+
+class PostgresPreflight:
+    """
+    Startup check of the tables and indexes the ETL queries depend on.
+
+    For every table named in `entities_update_schema` it checks that the table
+    exists and has the indexes of the polling and relation queries:
+    `(modified, id)` and `(id)` on the polled entity tables, and the foreign key
+    columns on the relation tables. An index matches if the required columns
+    are its leading key columns. Missing indexes are reported and can be
+    created `CONCURRENTLY`. The producer and enricher queries are explained
+    to catch sequential scans, which on small tables may still be the cheaper plan.
+    """
+
+    def __init__(self, db_connection: PostgresConnection, entities_update_schema: dict):
+        """
+        Initialize a PostgresPreflight object.
+
+        Args:
+            db_connection (PostgresConnection): The Postgres connection.
+            entities_update_schema (dict): The update schemas of the extractor.
+        """
+        LOGGER.debug("Initialize %s", type(self).__name__)
+        self.db_connection = db_connection
+        self.entities_update_schema = entities_update_schema
+
+    def run(self, create_missing_indexes: bool = False) -> dict:
+        """
+        Run the preflight checks.
+
+        Args:
+            create_missing_indexes (bool): Create the missing indexes concurrently.
+                Defaults to False, which only reports them.
+
+        Raises:
+            OperationalError: If a table doesn't exist.
+
+        Returns:
+            dict: `missing_indexes` as `(table, columns)` pairs, `created_indexes`
+                as index names and `sequential_scans` as relation names per query.
+        """
+        required_indexes = self._required_indexes()
+        for table_name in required_indexes:
+            self.db_connection._check_table_consistency(table_name=table_name)
+
+        missing_indexes = self._find_missing_indexes(required_indexes)
+        for table_name, columns in missing_indexes:
+            LOGGER.warning('Missing index on %s (%s)', table_name, ', '.join(columns))
+
+        created_indexes = []
+        if create_missing_indexes:
+            for table_name, columns in missing_indexes:
+                index_name = f'{table_name}_{"_".join(columns)}_etl_idx'
+                LOGGER.info('Create index %s concurrently', index_name)
+                self.db_connection.create_index_concurrently(
+                    table_name=table_name,
+                    columns=list(columns),
+                    index_name=index_name,
+                )
+                created_indexes.append(index_name)
+
+        sequential_scans = self._find_sequential_scans()
+        for query_name, relation_names in sequential_scans.items():
+            LOGGER.warning(
+                'Sequential scan of %s in the %s query',
+                ', '.join(relation_names),
+                query_name,
+            )
+
+        return {
+            'missing_indexes': missing_indexes,
+            'created_indexes': created_indexes,
+            'sequential_scans': sequential_scans,
+        }
+
+    def _required_indexes(self) -> Dict[str, List[Tuple[str, ...]]]:
+        """
+        Collect the required index key columns per table from the update schemas.
+
+        Returns:
+            Dict[str, List[Tuple[str, ...]]]: the required key columns per table
+        """
+        required_indexes: Dict[str, List[Tuple[str, ...]]] = {}
+
+        def require(table_name: str, columns: Tuple[str, ...]) -> None:
+            table_indexes = required_indexes.setdefault(table_name, [])
+            if columns not in table_indexes:
+                table_indexes.append(columns)
+
+        for update_schema in self.entities_update_schema.values():
+            producer = update_schema['producer']
+            require(producer['entity_name'], ('modified', 'id'))
+            require(producer['entity_name'], ('id', ))
+
+            enricher = update_schema['enricher']
+            if enricher:
+                require(enricher['entity_name'], ('id', ))
+                require(enricher['relation_table'], (enricher['parent_key'], ))
+                require(enricher['relation_table'], (enricher['child_key'], ))
+
+        return required_indexes
+
+    def _find_missing_indexes(
+        self,
+        required_indexes: Dict[str, List[Tuple[str, ...]]],
+    ) -> List[Tuple[str, Tuple[str, ...]]]:
+        """
+        Compare the required indexes with the valid indexes of the tables.
+
+        Args:
+            required_indexes (Dict[str, List[Tuple[str, ...]]]): the required key columns per table
+
+        Returns:
+            List[Tuple[str, Tuple[str, ...]]]: the table and key columns of every missing index
+        """
+        missing_indexes = []
+        for table_name, required_columns in required_indexes.items():
+            existing_columns = [
+                tuple(index['columns'])
+                for index in self.db_connection.select_table_indexes(table_name)
+                if index['is_valid']
+            ]
+            for columns in required_columns:
+                if not any(existing[:len(columns)] == columns for existing in existing_columns):
+                    missing_indexes.append((table_name, columns))
+
+        return missing_indexes
+
+    def _find_sequential_scans(self) -> Dict[str, List[str]]:
+        """
+        Explain the producer and enricher queries of the update schemas.
+
+        The producer queries are explained for changes since now,
+        which is the selective case of the steady state polling.
+
+        Returns:
+            Dict[str, List[str]]: the sequentially scanned relations per query
+        """
+        sequential_scans = {}
+        for schema_name, update_schema in self.entities_update_schema.items():
+            producer = update_schema['producer']
+            queries = {
+                f'{schema_name} producer': PostgresConnection.last_modified_entity_ids_query(
+                    entity=producer['entity_name'],
+                    modified_timestamp=datetime.now(),
+                    after_id=SAMPLE_ENTITY_ID,
+                    limit=self.db_connection.package_limit,
+                ),
+            }
+
+            enricher = update_schema['enricher']
+            if enricher:
+                queries[f'{schema_name} enricher'] = PostgresConnection.related_entity_ids_query(
+                    entity_name=enricher['entity_name'],
+                    relation_table=enricher['relation_table'],
+                    parent_key=enricher['parent_key'],
+                    child_key=enricher['child_key'],
+                    parent_entity_ids=[SAMPLE_ENTITY_ID],
+                    limit=self.db_connection.package_limit,
+                )
+
+            for query_name, sql_query in queries.items():
+                relation_names = self._sequential_scans(self.db_connection.explain_query(sql_query))
+                if relation_names:
+                    sequential_scans[query_name] = relation_names
+
+        return sequential_scans
+
+    @classmethod
+    def _sequential_scans(cls, plan: dict) -> List[str]:
+        """Return the relation names of all sequential scan nodes of a plan."""
+        relation_names = []
+        if plan.get('Node Type') == 'Seq Scan':
+            relation_names.append(plan['Relation Name'])
+
+        for child_plan in plan.get('Plans', []):
+            relation_names.extend(cls._sequential_scans(child_plan))
+
+        return relation_names
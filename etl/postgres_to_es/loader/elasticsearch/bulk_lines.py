@@ -0,0 +1,106 @@
+from json.encoder import encode_basestring
+from typing import Any, Iterable, List
+
+from loader.elasticsearch.content_hash import serialize, serialized_content_hash
+
+
+def serialize_string(value: Any) -> str:
+    """
+    Serialize a value which is a string in most rows, like `serialize`.
+
+    Args:
+        value (Any): The value.
+
+    Returns:
+        str: The JSON of the value.
+    """
+    return encode_basestring(value) if type(value) is str else serialize(value)
+
+
+def film_work_source(film_work: Any) -> str:
+    """
+    Serialize the movie source of a merger row without building a Movie object.
+
+    The fields are written in the order of the `Movie` fields and split the persons
+    by role like `_transform_film_works_to_dataclass`, so the source is serialized
+    to the same bytes as the source of the Movie object.
+
+    Args:
+        film_work (Any): A row of the merger query.
+
+    Returns:
+        str: The serialized movie source without its content hash.
+    """
+    director = ''
+    actors, actors_names, writers, writers_names = [], [], [], []
+
+    for person in film_work.get('persons') or ():
+        person_role = person['person_role']
+        if person_role == 'actor':
+            person_name = serialize_string(person['full_name'])
+            actors.append(f'{{"id":{serialize_string(person["person_id"])},"name":{person_name}}}')
+            actors_names.append(person_name)
+        elif person_role == 'writer':
+            person_name = serialize_string(person['full_name'])
+            writers.append(f'{{"id":{serialize_string(person["person_id"])},"name":{person_name}}}')
+            writers_names.append(person_name)
+        elif person_role == 'director':
+            director = person['full_name']
+
+    return (
+        f'{{"id":{serialize_string(film_work["fw_id"])},'
+        f'"imdb_rating":{serialize(film_work["rating"])},'
+        f'"title":{serialize_string(film_work["title"])},'
+        f'"description":{serialize_string(film_work["description"])},'
+        f'"director":{serialize_string(director)},'
+        f'"genre":{serialize(film_work["genres"])},'
+        f'"actors_names":[{",".join(actors_names)}],'
+        f'"writers_names":[{",".join(writers_names)}],'
+        f'"actors":[{",".join(actors)}],'
+        f'"writers":[{",".join(writers)}]}}'
+    )
+
+
+def film_work_lines(
+    film_works: Iterable[Any],
+    *,
+    index_name: str,
+    is_external_version: bool,
+) -> List[str]:
+    """
+    Serialize the bulk actions of the movies of merger rows to spool lines.
+
+    The lines are the same bytes the spool writes for the actions of the Movie objects
+    built by `prepare_actions`, the content hash is computed from the serialized source.
+
+    Args:
+        film_works (Iterable[Any]): The rows of the merger query.
+        index_name (str): The name of the movies index.
+        is_external_version (bool): Build `index` actions with `external_gte` versioning
+            for the rows with a version, see the `external_version` indexing mode.
+
+    Returns:
+        List[str]: The serialized bulk actions.
+    """
+    serialized_index_name = serialize(index_name)
+
+    lines = []
+    for film_work in film_works:
+        source = film_work_source(film_work)
+        source = f'{source[:-1]},"content_hash":{serialized_content_hash(source)}}}'
+        document_id = serialize_string(film_work['fw_id'])
+        version = film_work.get('version')
+
+        if is_external_version and version is not None:
+            lines.append(
+                f'{{"_index":{serialized_index_name},"_id":{document_id},"_op_type":"index",'
+                f'"_version":{serialize(version)},"_version_type":"external_gte",'
+                f'"_source":{source}}}',
+            )
+        else:
+            lines.append(
+                f'{{"_index":{serialized_index_name},"_id":{document_id},"_op_type":"update",'
+                f'"doc_as_upsert":true,"doc":{source}}}',
+            )
+
+    return lines
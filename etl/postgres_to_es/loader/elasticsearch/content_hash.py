@@ -0,0 +1,40 @@
+import hashlib
+import json
+
+# 28 bit hashes keep the sums of the range digests exact in the `double`
+# of an Elasticsearch `sum` aggregation up to 2^25 documents per range.
+CONTENT_HASH_HEX_DIGITS = 7
+
+# Serializes like the bulk requests, one encoder is reused for all documents.
+serialize = json.JSONEncoder(default=str, ensure_ascii=False, separators=(',', ':')).encode
+
+
+def content_hash(source: dict) -> int:
+    """
+    Return the content hash of a document source.
+
+    The source is serialized like the bulk requests serialize it, so the hash covers
+    the indexed bytes. The verifier hashes the documents it builds from Postgres
+    the same way, so the sums of a range can be compared on both sides.
+
+    Args:
+        source (dict): The document source without its content hash.
+
+    Returns:
+        int: The first `CONTENT_HASH_HEX_DIGITS` hex digits of the MD5 as an integer.
+    """
+    return serialized_content_hash(serialize(source))
+
+
+def serialized_content_hash(serialized_source: str) -> int:
+    """
+    Return the content hash of a document source serialized with `serialize`.
+
+    Args:
+        serialized_source (str): The serialized document source without its content hash.
+
+    Returns:
+        int: The first `CONTENT_HASH_HEX_DIGITS` hex digits of the MD5 as an integer.
+    """
+    digest = hashlib.md5(serialized_source.encode()).hexdigest()
+    return int(digest[:CONTENT_HASH_HEX_DIGITS], 16)
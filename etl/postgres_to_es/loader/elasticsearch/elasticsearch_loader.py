@@ -1,98 +1,539 @@
 from util.configuration import LOGGER
-from dataclasses import asdict
-from typing import Any, List
-
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from uuid import UUID
+
+from elasticsearch import ConnectionError as ElasticsearchConnectionError
 from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk
+from elasticsearch.helpers import bulk, parallel_bulk, scan, streaming_bulk
 
-from data.dataclasses import Movie
+from data.dataclasses import Genre, Movie, Person
+from loader.elasticsearch.bulk_lines import film_work_lines
+from loader.elasticsearch.content_hash import content_hash, serialize
+from loader.elasticsearch.shard_routing import ShardRouter
+from loader.elasticsearch.transport import LatencyTrackingNode
 from loader.loader import Loader
 
+# The number of deleted or rejected document IDs logged as an example, the others are counted only.
+DOCUMENT_IDS_LOGGED = 5
+
+# The number of indexed documents checked against the source at once for outdated data.
+OUTDATED_CHECK_BATCH_SIZE = 1000
+
 
 class ElasticsearchLoader(Loader):
     """Loader implementation for Elasticsearch"""
 
-    def __init__(self, host: dict, index_name: str, index_settings: dict):
+    UPDATE_MODE = 'update'
+    EXTERNAL_VERSION_MODE = 'external_version'
+
+    NO_BULK_ROUTING = 'none'
+    SHARD_BULK_ROUTING = 'shard'
+    PRIMARY_NODE_BULK_ROUTING = 'primary_node'
+
+    # The transport options which don't apply to a client of a single node.
+    CLUSTER_TRANSPORT_SETTINGS = {
+        'node_selector_class',
+        'sniff_on_start',
+        'sniff_on_node_failure',
+        'sniff_before_requests',
+    }
+
+    def __init__(
+        self,
+        host: Union[dict, List[dict]],
+        index_name: str,
+        index_settings: dict,
+        indexing_mode: str = UPDATE_MODE,
+        thread_count: int = 1,
+        derived_indices: Optional[Dict[type, dict]] = None,
+        transport_settings: Optional[dict] = None,
+        client: Optional[Elasticsearch] = None,
+        bulk_routing: str = NO_BULK_ROUTING,
+    ):
         """
         Initialize an ElasticsearchLoader object.
 
         Args:
-            host (dict): The Elasticsearch server connection parameters.
+            host (Union[dict, List[dict]]): The connection parameters of one
+                or several Elasticsearch nodes.
             index_name (str): The name of the Elasticsearch index to load data into.
             index_settings (dict): The settings for the Elasticsearch index.
+            indexing_mode (str): `update` for partial upserts in arrival order, or
+                `external_version` for `index` operations with `external_gte` versioning,
+                which makes Elasticsearch reject stale documents. Defaults to `update`.
+            thread_count (int): The number of parallel bulk threads. Defaults to 1.
+            derived_indices (Dict[type, dict], optional): Further indices by document class,
+                each with an `index_name`, `index_settings` and the `source_entity` table
+                used to delete outdated documents. All indices share one bulk stream.
+            transport_settings (dict, optional): Options of the Elasticsearch client transport,
+                e.g. `http_compress`, `connections_per_node`, `node_selector_class`
+                or the `sniff_*` options. Request latencies are tracked per node.
+            client (Elasticsearch, optional): A client shared with other loaders,
+                see `create_client`. `host` is ignored then, `transport_settings` only
+                apply to the clients of the primary shard nodes. The shared client
+                isn't closed by `close`.
+            bulk_routing (str): `none` to send the actions in their order, `shard` to send
+                per-shard bulk requests concurrently, or `primary_node` to send them
+                to the node of the primary shard. Defaults to `none`.
 
         """
+        if indexing_mode not in {self.UPDATE_MODE, self.EXTERNAL_VERSION_MODE}:
+            raise ValueError(f'unknown indexing mode: {indexing_mode}')
+        if bulk_routing not in {
+            self.NO_BULK_ROUTING,
+            self.SHARD_BULK_ROUTING,
+            self.PRIMARY_NODE_BULK_ROUTING,
+        }:
+            raise ValueError(f'unknown bulk routing: {bulk_routing}')
+
         self.index_settings = index_settings
         self.index_name = index_name
-        self.index_settings = index_settings
+        self.indexing_mode = indexing_mode
+        self.thread_count = thread_count
+
+        self.document_indices = {
+            Movie: {
+                'index_name': index_name,
+                'index_settings': index_settings,
+                'source_entity': 'film_work',
+            },
+            **(derived_indices or {}),
+        }
+        self.checked_mappings = set()
+
+        es_client = client or self.create_client(host, transport_settings)
+        self.owns_connection = client is None
 
-        es_client = Elasticsearch(host)
+        self.bulk_routing = bulk_routing
+        self.shard_router = None
+        if bulk_routing != self.NO_BULK_ROUTING:
+            self.shard_router = ShardRouter(es_client)
+
+        self.node_transport_settings = {
+            option: value
+            for option, value in (transport_settings or {}).items()
+            if option not in self.CLUSTER_TRANSPORT_SETTINGS
+        }
+        self.node_clients: Dict[str, Elasticsearch] = {}
+        self.node_clients_lock = Lock()
+        # The time a primary shard node was found unreachable at, by address.
+        self.unreachable_nodes: Dict[str, float] = {}
 
         super().__init__(connection=es_client)
 
-    def load_data(self, documents: List[dict]) -> None:
+    def close(self) -> None:
+        """Close the clients of the primary shard nodes and the own client."""
+        with self.node_clients_lock:
+            for node_client in self.node_clients.values():
+                node_client.close()
+            self.node_clients = {}
+            self.unreachable_nodes = {}
+
+        if self.owns_connection:
+            self.connection.close()
+
+    @staticmethod
+    def create_client(
+        host: Union[dict, List[dict]],
+        transport_settings: Optional[dict] = None,
+    ) -> Elasticsearch:
+        """
+        Create an Elasticsearch client which tracks the request latencies per node.
+
+        Args:
+            host (Union[dict, List[dict]]): The connection parameters of one
+                or several Elasticsearch nodes.
+            transport_settings (dict, optional): Options of the Elasticsearch client transport.
+
+        Returns:
+            Elasticsearch: The client.
+        """
+        return Elasticsearch(
+            host,
+            node_class=LatencyTrackingNode,
+            **(transport_settings or {}),
+        )
+
+    def load_data(self, documents: List[Any]) -> None:
+        """
+        Load data to the target Elasticsearch indices.
+
+        Args:
+            documents (List[Any]): A list of Movie and derived document objects to load.
+
+        """
+        self.load_actions(actions=self.prepare_actions(documents=documents))
+
+    def prepare_actions(self, documents: List[Any]) -> List[dict]:
+        """
+        Build the bulk actions for the given documents.
+
+        The actions are plain dictionaries, so they can be spooled before they are loaded.
+        In `external_version` mode documents without a version fall back to an update action.
+
+        Args:
+            documents (List[Any]): A list of Movie and derived document objects.
+
+        Returns:
+            List[dict]: A list of bulk actions.
+        """
+        return [self._build_action(document) for document in documents]
+
+    def prepare_film_work_lines(self, film_works: List[Any]) -> List[str]:
+        """
+        Build the serialized bulk actions of the movies of merged film work rows.
+
+        The lines are the actions `prepare_actions` builds for the Movie objects of the rows,
+        serialized like `prepare_lines` does, without building the objects.
+
+        Args:
+            film_works (List[Any]): The rows of the merger query.
+
+        Returns:
+            List[str]: A list of serialized bulk actions.
+        """
+        return film_work_lines(
+            film_works,
+            index_name=self.index_name,
+            is_external_version=self.indexing_mode == self.EXTERNAL_VERSION_MODE,
+        )
+
+    def prepare_lines(self, documents: List[Any]) -> List[str]:
+        """
+        Build the serialized bulk actions for the given documents.
+
+        Args:
+            documents (List[Any]): A list of Movie and derived document objects,
+                and of lines already built by `prepare_film_work_lines`.
+
+        Returns:
+            List[str]: A list of serialized bulk actions.
+        """
+        return [
+            document if isinstance(document, str) else serialize(self._build_action(document))
+            for document in documents
+        ]
+
+    def load_actions(self, actions: List[dict]) -> None:
         """
-        Load data to the target Elasticsearch index.
+        Load prepared bulk actions to the target Elasticsearch indices.
 
         Args:
-            documents (List[dict]): A list of dictionaries containing the data to load.
+            actions (List[dict]): A list of bulk actions built by `prepare_actions`.
 
         """
         self._create_index()
 
         try:
-            self._bulk_update_documents(documents=documents)
+            self._bulk_update_documents(actions=actions)
         except ValueError as error:
             LOGGER.error('%s: %s', error.__class__.__name__, error)
 
-    def delete_outdated_data(self, source_data_provider: Any) -> None:
+    def delete_outdated_data(
+        self,
+        source_data_provider: Any,
+        index_names: Optional[Iterable[str]] = None,
+        before_delete: Optional[Callable[[type, List[str]], None]] = None,
+    ) -> None:
         """
-        Delete outdated data from the Elasticsearch index.
+        Delete outdated data from the Elasticsearch indices.
 
         Args:
             source_data_provider (Any):
                 The data source that contains the data to be compared and
                 potentially deleted if outdated.
+            index_names (Iterable[str], optional): The indices to clean up.
+                Defaults to None (all indices).
+            before_delete (Callable[[type, List[str]], None], optional): Called with
+                the document class and the IDs of the outdated documents before they
+                are deleted, e.g. to read the links of the indexed documents.
         """
-        source_data_entity_ids = source_data_provider.select_all_entity_ids(entity='film_work')
-        source_data_entity_ids = [doc.get('id') for doc in source_data_entity_ids]
+        for document_class, index in self.document_indices.items():
+            if index_names is not None and index['index_name'] not in index_names:
+                continue
+
+            try:
+                deleted_docs = self._delete_missing_docs(
+                    source_data_provider,
+                    source_entity=index['source_entity'],
+                    index_name=index['index_name'],
+                    before_delete=partial(before_delete, document_class) if before_delete else None,
+                )
+                if deleted_docs:
+                    LOGGER.warning(
+                        '%s obsolete documents were deleted from %s, e.g. %s',
+                        len(deleted_docs),
+                        index['index_name'],
+                        deleted_docs[:DOCUMENT_IDS_LOGGED],
+                        extra={'index': index['index_name'], 'deleted_count': len(deleted_docs)},
+                    )
+            except ValueError as error:
+                LOGGER.error('%s: %s', error.__class__.__name__, error)
+
+    def delete_documents(self, document_ids: List[str], index_name: Optional[str] = None) -> None:
+        """
+        Delete documents by ID.
 
-        try:
-            deleted_docs = self._delete_missing_docs_by_ids(source_data_entity_ids)
-            if deleted_docs:
-                LOGGER.warning('The following obsolete documents were deleted: %s', deleted_docs)
-        except ValueError as error:
-            LOGGER.error('%s: %s', error.__class__.__name__, error)
+        Args:
+            document_ids (List[str]): The IDs of the documents to delete.
+            index_name (str, optional): The index to delete from. Defaults to the movies index.
+        """
+        index_name = index_name or self.index_name
+        actions = [
+            {'_index': index_name, '_id': document_id, '_op_type': 'delete'}
+            for document_id in document_ids
+        ]
+
+        _, errors = bulk(self.connection, actions, raise_on_error=False)
+        errors = [error for error in errors if error.get('delete', {}).get('status') != 404]
+        if errors:
+            raise ValueError(
+                f'{len(errors)} errors occurred while deleting documents in index {index_name}.'
+            )
+
+    def select_range_digests(
+        self,
+        prefixes: List[str],
+        index_name: Optional[str] = None,
+    ) -> Dict[str, tuple]:
+        """
+        Return the document count and content hash sum of the documents per ID prefix.
+
+        Args:
+            prefixes (List[str]): The ID prefixes.
+            index_name (str, optional): The index to aggregate. Defaults to the movies index.
+
+        Returns:
+            Dict[str, tuple]: The document count and the content hash sum per prefix.
+        """
+        response = self.connection.search(
+            index=index_name or self.index_name,
+            size=0,
+            aggs={
+                'ranges': {
+                    'filters': {
+                        'filters': {prefix: {'prefix': {'id': prefix}} for prefix in prefixes},
+                    },
+                    'aggs': {'digest': {'sum': {'field': 'content_hash'}}},
+                },
+            },
+        )
+
+        return {
+            prefix: (bucket['doc_count'], int(bucket['digest']['value']))
+            for prefix, bucket in response['aggregations']['ranges']['buckets'].items()
+        }
+
+    def select_content_hashes(
+        self,
+        prefixes: List[str],
+        index_name: Optional[str] = None,
+    ) -> Dict[str, Optional[int]]:
+        """
+        Return the content hashes of the documents with the given ID prefixes.
+
+        Args:
+            prefixes (List[str]): The ID prefixes.
+            index_name (str, optional): The index to read. Defaults to the movies index.
+
+        Returns:
+            Dict[str, Optional[int]]: The content hash per document ID,
+                None for documents stored without a hash.
+        """
+        hits = scan(
+            self.connection,
+            index=index_name or self.index_name,
+            query={
+                'query': {
+                    'bool': {'should': [{'prefix': {'id': prefix}} for prefix in prefixes]},
+                },
+                '_source': ['content_hash'],
+            },
+        )
+
+        return {hit['_id']: hit['_source'].get('content_hash') for hit in hits}
+
+    def select_linked_document_ids(self, film_work_ids: List[str]) -> Dict[type, List[str]]:
+        """
+        Return the IDs of the indexed persons and genres linked to the given films.
+
+        The links are read from the indexed documents, so that the persons and genres
+        a film was unlinked from, or a deleted film was linked to, are found too.
+        Persons are found by the films of their documents, genres by the genres
+        of the indexed movies. Indices that don't exist yet are skipped.
+
+        Args:
+            film_work_ids (List[str]): The film work IDs.
+
+        Returns:
+            Dict[type, List[str]]: The document IDs by derived document class.
+        """
+        linked_document_ids = {}
+        if not film_work_ids:
+            return linked_document_ids
+
+        if Person in self.document_indices:
+            hits = scan(
+                self.connection,
+                index=self.document_indices[Person]['index_name'],
+                query={
+                    'query': {
+                        'nested': {
+                            'path': 'films',
+                            'query': {'terms': {'films.id': film_work_ids}},
+                        },
+                    },
+                    '_source': False,
+                },
+                ignore_unavailable=True,
+            )
+            linked_document_ids[Person] = [hit['_id'] for hit in hits]
+
+        if Genre in self.document_indices:
+            movie_hits = scan(
+                self.connection,
+                index=self.index_name,
+                query={'query': {'ids': {'values': film_work_ids}}, '_source': ['genre']},
+                ignore_unavailable=True,
+            )
+            genre_names = {
+                genre_name for hit in movie_hits for genre_name in hit['_source'].get('genre', [])
+            }
+
+            linked_document_ids[Genre] = []
+            if genre_names:
+                hits = scan(
+                    self.connection,
+                    index=self.document_indices[Genre]['index_name'],
+                    query={'query': {'terms': {'name.raw': list(genre_names)}}, '_source': False},
+                    ignore_unavailable=True,
+                )
+                linked_document_ids[Genre] = [hit['_id'] for hit in hits]
+
+        return linked_document_ids
 
     def _create_index(self) -> None:
         """
-        Create the Elasticsearch index if it doesn't exist.
+        Create the Elasticsearch indices if they don't exist.
+
+        The mappings of existing indices are updated once, so that fields added
+        to the index settings later on are known to the strict mappings.
 
         """
         es_client = self.connection
 
-        if not es_client.indices.exists(index=self.index_name):
-            es_client.indices.create(index=self.index_name, body=self.index_settings)
+        for index in self.document_indices.values():
+            index_name = index['index_name']
+            if not es_client.indices.exists(index=index_name):
+                es_client.indices.create(index=index_name, body=index['index_settings'])
+                self.checked_mappings.add(index_name)
+
+            elif index_name not in self.checked_mappings:
+                mappings = index['index_settings'].get('mappings', {})
+                if mappings.get('properties'):
+                    es_client.indices.put_mapping(
+                        index=index_name,
+                        properties=mappings['properties'],
+                    )
+                self.checked_mappings.add(index_name)
+
+    @staticmethod
+    def document_source(document: Any) -> dict:
+        """
+        Return the source of a document as it is indexed, with its content hash.
+
+        Args:
+            document (Any): A Movie or derived document object.
+
+        Returns:
+            dict: The document source.
+        """
+        # The documents hold plain values only, a shallow copy serializes like `asdict`.
+        source = dict(vars(document))
+        del source['version']
+        source['content_hash'] = content_hash(source)
+        return source
 
-    def _bulk_update_documents(self, documents: List[Movie]) -> None:
+    def _build_action(self, document: Any) -> dict:
         """
-        Update multiple documents in an Elasticsearch index using a list of Python dictionaries.
+        Build the bulk action for a single document.
 
         Args:
-            documents (List[Movie]): A list of Movie objects to update in the Elasticsearch index.
+            document (Any): A Movie or derived document object.
+
+        Returns:
+            dict: A bulk action.
         """
-        actions = [
-            {
-                '_index': self.index_name,
+        index_name = self.document_indices[type(document)]['index_name']
+        source = self.document_source(document)
+        version = document.version
+
+        if self.indexing_mode == self.EXTERNAL_VERSION_MODE and version is not None:
+            return {
+                '_index': index_name,
                 '_id': document.id,
-                '_op_type': 'update',
-                'doc_as_upsert': True,
-                'doc': asdict(document),
+                '_op_type': 'index',
+                '_version': version,
+                '_version_type': 'external_gte',
+                '_source': source,
             }
-            for document in documents
-        ]
 
-        success_count, errors = bulk(self.connection, actions)
+        return {
+            '_index': index_name,
+            '_id': document.id,
+            '_op_type': 'update',
+            'doc_as_upsert': True,
+            'doc': source,
+        }
+
+    def _bulk_update_documents(self, actions: List[dict]) -> None:
+        """
+        Update multiple documents in an Elasticsearch index using a list of bulk actions.
+
+        Version conflicts are stale writes rejected by Elasticsearch.
+        They are logged, not raised as errors.
+
+        Args:
+            actions (List[dict]): A list of bulk actions to send to the Elasticsearch index.
+        """
+        if self.shard_router:
+            results = self._shard_routed_bulk(actions)
+        elif self.thread_count > 1:
+            results = parallel_bulk(
+                self.connection,
+                actions,
+                thread_count=self.thread_count,
+                raise_on_error=False,
+            )
+        else:
+            results = streaming_bulk(self.connection, actions, raise_on_error=False)
+
+        errors = []
+        conflict_ids = defaultdict(list)
+        for is_success, item in results:
+            if is_success:
+                continue
+
+            _, item_result = item.popitem()
+            if item_result.get('status') == 409:
+                conflict_ids[item_result.get('_index')].append(item_result.get('_id'))
+            else:
+                errors.append(item_result)
+
+        for index_name, index_conflict_ids in conflict_ids.items():
+            LOGGER.warning(
+                '%s stale documents rejected in index %s, e.g. %s',
+                len(index_conflict_ids),
+                index_name,
+                index_conflict_ids[:DOCUMENT_IDS_LOGGED],
+                extra={'index': index_name, 'conflict_count': len(index_conflict_ids)},
+            )
 
         if errors:
             error_count = len(errors)
@@ -100,46 +541,180 @@ class ElasticsearchLoader(Loader):
                 f'{error_count} errors occurred while updating documents in index {self.index_name}.'
             )
 
-    def _delete_missing_docs_by_ids(self, docs_ids: List[str]) -> List[str]:
+    def _shard_routed_bulk(self, actions: List[dict]) -> List[Tuple[bool, dict]]:
         """
-        Delete documents from the Elasticsearch index that are missing from the source data.
+        Send the actions grouped by target shard, the shards concurrently.
+
+        Every shard gets bulk requests of its own documents only, so a request waits
+        for a single shard instead of the slowest of all shards. The requests of a shard
+        are sent in order, the actions of a document keep their order.
 
         Args:
-            docs_ids (List[str]): A list of IDs of documents to delete from the Elasticsearch index.
+            actions (List[dict]): A list of bulk actions.
 
         Returns:
-            List[str]: A list of IDs of documents that were deleted.
+            List[Tuple[bool, dict]]: The success and result item of every action.
         """
-        query = {
-            'query': {
-                'bool': {
-                    'must_not': [
-                        {
-                            'terms': {
-                                '_id': docs_ids,
-                            },
-                        },
-                    ],
-                },
-            },
-        }
+        shard_groups = self.shard_router.group(actions)
 
-        response = self.connection.search(index=self.index_name, body=query)
-        not_found_docs_hits = response['hits']['hits']
+        with ThreadPoolExecutor(max_workers=self.thread_count) as executor:
+            shard_results = executor.map(
+                lambda shard_group: self._bulk_shard(*shard_group),
+                shard_groups.items(),
+            )
+            return [result for results in shard_results for result in results]
 
-        not_found_docs_ids = [doc['_id'] for doc in not_found_docs_hits]
+    def _bulk_shard(
+        self,
+        shard_key: Tuple[str, Optional[int]],
+        actions: List[dict],
+    ) -> List[Tuple[bool, dict]]:
+        """
+        Send the actions of one shard, to the node of its primary if known and reachable.
 
-        actions = [
-            {'_index': self.index_name, '_id': doc_id, '_op_type': 'delete'}
-            for doc_id in not_found_docs_ids
-        ]
+        An unreachable node gets the actions of its shards again after the refresh
+        interval of the routing, e.g. once it's back from a rolling restart.
+
+        Args:
+            shard_key (Tuple[str, Optional[int]]): The index name and shard number.
+            actions (List[dict]): The bulk actions of the shard.
 
-        _, errors = bulk(self.connection, actions)
+        Returns:
+            List[Tuple[bool, dict]]: The success and result item of every action.
+        """
+        node_address = None
+        if self.bulk_routing == self.PRIMARY_NODE_BULK_ROUTING:
+            node_address = self.shard_router.primary_node(*shard_key)
+
+        if node_address and self._is_node_reachable(node_address):
+            try:
+                return list(
+                    streaming_bulk(
+                        self._node_client(node_address),
+                        actions,
+                        raise_on_error=False,
+                    ),
+                )
+            except ElasticsearchConnectionError as error:
+                # E.g. a published address behind NAT, the actions are idempotent.
+                LOGGER.warning('Primary shard node %s unreachable: %s', node_address, error)
+                with self.node_clients_lock:
+                    self.unreachable_nodes[node_address] = monotonic()
+
+        return list(streaming_bulk(self.connection, actions, raise_on_error=False))
+
+    def _is_node_reachable(self, node_address: str) -> bool:
+        """
+        Return whether a node wasn't found unreachable within the routing refresh interval.
 
-        if errors:
-            error_count = len(errors)
-            raise ValueError(
-                f'{error_count} errors occurred while updating documents in index {self.index_name}.'
+        Args:
+            node_address (str): The `host:port` of the node.
+
+        Returns:
+            bool: True if the bulk requests of its shards may be sent to the node.
+        """
+        with self.node_clients_lock:
+            unreachable_at = self.unreachable_nodes.get(node_address)
+            if unreachable_at is None:
+                return True
+            if monotonic() - unreachable_at < self.shard_router.refresh_interval:
+                return False
+
+            del self.unreachable_nodes[node_address]
+            return True
+
+    def _node_client(self, node_address: str) -> Elasticsearch:
+        """
+        Return the client of a single node.
+
+        Args:
+            node_address (str): The `host:port` of the node.
+
+        Returns:
+            Elasticsearch: The client, created with the transport settings of the loader.
+        """
+        with self.node_clients_lock:
+            if node_address not in self.node_clients:
+                scheme = self.connection.transport.node_pool.all()[0].config.scheme
+                host, _, port = node_address.rpartition(':')
+                self.node_clients[node_address] = self.create_client(
+                    {'scheme': scheme, 'host': host.strip('[]'), 'port': int(port)},
+                    self.node_transport_settings,
+                )
+
+            return self.node_clients[node_address]
+
+    def _delete_missing_docs(
+        self,
+        source_data_provider: Any,
+        *,
+        source_entity: str,
+        index_name: str,
+        before_delete: Optional[Callable[[List[str]], None]] = None,
+    ) -> List[str]:
+        """
+        Delete documents from the Elasticsearch index that are missing from the source data.
+
+        The document IDs are scrolled in batches, and every batch is looked up in the
+        source table, so neither side is held in memory nor sent in a single query.
+        Documents whose ID isn't a UUID can't be looked up, they are logged and kept.
+
+        Args:
+            source_data_provider (Any): The data source with `select_existing_entity_ids`.
+            source_entity (str): The source table of the documents.
+            index_name (str): The index to delete from.
+            before_delete (Callable[[List[str]], None], optional): Called with the IDs
+                of every batch of missing documents before it is deleted.
+
+        Returns:
+            List[str]: A list of IDs of documents that were deleted.
+        """
+        hits = scan(
+            self.connection,
+            index=index_name,
+            query={'_source': False},
+            size=OUTDATED_CHECK_BATCH_SIZE,
+        )
+
+        hits_ids = (hit['_id'] for hit in hits)
+
+        deleted_docs_ids = []
+        invalid_docs_ids = []
+        while True:
+            docs_ids = list(islice(hits_ids, OUTDATED_CHECK_BATCH_SIZE))
+            if not docs_ids:
+                break
+
+            source_ids = {}
+            for doc_id in docs_ids:
+                try:
+                    source_ids[doc_id] = str(UUID(doc_id))
+                except ValueError:
+                    invalid_docs_ids.append(doc_id)
+
+            existing_ids = {
+                str(row['id'])
+                for row in source_data_provider.select_existing_entity_ids(
+                    entity=source_entity,
+                    entity_ids=list(source_ids.values()),
+                )
+            }
+            missing_ids = [
+                doc_id for doc_id, source_id in source_ids.items() if source_id not in existing_ids
+            ]
+            if missing_ids:
+                if before_delete:
+                    before_delete(missing_ids)
+                self.delete_documents(missing_ids, index_name=index_name)
+                deleted_docs_ids.extend(missing_ids)
+
+        if invalid_docs_ids:
+            LOGGER.warning(
+                '%s documents without a UUID kept in %s, e.g. %s',
+                len(invalid_docs_ids),
+                index_name,
+                invalid_docs_ids[:DOCUMENT_IDS_LOGGED],
+                extra={'index': index_name, 'invalid_id_count': len(invalid_docs_ids)},
             )
 
-        return not_found_docs_ids
+        return deleted_docs_ids
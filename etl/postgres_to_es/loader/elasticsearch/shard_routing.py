@@ -0,0 +1,314 @@
+from collections import defaultdict
+from threading import Lock
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+
+from elasticsearch import ApiError, Elasticsearch
+
+from util.configuration import LOGGER
+
+# The maximum number of shards an index created with the default routing shards can be split to.
+MAX_ROUTING_SHARDS_LOG2 = 10
+
+
+def murmur3_32(data: bytes, seed: int = 0) -> int:
+    """
+    Return the MurmurHash3 x86 32-bit hash of the data.
+
+    Args:
+        data (bytes): The data to hash.
+        seed (int): The hash seed. Defaults to 0.
+
+    Returns:
+        int: The hash as a signed 32-bit integer, like the Java implementation.
+    """
+    c1, c2 = 0xcc9e2d51, 0x1b873593
+    hash_value = seed
+    block_end = len(data) & ~3
+
+    for position in range(0, block_end, 4):
+        block = int.from_bytes(data[position:position + 4], 'little')
+        block = (block * c1) & 0xffffffff
+        block = ((block << 15) | (block >> 17)) & 0xffffffff
+        block = (block * c2) & 0xffffffff
+
+        hash_value ^= block
+        hash_value = ((hash_value << 13) | (hash_value >> 19)) & 0xffffffff
+        hash_value = (hash_value * 5 + 0xe6546b64) & 0xffffffff
+
+    tail = data[block_end:]
+    block = 0
+    for index in reversed(range(len(tail))):
+        block ^= tail[index] << (8 * index)
+    if tail:
+        block = (block * c1) & 0xffffffff
+        block = ((block << 15) | (block >> 17)) & 0xffffffff
+        block = (block * c2) & 0xffffffff
+        hash_value ^= block
+
+    hash_value ^= len(data)
+    hash_value ^= hash_value >> 16
+    hash_value = (hash_value * 0x85ebca6b) & 0xffffffff
+    hash_value ^= hash_value >> 13
+    hash_value = (hash_value * 0xc2b2ae35) & 0xffffffff
+    hash_value ^= hash_value >> 16
+
+    return hash_value - (1 << 32) if hash_value & 0x80000000 else hash_value
+
+
+def routing_hash(routing: str) -> int:
+    """
+    Return the routing hash of a document ID like Elasticsearch.
+
+    Elasticsearch hashes the UTF-16 code units of the Java string, two bytes each.
+
+    Args:
+        routing (str): The document ID or custom routing value.
+
+    Returns:
+        int: The signed 32-bit routing hash.
+    """
+    return murmur3_32(routing.encode('utf-16-le'))
+
+
+def calculate_routing_shards(number_of_shards: int) -> int:
+    """
+    Return the default number of routing shards of an index created since Elasticsearch 7.
+
+    It is the largest `number_of_shards * 2^n` up to 1024, with at least one split.
+
+    Args:
+        number_of_shards (int): The number of primary shards.
+
+    Returns:
+        int: The number of routing shards.
+    """
+    splits = max(MAX_ROUTING_SHARDS_LOG2 - (number_of_shards - 1).bit_length(), 1)
+    return number_of_shards << splits
+
+
+def shard_for_id(document_id: str, number_of_shards: int, routing_shards: int) -> int:
+    """
+    Return the shard of a document routed by its ID.
+
+    Args:
+        document_id (str): The document ID.
+        number_of_shards (int): The number of primary shards of the index.
+        routing_shards (int): The number of routing shards of the index.
+
+    Returns:
+        int: The shard number.
+    """
+    # Python's modulo of a positive divisor is Java's `Math.floorMod`.
+    return routing_hash(document_id) % routing_shards // (routing_shards // number_of_shards)
+
+
+class IndexRouting:
+    """The shard count, routing shards and primary shard nodes of an index."""
+
+    def __init__(
+        self,
+        number_of_shards: int,
+        routing_shards: int,
+        primary_nodes: Optional[Dict[int, str]] = None,
+    ):
+        """
+        Initialize an IndexRouting object.
+
+        Args:
+            number_of_shards (int): The number of primary shards.
+            routing_shards (int): The number of routing shards.
+            primary_nodes (Dict[int, str], optional): The HTTP address of the node holding
+                the primary per shard. Defaults to None (unknown).
+        """
+        self.number_of_shards = number_of_shards
+        self.routing_shards = routing_shards
+        self.primary_nodes = primary_nodes or {}
+        self.fetched_at = monotonic()
+
+    def shard(self, document_id: str) -> int:
+        """Return the shard of a document ID."""
+        return shard_for_id(document_id, self.number_of_shards, self.routing_shards)
+
+
+class ShardRouter:
+    """
+    Grouping of bulk actions by the target shard of their documents.
+
+    The shard of a document is computed like Elasticsearch routes by `_id`:
+    the murmur3 hash of the ID modulo the routing shards of the index, divided by
+    the routing factor. The shard count and routing shards are read from the cluster
+    state, the node of every primary shard from the routing table and the node infos.
+    The routing is refreshed every `refresh_interval` seconds, e.g. after a split.
+    A stale routing only costs the performance: Elasticsearch forwards every
+    document to its shard anyway.
+    """
+
+    def __init__(self, client: Elasticsearch, refresh_interval: float = 60):
+        """
+        Initialize a ShardRouter object.
+
+        Args:
+            client (Elasticsearch): The client used for the cluster state requests.
+            refresh_interval (float): The seconds after which the routing of an index
+                is read again. Defaults to 60.
+        """
+        LOGGER.debug("Initialize %s", type(self).__name__)
+        self.client = client
+        self.refresh_interval = refresh_interval
+
+        self.lock = Lock()
+        self.index_routings: Dict[str, Optional[IndexRouting]] = {}
+
+    def group(self, actions: List[dict]) -> Dict[Tuple[str, Optional[int]], List[dict]]:
+        """
+        Group bulk actions by target index and shard, in their original order per shard.
+
+        Actions of indices whose routing is unknown are grouped with the shard None.
+
+        Args:
+            actions (List[dict]): The bulk actions with `_index` and `_id`.
+
+        Returns:
+            Dict[Tuple[str, Optional[int]], List[dict]]: The actions by index and shard.
+        """
+        groups = defaultdict(list)
+        for action in actions:
+            index_name = action['_index']
+            index_routing = self.index_routing(index_name)
+            shard = index_routing.shard(str(action['_id'])) if index_routing else None
+            groups[(index_name, shard)].append(action)
+
+        return groups
+
+    def primary_node(self, index_name: str, shard: Optional[int]) -> Optional[str]:
+        """
+        Return the HTTP address of the node holding a primary shard.
+
+        Args:
+            index_name (str): The index name.
+            shard (int, optional): The shard number.
+
+        Returns:
+            str: The `host:port` of the node, None if unknown.
+        """
+        index_routing = self.index_routing(index_name)
+        if index_routing is None or shard is None:
+            return None
+        return index_routing.primary_nodes.get(shard)
+
+    def index_routing(self, index_name: str) -> Optional[IndexRouting]:
+        """
+        Return the routing of an index, read from the cluster if it's missing or outdated.
+
+        Args:
+            index_name (str): The index name.
+
+        Returns:
+            IndexRouting: The routing, None if it can't be read, e.g. for an alias
+                of several indices or without the `monitor` privilege.
+        """
+        with self.lock:
+            index_routing = self.index_routings.get(index_name)
+            is_fresh = index_name in self.index_routings and (
+                index_routing is None
+                or monotonic() - index_routing.fetched_at < self.refresh_interval
+            )
+            if not is_fresh:
+                index_routing = self._fetch_index_routing(index_name)
+                self.index_routings[index_name] = index_routing
+
+        return index_routing
+
+    def invalidate(self, index_name: Optional[str] = None) -> None:
+        """
+        Forget the routing of an index, or of all indices.
+
+        Args:
+            index_name (str, optional): The index name. Defaults to None (all indices).
+        """
+        with self.lock:
+            if index_name is None:
+                self.index_routings.clear()
+            else:
+                self.index_routings.pop(index_name, None)
+
+    def _fetch_index_routing(self, index_name: str) -> Optional[IndexRouting]:
+        """Read the shard count, routing shards and primary nodes of an index."""
+        try:
+            cluster_state = self.client.cluster.state(
+                metric='metadata,routing_table',
+                index=index_name,
+                filter_path=[
+                    'metadata.indices.*.settings.index.number_of_shards',
+                    'metadata.indices.*.settings.index.routing_partition_size',
+                    'metadata.indices.*.routing_num_shards',
+                    'routing_table.indices.*.shards',
+                ],
+            ).body
+        except ApiError as error:
+            LOGGER.warning('Bulk actions of %s are not grouped by shard: %s', index_name, error)
+            return None
+
+        indices = cluster_state.get('metadata', {}).get('indices', {})
+        if len(indices) != 1:
+            LOGGER.warning(
+                'Bulk actions of %s are not grouped by shard: %s indices found',
+                index_name,
+                len(indices),
+            )
+            return None
+
+        concrete_index_name, index_metadata = next(iter(indices.items()))
+        index_settings = index_metadata['settings']['index']
+        if int(index_settings.get('routing_partition_size', 1)) > 1:
+            return None
+
+        number_of_shards = int(index_settings['number_of_shards'])
+        routing_shards = int(
+            index_metadata.get('routing_num_shards')
+            or calculate_routing_shards(number_of_shards),
+        )
+
+        shard_copies = (
+            cluster_state.get('routing_table', {})
+            .get('indices', {})
+            .get(concrete_index_name, {})
+            .get('shards', {})
+        )
+        primary_node_ids = {
+            int(shard): copy['node']
+            for shard, copies in shard_copies.items()
+            for copy in copies
+            if copy.get('primary') and copy.get('state') == 'STARTED'
+        }
+
+        return IndexRouting(
+            number_of_shards=number_of_shards,
+            routing_shards=routing_shards,
+            primary_nodes=self._node_addresses(primary_node_ids),
+        )
+
+    def _node_addresses(self, node_ids: Dict[int, str]) -> Dict[int, str]:
+        """Map the node IDs per shard to the published HTTP addresses of the nodes."""
+        if not node_ids:
+            return {}
+
+        try:
+            nodes = self.client.nodes.info(
+                node_id=','.join(set(node_ids.values())),
+                metric='http',
+                filter_path=['nodes.*.http.publish_address'],
+            ).body.get('nodes', {})
+        except ApiError as error:
+            LOGGER.warning('Primary shard nodes unknown: %s', error)
+            return {}
+
+        # The address is published as `host/ip:port` if the node has a host name.
+        addresses = {
+            node_id: node['http']['publish_address'].rpartition('/')[2]
+            for node_id, node in nodes.items()
+        }
+        return {
+            shard: addresses[node_id] for shard, node_id in node_ids.items() if node_id in addresses
+        }
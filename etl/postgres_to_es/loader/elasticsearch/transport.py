@@ -0,0 +1,156 @@
+import json
+from collections import defaultdict, deque
+from threading import Lock
+from typing import Deque, Dict, List, Optional, Union
+
+from elastic_transport import Urllib3HttpNode
+
+from profiling.slow_operations import SLOW_OPERATION_LOG
+
+
+class NodeLatencyTracker:
+    """
+    Collect request latencies and request body sizes per Elasticsearch node.
+
+    Only the last `window_size` latencies of a node are kept for the percentiles.
+    """
+
+    def __init__(self, window_size: int = 1000, slow_request_threshold: Optional[float] = None):
+        """
+        Initialize a NodeLatencyTracker object.
+
+        Args:
+            window_size (int): The number of latencies kept per node. Defaults to 1000.
+            slow_request_threshold (float, optional): The latency in seconds after which
+                a bulk request is recorded with its `took` timing in `SLOW_OPERATION_LOG`.
+                Defaults to None (disabled).
+        """
+        self.window_size = window_size
+        self.slow_request_threshold = slow_request_threshold
+        self.lock = Lock()
+
+        self.latencies: Dict[str, Deque[float]] = defaultdict(
+            lambda: deque(maxlen=self.window_size),
+        )
+        self.request_counts: Dict[str, int] = defaultdict(int)
+        self.request_bytes: Dict[str, int] = defaultdict(int)
+
+    def record(self, node: str, duration: float, body_size: int) -> None:
+        """
+        Record a finished request.
+
+        Args:
+            node (str): The base URL of the node.
+            duration (float): The request latency in seconds.
+            body_size (int): The size of the uncompressed request body in bytes.
+        """
+        with self.lock:
+            self.latencies[node].append(duration)
+            self.request_counts[node] += 1
+            self.request_bytes[node] += body_size
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        Return the latency statistics per node.
+
+        Returns:
+            Dict[str, dict]: request count, request body bytes and p50/p99/max latency
+                in milliseconds per node.
+        """
+        with self.lock:
+            return {
+                node: {
+                    'requests': self.request_counts[node],
+                    'request_bytes': self.request_bytes[node],
+                    'p50_ms': self._percentile(sorted(latencies), 0.5),
+                    'p99_ms': self._percentile(sorted(latencies), 0.99),
+                    'max_ms': round(max(latencies) * 1000, 1),
+                }
+                for node, latencies in self.latencies.items()
+                if latencies
+            }
+
+    def reset(self) -> None:
+        """Forget all recorded requests."""
+        with self.lock:
+            self.latencies.clear()
+            self.request_counts.clear()
+            self.request_bytes.clear()
+
+    @staticmethod
+    def _percentile(sorted_latencies: List[float], quantile: float) -> float:
+        """Return the quantile of sorted latencies in milliseconds."""
+        index = min(int(len(sorted_latencies) * quantile), len(sorted_latencies) - 1)
+        return round(sorted_latencies[index] * 1000, 1)
+
+
+NODE_LATENCY_TRACKER = NodeLatencyTracker()
+
+
+class LatencyTrackingNode(Urllib3HttpNode):
+    """
+    HTTP node reporting the latency of every request to `NODE_LATENCY_TRACKER`.
+
+    Bulk requests slower than the slow request threshold are recorded with
+    the server side `took` timing, which tells the time spent in Elasticsearch
+    from the time spent on the wire and in the client.
+    """
+
+    def perform_request(self, method: str, target: str, body: Union[bytes, None] = None, **kwargs):
+        response = super().perform_request(method, target, body=body, **kwargs)
+
+        duration = response.meta.duration
+        NODE_LATENCY_TRACKER.record(
+            node=self.base_url,
+            duration=duration,
+            body_size=len(body) if body else 0,
+        )
+
+        slow_request_threshold = NODE_LATENCY_TRACKER.slow_request_threshold
+        if slow_request_threshold and duration > slow_request_threshold and '_bulk' in target:
+            self._record_slow_bulk(target, duration, body, response.body)
+
+        return response
+
+    def _record_slow_bulk(
+        self,
+        target: str,
+        duration: float,
+        request_body: Union[bytes, None],
+        response_body: bytes,
+    ) -> None:
+        """Record a slow bulk request with the timings reported by Elasticsearch."""
+        try:
+            bulk_response = json.loads(response_body)
+        except ValueError:
+            bulk_response = {}
+
+        SLOW_OPERATION_LOG.record(
+            'bulk',
+            duration,
+            node=self.base_url,
+            target=target,
+            request_bytes=len(request_body) if request_body else 0,
+            took_ms=bulk_response.get('took'),
+            items=len(bulk_response.get('items', [])),
+            errors=bulk_response.get('errors'),
+        )
+
+
+def parse_hosts(hosts: str, scheme: str = 'http') -> List[dict]:
+    """
+    Parse a comma separated list of `host:port` pairs.
+
+    Args:
+        hosts (str): The hosts, e.g. `es-1:9200,es-2:9200`.
+        scheme (str): The scheme of all hosts. Defaults to `http`.
+
+    Returns:
+        List[dict]: The host connection parameters.
+    """
+    parsed_hosts = []
+    for host in hosts.split(','):
+        host_name, _, port = host.strip().partition(':')
+        parsed_hosts.append({'scheme': scheme, 'host': host_name, 'port': int(port or 9200)})
+
+    return parsed_hosts
@@ -1,12 +1,14 @@
-import json
 import os
 from contextlib import closing
-from time import sleep
 
-from extractor import MultipleQueryExtractor
-from extractor.source_database.postgres import PostgresConnection
-from loader import ElasticsearchLoader
-from state.persistent_state_manager import JsonFileStorage
+from pipeline import (
+    ConnectionRegistry,
+    PipelineRunner,
+    default_pipeline_settings,
+    load_pipeline_settings,
+)
+from profiling.cycle_profiler import CycleProfiler
+from profiling.slow_operations import SLOW_OPERATION_LOG
 from util.common.backoff import backoff
 from util.configuration import LOGGER, read_app_config
 
@@ -14,106 +16,57 @@ from util.configuration import LOGGER, read_app_config
 @backoff(factor=2)
 def run_etl_process():
     """
-        Run an ETL process for moving data from a Postgres database to an Elasticsearch index.
+        Run an ETL process for moving data from Postgres databases to Elasticsearch indices.
 
-        Uses a Multiple Query Data handling strategy to extract data from Postgres.
-    """
-
-    with closing(PostgresConnection(dsn=dsn_postgres)) as pg_conn:
-
-        extractor = MultipleQueryExtractor(
-            db_connection=pg_conn,
-            entities_update_schema=entities_update_schema,
-            persistant_state_storage=JsonFileStorage.create_storage(),
-        )
-
-        loader = ElasticsearchLoader(
-            host=elasticsearch_host,
-            index_name=elasticsearch_index_schema['index_name'],
-            index_settings=elasticsearch_index_schema['index_settings'],
-        )
-
-        while True:
-            configurations = read_app_config()
-            pg_conn.package_limit = configurations['PAGE_DATA_SIZE_LIMIT']
-            process_sleep_time = configurations["PROCESS_SLEEP_TIME"]
+        Every pipeline keeps a `movies` index and its derived `persons` and `genres`
+        indices up to date from the same extraction pass and bulk stream. Pipelines are
+        declared in the `PIPELINES_CONFIG` file, without it the `movies` pipeline
+        configured by the environment is run. All pipelines run in this process:
+        pipelines on the same database or cluster share the connection, and a common
+        scheduler runs every pipeline when it is due.
 
-            processed_data_count = 0
-            try:
-                collected_movies_data = extractor.extract_data()
-            except Exception:
-                raise
+        Uses a Multiple Query Data handling strategy to extract data from Postgres.
+        The tables and indexes these queries depend on are checked on start.
 
-            if collected_movies_data:
-                processed_data_count += len(collected_movies_data)
-                LOGGER.info('Number of found data to be load: %s', processed_data_count)
+        Transient Postgres and Elasticsearch errors are retried per failed call
+        by the retry policies of the shared connections. A pipeline whose cycle fails
+        nevertheless is rolled back and retried with backoff on its own, the other
+        pipelines keep running.
 
-                loader.load_data(documents=collected_movies_data)
+        Extracted data is written to a local write-ahead spool per pipeline first and
+        drained to Elasticsearch from there, so extraction goes on during Elasticsearch
+        outages.
 
-                loader.delete_outdated_data(source_data_provider=pg_conn)
+        The next cycles are profiled on `SIGUSR1`, on `POST /profile` to the profiler
+        toggle port or after a slow cycle. Slow queries and bulk requests are recorded
+        in the profile directory.
+    """
 
-            LOGGER.info(
-                f'ETL process finished.\n \
-                  Number of data loaded: {processed_data_count}\n \
-                  Next processing in {process_sleep_time} seconds.',
-            )
+    configurations = read_app_config()
+    registry = ConnectionRegistry(
+        package_limit=configurations['PAGE_DATA_SIZE_LIMIT'],
+        statement_timeout=configurations['STATEMENT_TIMEOUT'],
+        slow_query_threshold=configurations['SLOW_QUERY_THRESHOLD'],
+    )
 
-            sleep(process_sleep_time)
+    runner = PipelineRunner(pipeline_settings, registry, profiler)
+    with closing(registry), closing(runner):
+        runner.run()
 
 
 if __name__ == '__main__':
     LOGGER.debug('%s', 'start etl process')
 
-    dsn_postgres = {
-        'dbname': os.getenv('PG_DB_NAME'),
-        'user': os.getenv('PG_USER'),
-        'password': os.getenv('PG_PASSWORD'),
-        'host': os.getenv('PG_HOST'),
-        'port': os.getenv('PG_PORT'),
-        'options': '-c search_path=content',
-    }
-
-    elasticsearch_host = {
-        'scheme': 'http',
-        'host': os.getenv('ELASTICSEARCH_HOST'),
-        'port': int(os.getenv('ELASTICSEARCH_PORT')),
-    }
-
-    with open('loader/elasticsearch/settings/movies_schema.json') as elasticsearch_index_schema:
-        elasticsearch_index_schema = {
-            'index_name': 'movies',
-            'index_settings': json.load(elasticsearch_index_schema),
-        }
-
-    entities_update_schema = {
-        'updateMovie': {
-            'producer': {
-                'entity_name': 'film_work',
-            },
-            'enricher': None,
-        },
-        'updatePerson': {
-            'producer': {
-                'entity_name': 'person',
-            },
-            'enricher': {
-                'entity_name': 'film_work',
-                'relation_table': 'person_film_work',
-                'parent_key': 'film_work_id',
-                'child_key': 'person_id',
-            },
-        },
-        'updateGenre': {
-            'producer': {
-                'entity_name': 'genre',
-            },
-            'enricher': {
-                'entity_name': 'film_work',
-                'relation_table': 'genre_film_work',
-                'parent_key': 'film_work_id',
-                'child_key': 'genre_id',
-            },
-        },
-    }
+    if os.getenv('PIPELINES_CONFIG'):
+        pipeline_settings = load_pipeline_settings(os.getenv('PIPELINES_CONFIG'))
+    else:
+        pipeline_settings = [default_pipeline_settings()]
+
+    # Created once, the toggle keeps its port while the process is restarted by `backoff`.
+    profiler = CycleProfiler.create_profiler()
+    profiler.install_signal_handler()
+    if os.getenv('PROFILER_HTTP_PORT'):
+        profiler.start_http_toggle(port=int(os.getenv('PROFILER_HTTP_PORT')))
+    SLOW_OPERATION_LOG.directory = profiler.directory
 
     run_etl_process()
@@ -0,0 +1,4 @@
+from .pipeline import Pipeline, create_batch_size_controllers
+from .registry import ConnectionRegistry, create_retry_policies
+from .runner import PipelineRunner
+from .settings import default_pipeline_settings, load_pipeline_settings
@@ -0,0 +1,326 @@
+from time import monotonic
+from typing import Dict, List
+
+from data.dataclasses import Movie
+from etl_settings import SPOOL_SETTINGS
+from extractor import MultipleQueryExtractor
+from extractor.source_database.postgres import PostgresPreflight
+from loader import ElasticsearchLoader
+from pipeline.registry import (
+    ELASTICSEARCH_TRANSIENT_ERRORS,
+    POSTGRES_TRANSIENT_ERRORS,
+    ConnectionRegistry,
+)
+from spool.write_ahead_spool import SpoolFullError, WriteAheadSpool
+from state.persistent_state_manager import JsonFileStorage
+from util.common.batch_size_controller import AIMDBatchSizeController
+from util.common.retry_policy import CircuitOpenError
+from util.configuration import LOGGER
+from verifier.range_checksum_verifier import RangeChecksumVerifier
+
+
+def create_batch_size_controllers(configurations: dict) -> Dict[str, AIMDBatchSizeController]:
+    """
+    Create the adaptive batch size controllers of the extractor queries.
+
+    Args:
+        configurations (dict): the application configurations
+
+    Returns:
+        dict: the controllers by query type, empty if adaptive batch sizing is disabled
+    """
+    if not configurations['ADAPTIVE_BATCH_SIZE']:
+        return {}
+
+    return {
+        query_name: AIMDBatchSizeController(
+            name=query_name,
+            initial_size=configurations['PAGE_DATA_SIZE_LIMIT'],
+            target_latency=configurations[f'{query_name.upper()}_TARGET_LATENCY'],
+            min_size=configurations['BATCH_SIZE_MIN'],
+            max_size=configurations['BATCH_SIZE_MAX'],
+        )
+        for query_name in ('producer', 'enricher', 'merger')
+    }
+
+
+class Pipeline:
+    """
+    One source-to-index pipeline: an update schema, the indices it feeds and its state.
+
+    The pipeline extracts the changed films from its Postgres database with a
+    Multiple Query Extractor, spools the bulk actions to a local write-ahead spool
+    and drains them to its Elasticsearch indices. The producer states and the spool
+    are kept in the state namespace of the pipeline, the Postgres connection and
+    the Elasticsearch client are taken from the shared connection registry.
+    """
+
+    def __init__(self, *, settings: dict, registry: ConnectionRegistry, configurations: dict):
+        """
+        Initialize a Pipeline object and check its tables and indexes.
+
+        Args:
+            settings (dict): The pipeline settings, see `pipeline.settings`.
+            registry (ConnectionRegistry): The connections shared by the pipelines.
+            configurations (dict): The application configurations.
+        """
+        LOGGER.debug("Initialize %s %s", type(self).__name__, settings['name'])
+        self.name = settings['name']
+        self.configuration_overrides = settings['configurations']
+        configurations = self.configurations(configurations)
+
+        self.db_connection, self.postgres_policy = registry.postgres(settings['postgres_dsn'])
+        loader_settings = settings['loader_settings']
+        es_client, self.elasticsearch_policy = registry.elasticsearch(
+            settings['elasticsearch_hosts'],
+            loader_settings.get('transport_settings'),
+        )
+
+        PostgresPreflight(self.db_connection, settings['entities_update_schema']).run(
+            create_missing_indexes=configurations['PREFLIGHT_CREATE_INDEXES'],
+        )
+
+        index_schema = settings['index_schema']
+        self.loader = ElasticsearchLoader(
+            host=settings['elasticsearch_hosts'],
+            index_name=index_schema['index_name'],
+            index_settings=index_schema['index_settings'],
+            derived_indices=settings['derived_indices'],
+            client=es_client,
+            **loader_settings,
+        )
+
+        self.extractor = MultipleQueryExtractor(
+            db_connection=self.db_connection,
+            entities_update_schema=settings['entities_update_schema'],
+            persistant_state_storage=JsonFileStorage.create_storage(settings['state_namespace']),
+            retry_policy=self.postgres_policy,
+            batch_size_controllers=create_batch_size_controllers(configurations),
+            derived_documents=settings['derived_documents'],
+            lane_settings=settings['lane_settings'],
+            linked_documents_provider=self.select_linked_document_ids,
+            film_work_transform=self.loader.prepare_film_work_lines,
+        )
+
+        self.derived_index_names = [
+            derived_index['index_name'] for derived_index in settings['derived_indices'].values()
+        ]
+
+        self.spool = WriteAheadSpool.create_spool(settings['state_namespace'], **SPOOL_SETTINGS)
+
+        self.verifier = RangeChecksumVerifier(extractor=self.extractor, loader=self.loader)
+        self.last_reconciled_at = monotonic()
+        self.next_run_at = 0
+
+    def configurations(self, configurations: dict) -> dict:
+        """
+        Return the application configurations with the overrides of the pipeline.
+
+        Args:
+            configurations (dict): The application configurations.
+
+        Returns:
+            dict: The configurations of the pipeline.
+        """
+        return {**configurations, **self.configuration_overrides}
+
+    def run_cycle(self, configurations: dict) -> int:
+        """
+        Extract, spool and load the changes of one cycle and schedule the next one.
+
+        Args:
+            configurations (dict): The configurations of the pipeline.
+
+        Returns:
+            int: The number of loaded actions.
+        """
+        extractor = self.extractor
+        self.db_connection.package_limit = configurations['PAGE_DATA_SIZE_LIMIT']
+        self.db_connection.slow_query_threshold = configurations['SLOW_QUERY_THRESHOLD']
+        extractor.scheduler.budget = configurations['LANE_CYCLE_BUDGET'] or None
+        extractor.coalescer.window = configurations['COALESCE_WINDOW']
+        extractor.coalescer.max_delay = configurations['COALESCE_MAX_DELAY']
+        self.verifier.statement_timeout = configurations['RECONCILE_STATEMENT_TIMEOUT'] or None
+        process_sleep_time = configurations['PROCESS_SLEEP_TIME']
+
+        try:
+            collected_movies_data = extractor.extract_data()
+        except CircuitOpenError as error:
+            LOGGER.warning('[%s] Skip extraction: %s', self.name, error)
+            extractor.rollback_state()
+            collected_movies_data = []
+
+        try:
+            self.spool.append_lines(self.loader.prepare_lines(documents=collected_movies_data))
+        except SpoolFullError as error:
+            LOGGER.warning(
+                '[%s] Pause extraction, the data will be extracted again: %s',
+                self.name,
+                error,
+            )
+            extractor.rollback_state()
+        else:
+            extractor.commit_state()
+
+        LOGGER.info(
+            '[%s] Number of found data to be load: %s',
+            self.name,
+            len(collected_movies_data),
+        )
+
+        processed_data_count = self.drain_spool(batch_size=configurations['PAGE_DATA_SIZE_LIMIT'])
+
+        if processed_data_count:
+            try:
+                self.elasticsearch_policy.call(
+                    self.loader.delete_outdated_data,
+                    source_data_provider=self.db_connection,
+                    index_names=[self.loader.index_name],
+                    before_delete=self.reconcile_linked_documents,
+                )
+            except (CircuitOpenError, *ELASTICSEARCH_TRANSIENT_ERRORS) as error:
+                LOGGER.warning('[%s] Skip deletion of outdated data: %s', self.name, error)
+            except POSTGRES_TRANSIENT_ERRORS as error:
+                LOGGER.warning('[%s] Skip deletion of outdated data: %s', self.name, error)
+                self.db_connection.reset(error)
+
+        reconcile_interval = configurations['RECONCILE_INTERVAL']
+        if reconcile_interval and monotonic() - self.last_reconciled_at >= reconcile_interval:
+            self.reconcile()
+            self.last_reconciled_at = monotonic()
+
+        metrics_extra = {'pipeline': self.name, 'rate_limited': True}
+        LOGGER.info(
+            '[%s] Coalescer metrics: %s',
+            self.name,
+            extractor.coalescer.metrics(),
+            extra=metrics_extra,
+        )
+        LOGGER.info(
+            '[%s] Lane metrics: %s',
+            self.name,
+            extractor.scheduler.metrics(),
+            extra=metrics_extra,
+        )
+        LOGGER.info('[%s] Spool metrics: %s', self.name, self.spool.metrics(), extra=metrics_extra)
+        LOGGER.info(
+            '[%s] ETL process finished. Number of data loaded: %s. '
+            'Next processing in %s seconds.',
+            self.name,
+            processed_data_count,
+            process_sleep_time,
+            extra={'pipeline': self.name, 'loaded_count': processed_data_count},
+        )
+
+        self.next_run_at = monotonic() + process_sleep_time
+        return processed_data_count
+
+    def rollback(self, error: Exception) -> None:
+        """
+        Make the pipeline ready for another cycle after a failed one.
+
+        The films of the failed extraction are put back into their lanes, the data
+        is extracted again. The Postgres connection is reset, so an aborted transaction
+        doesn't fail the other pipelines sharing the connection.
+
+        Args:
+            error (Exception): The error which failed the cycle.
+        """
+        self.extractor.rollback_state()
+
+        try:
+            self.db_connection.reset(error)
+        except POSTGRES_TRANSIENT_ERRORS as reset_error:
+            LOGGER.warning('[%s] Postgres connection not reset: %s', self.name, reset_error)
+
+    def close(self) -> None:
+        """Close the connections of the pipeline which aren't shared by the registry."""
+        self.loader.close()
+
+    def drain_spool(self, batch_size: int) -> int:
+        """
+        Load the spooled actions to Elasticsearch in order.
+
+        Stops at the first batch that can't be loaded, the batch stays
+        in the spool and is loaded again in the next cycle.
+
+        Args:
+            batch_size (int): the number of actions per bulk request
+
+        Returns:
+            int: the number of loaded actions
+        """
+        loaded_count = 0
+        while True:
+            actions, position = self.spool.read_batch(max_records=batch_size)
+            if not actions:
+                return loaded_count
+
+            try:
+                self.elasticsearch_policy.call(self.loader.load_actions, actions=actions)
+            except (CircuitOpenError, *ELASTICSEARCH_TRANSIENT_ERRORS) as error:
+                LOGGER.warning(
+                    '[%s] Elasticsearch unavailable, keep data in spool: %s',
+                    self.name,
+                    error,
+                )
+                return loaded_count
+
+            self.spool.commit(position)
+            loaded_count += len(actions)
+
+    def select_linked_document_ids(self, film_work_ids: List[str]) -> Dict[type, List[str]]:
+        """
+        Return the IDs of the persons and genres linked to the films in the derived indices.
+
+        Args:
+            film_work_ids (List[str]): The film work IDs.
+
+        Returns:
+            Dict[type, List[str]]: The document IDs by derived document class.
+        """
+        return self.elasticsearch_policy.call(
+            self.loader.select_linked_document_ids,
+            film_work_ids=film_work_ids,
+        )
+
+    def reconcile_linked_documents(self, document_class: type, document_ids: List[str]) -> None:
+        """
+        Queue the persons and genres linked to deleted movies in the reconciliation lane.
+
+        Must be called before the movies are deleted, the genres are found
+        by the genres of the indexed movies.
+
+        Args:
+            document_class (type): The class of the deleted documents.
+            document_ids (List[str]): The IDs of the deleted documents.
+        """
+        if document_class is not Movie or not self.derived_index_names:
+            return
+
+        self.extractor.reconcile_derived_documents(self.select_linked_document_ids(document_ids))
+
+    def reconcile(self) -> None:
+        """
+        Verify the movies index and queue the divergent films in the reconciliation lane.
+
+        Documents missing in Postgres are deleted right away, the outdated documents
+        of the derived indices too. The verification queries read whole ID ranges,
+        they run with the `RECONCILE_STATEMENT_TIMEOUT`, a cancelled verification is skipped.
+        """
+        try:
+            report = self.verifier.verify(repair=False)
+            self.extractor.reconcile(report['reindexed'])
+            if report['deleted']:
+                self.reconcile_linked_documents(Movie, report['deleted'])
+                self.loader.delete_documents(report['deleted'])
+            if self.derived_index_names:
+                self.loader.delete_outdated_data(
+                    source_data_provider=self.db_connection,
+                    index_names=self.derived_index_names,
+                )
+        except POSTGRES_TRANSIENT_ERRORS as error:
+            LOGGER.warning('[%s] Skip reconciliation: %s', self.name, error)
+            self.db_connection.reset(error)
+        except (CircuitOpenError, *ELASTICSEARCH_TRANSIENT_ERRORS, ValueError) as error:
+            LOGGER.warning('[%s] Skip reconciliation: %s', self.name, error)
@@ -0,0 +1,175 @@
+import json
+from typing import Dict, List, Optional, Tuple, Union
+
+import psycopg2
+from elasticsearch import ConnectionError as ElasticsearchConnectionError
+from elasticsearch import ConnectionTimeout as ElasticsearchConnectionTimeout
+from elasticsearch import Elasticsearch
+
+from etl_settings import RETRY_SETTINGS
+from extractor.source_database.postgres import PostgresConnection
+from loader import ElasticsearchLoader
+from util.common.retry_policy import CircuitBreaker, RetryPolicy
+from util.configuration import LOGGER
+
+POSTGRES_TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+ELASTICSEARCH_TRANSIENT_ERRORS = (ElasticsearchConnectionError, ElasticsearchConnectionTimeout)
+
+
+def create_postgres_policy(pg_conn: PostgresConnection) -> RetryPolicy:
+    """
+    Create the retry policy of the calls to a Postgres connection.
+
+    A failed call resets the connection before it is retried.
+
+    Args:
+        pg_conn (PostgresConnection): the Postgres connection
+
+    Returns:
+        RetryPolicy: the Postgres retry policy
+    """
+    postgres_settings = RETRY_SETTINGS['postgres']
+    return RetryPolicy(
+        name='postgres',
+        retry_on=POSTGRES_TRANSIENT_ERRORS,
+        circuit_breaker=CircuitBreaker('postgres', **postgres_settings['circuit_breaker']),
+        on_retry=pg_conn.reset,
+        **postgres_settings['retry'],
+    )
+
+
+def create_elasticsearch_policy() -> RetryPolicy:
+    """
+    Create the retry policy of the calls to an Elasticsearch cluster.
+
+    Returns:
+        RetryPolicy: the Elasticsearch retry policy
+    """
+    es_settings = RETRY_SETTINGS['elasticsearch']
+    return RetryPolicy(
+        name='elasticsearch',
+        retry_on=ELASTICSEARCH_TRANSIENT_ERRORS,
+        circuit_breaker=CircuitBreaker('elasticsearch', **es_settings['circuit_breaker']),
+        **es_settings['retry'],
+    )
+
+
+def create_retry_policies(pg_conn: PostgresConnection) -> Tuple[RetryPolicy, RetryPolicy]:
+    """
+    Create the retry policies of the Postgres and the Elasticsearch calls.
+
+    Args:
+        pg_conn (PostgresConnection): the Postgres connection
+
+    Returns:
+        Tuple[RetryPolicy, RetryPolicy]: the Postgres and the Elasticsearch retry policy
+    """
+    return create_postgres_policy(pg_conn), create_elasticsearch_policy()
+
+
+class ConnectionRegistry:
+    """
+    Connections shared by the pipelines of one process.
+
+    Pipelines with the same Postgres DSN share one connection, pipelines with
+    the same Elasticsearch hosts and transport settings share one client and its
+    connection pools. Every shared connection comes with its own retry policy,
+    so the circuit of an unavailable database or cluster opens for all of its
+    pipelines at once. The pipelines run one after another in the same thread,
+    a connection is never used concurrently.
+    """
+
+    def __init__(
+        self,
+        package_limit: int = 1000,
+        statement_timeout: Optional[float] = None,
+        slow_query_threshold: Optional[float] = None,
+    ):
+        """
+        Initialize a ConnectionRegistry object.
+
+        Args:
+            package_limit (int): The initial row limit of the Postgres connections,
+                the pipelines set their own before every cycle. Defaults to 1000.
+            statement_timeout (float, optional): The `statement_timeout` of the Postgres
+                sessions in seconds. Defaults to None (no timeout).
+            slow_query_threshold (float, optional): The duration in seconds after which
+                the plan of a query is captured. Defaults to None (disabled).
+        """
+        LOGGER.debug("Initialize %s", type(self).__name__)
+        self.package_limit = package_limit
+        self.statement_timeout = statement_timeout
+        self.slow_query_threshold = slow_query_threshold
+
+        self.postgres_connections: Dict[str, Tuple[PostgresConnection, RetryPolicy]] = {}
+        self.elasticsearch_clients: Dict[str, Tuple[Elasticsearch, RetryPolicy]] = {}
+
+    def postgres(self, dsn: dict) -> Tuple[PostgresConnection, RetryPolicy]:
+        """
+        Return the shared connection to a Postgres database.
+
+        Args:
+            dsn (dict): The data source name of the database.
+
+        Returns:
+            Tuple[PostgresConnection, RetryPolicy]: The connection and its retry policy.
+        """
+        key = json.dumps(dsn, sort_keys=True, default=str)
+        if key not in self.postgres_connections:
+            LOGGER.info('Connect to Postgres database %s on %s', dsn.get('dbname'), dsn.get('host'))
+            pg_conn = PostgresConnection(
+                dsn=dsn,
+                package_limit=self.package_limit,
+                statement_timeout=self.statement_timeout,
+                slow_query_threshold=self.slow_query_threshold,
+            )
+            self.postgres_connections[key] = (pg_conn, create_postgres_policy(pg_conn))
+
+        return self.postgres_connections[key]
+
+    def elasticsearch(
+        self,
+        host: Union[dict, List[dict]],
+        transport_settings: Optional[dict] = None,
+    ) -> Tuple[Elasticsearch, RetryPolicy]:
+        """
+        Return the shared client of an Elasticsearch cluster.
+
+        Args:
+            host (Union[dict, List[dict]]): The connection parameters of the nodes.
+            transport_settings (dict, optional): Options of the client transport.
+
+        Returns:
+            Tuple[Elasticsearch, RetryPolicy]: The client and its retry policy.
+        """
+        key = json.dumps([host, transport_settings], sort_keys=True, default=str)
+        if key not in self.elasticsearch_clients:
+            LOGGER.info('Connect to Elasticsearch %s', host)
+            self.elasticsearch_clients[key] = (
+                ElasticsearchLoader.create_client(host, transport_settings),
+                create_elasticsearch_policy(),
+            )
+
+        return self.elasticsearch_clients[key]
+
+    def metrics(self) -> dict:
+        """
+        Return the number of shared connections.
+
+        Returns:
+            dict: the number of Postgres connections and Elasticsearch clients
+        """
+        return {
+            'postgres_connections': len(self.postgres_connections),
+            'elasticsearch_clients': len(self.elasticsearch_clients),
+        }
+
+    def close(self) -> None:
+        """Close all connections."""
+        for pg_conn, _ in self.postgres_connections.values():
+            pg_conn.close()
+        for es_client, _ in self.elasticsearch_clients.values():
+            es_client.close()
+
+        self.postgres_connections = {}
+        self.elasticsearch_clients = {}
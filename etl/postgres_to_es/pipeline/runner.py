@@ -0,0 +1,161 @@
+from collections import defaultdict
+from time import monotonic, sleep
+from typing import Dict, List
+
+from loader.elasticsearch.transport import NODE_LATENCY_TRACKER
+from pipeline.pipeline import Pipeline
+from pipeline.registry import ConnectionRegistry
+from profiling.cycle_profiler import CycleProfiler
+from util.configuration import LOGGER, read_app_config
+
+# The delay in seconds after the first failure of a pipeline, doubled per further failure.
+FAILURE_BASE_DELAY = 1
+FAILURE_MAX_DELAY = 300
+
+
+class PipelineRunner:
+    """
+    Common scheduler of the pipelines of one process.
+
+    Every pipeline is due `PROCESS_SLEEP_TIME` seconds (its own, if overridden)
+    after its last cycle ended. The due pipelines run one after another in the
+    order they became due, then the runner sleeps until the next one is due.
+    The cycles of one round are profiled together.
+
+    The pipelines are isolated from each other: a pipeline which can't be started
+    or whose cycle fails, e.g. during an outage of its database, is rolled back
+    and retried with exponential backoff on its own, the others keep running.
+    """
+
+    def __init__(
+        self,
+        pipeline_settings: List[dict],
+        registry: ConnectionRegistry,
+        profiler: CycleProfiler,
+    ):
+        """
+        Initialize a PipelineRunner object.
+
+        Args:
+            pipeline_settings (List[dict]): The settings of the pipelines to run,
+                see `pipeline.settings`.
+            registry (ConnectionRegistry): The connections shared by the pipelines.
+            profiler (CycleProfiler): The profiler of the rounds.
+        """
+        LOGGER.debug("Initialize %s", type(self).__name__)
+        self.pipeline_settings = {settings['name']: settings for settings in pipeline_settings}
+        self.registry = registry
+        self.profiler = profiler
+
+        self.pipelines: Dict[str, Pipeline] = {}
+        self.next_start_at = dict.fromkeys(self.pipeline_settings, 0)
+        self.failure_counts: Dict[str, int] = defaultdict(int)
+
+    def run(self) -> None:
+        """Start and run the pipelines."""
+        LOGGER.info('Run pipelines %s', list(self.pipeline_settings))
+
+        while True:
+            configurations = read_app_config()
+            NODE_LATENCY_TRACKER.slow_request_threshold = configurations['SLOW_BULK_THRESHOLD']
+            self.profiler.slow_cycle_threshold = configurations['SLOW_CYCLE_THRESHOLD']
+            self.profiler.cycles = configurations['PROFILE_CYCLES']
+            self.profiler.mode = configurations['PROFILE_MODE']
+
+            self._start_pipelines(configurations)
+
+            now = monotonic()
+            due_pipelines = sorted(
+                (pipeline for pipeline in self.pipelines.values() if pipeline.next_run_at <= now),
+                key=lambda pipeline: pipeline.next_run_at,
+            )
+
+            if due_pipelines:
+                with self.profiler.profile_cycle():
+                    for pipeline in due_pipelines:
+                        self._run_cycle(pipeline, configurations)
+
+                LOGGER.info('Elasticsearch node latency: %s', NODE_LATENCY_TRACKER.summary())
+
+            next_run_at = min(
+                [pipeline.next_run_at for pipeline in self.pipelines.values()]
+                + list(self.next_start_at.values()),
+            )
+            sleep(max(next_run_at - monotonic(), 0))
+
+    def close(self) -> None:
+        """Close the started pipelines."""
+        for pipeline in self.pipelines.values():
+            pipeline.close()
+
+        self.pipelines = {}
+        self.next_start_at = dict.fromkeys(self.pipeline_settings, 0)
+
+    def _start_pipelines(self, configurations: dict) -> None:
+        """
+        Create the pipelines which are due to be started.
+
+        Args:
+            configurations (dict): The application configurations.
+        """
+        now = monotonic()
+        for name, start_at in list(self.next_start_at.items()):
+            if start_at > now:
+                continue
+
+            try:
+                self.pipelines[name] = Pipeline(
+                    settings=self.pipeline_settings[name],
+                    registry=self.registry,
+                    configurations=configurations,
+                )
+            except Exception as error:
+                delay = self._failure_delay(name)
+                LOGGER.exception(
+                    '[%s] Pipeline not started, next try in %s seconds: %s',
+                    name,
+                    delay,
+                    error,
+                )
+                self.next_start_at[name] = monotonic() + delay
+                continue
+
+            del self.next_start_at[name]
+            self.failure_counts.pop(name, None)
+            LOGGER.info('[%s] Pipeline started with %s', name, self.registry.metrics())
+
+    def _run_cycle(self, pipeline: Pipeline, configurations: dict) -> None:
+        """
+        Run a cycle of a pipeline and roll it back if it fails.
+
+        Args:
+            pipeline (Pipeline): The pipeline.
+            configurations (dict): The application configurations.
+        """
+        try:
+            pipeline.run_cycle(pipeline.configurations(configurations))
+        except Exception as error:
+            delay = self._failure_delay(pipeline.name)
+            LOGGER.exception(
+                '[%s] Cycle failed, next try in %s seconds: %s',
+                pipeline.name,
+                delay,
+                error,
+            )
+            pipeline.rollback(error)
+            pipeline.next_run_at = monotonic() + delay
+        else:
+            self.failure_counts.pop(pipeline.name, None)
+
+    def _failure_delay(self, name: str) -> float:
+        """
+        Count a failure of a pipeline and return the delay before its next try.
+
+        Args:
+            name (str): The pipeline name.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        self.failure_counts[name] += 1
+        return min(FAILURE_BASE_DELAY * 2 ** (self.failure_counts[name] - 1), FAILURE_MAX_DELAY)
@@ -0,0 +1,201 @@
+"""
+Settings of the pipelines run by one ETL process.
+
+Without a pipeline file the process runs the `movies` pipeline configured by
+the environment, see `etl_settings`. A pipeline file declares several pipelines
+in TOML, e.g. `pipelines.toml`:
+
+    [defaults]
+    elasticsearch_hosts = "${ELASTICSEARCH_HOST}:${ELASTICSEARCH_PORT}"
+
+    [defaults.postgres]
+    dbname = "${PG_DB_NAME}"
+    options = "-c search_path=content"
+
+    [[pipelines]]
+    name = "movies"
+    index = {name = "movies", settings = "loader/elasticsearch/settings/movies_schema.json"}
+
+    [pipelines.update_schema.updateMovie]
+    producer = {entity_name = "film_work"}
+    lane = "film"
+
+`${NAME}` is replaced with the environment variable. The `defaults` apply to
+every pipeline, the `postgres` and `settings` tables are merged key by key.
+"""
+import json
+import os
+import tomllib
+from typing import Any, List
+
+from data.dataclasses import Genre, Person
+from etl_settings import (
+    ENTITIES_UPDATE_SCHEMA,
+    LANE_SETTINGS,
+    get_elasticsearch_host,
+    get_loader_settings,
+    get_postgres_dsn,
+    load_elasticsearch_indices,
+)
+from extractor import MultipleQueryExtractor
+from loader.elasticsearch.transport import parse_hosts
+
+# The document classes and default source tables of the derived indices.
+DERIVED_DOCUMENTS = {
+    MultipleQueryExtractor.PERSON_DOCUMENT: (Person, 'person'),
+    MultipleQueryExtractor.GENRE_DOCUMENT: (Genre, 'genre'),
+}
+
+# The tables of the defaults which are merged with the tables of a pipeline.
+MERGED_TABLES = ('postgres', 'settings')
+
+
+def default_pipeline_settings() -> dict:
+    """
+    Return the settings of the `movies` pipeline configured by the environment.
+
+    The pipeline keeps the state file and spool directory of the ETL process.
+
+    Returns:
+        dict: the pipeline settings
+    """
+    elasticsearch_index_schema, derived_elasticsearch_indices = load_elasticsearch_indices()
+
+    return {
+        'name': 'movies',
+        'state_namespace': None,
+        'postgres_dsn': get_postgres_dsn(),
+        'elasticsearch_hosts': get_elasticsearch_host(),
+        'loader_settings': get_loader_settings(),
+        'entities_update_schema': ENTITIES_UPDATE_SCHEMA,
+        'lane_settings': LANE_SETTINGS,
+        'index_schema': elasticsearch_index_schema,
+        'derived_indices': derived_elasticsearch_indices,
+        'derived_documents': (
+            MultipleQueryExtractor.PERSON_DOCUMENT,
+            MultipleQueryExtractor.GENRE_DOCUMENT,
+        ),
+        'configurations': {},
+    }
+
+
+def load_pipeline_settings(path: str) -> List[dict]:
+    """
+    Load the settings of the pipelines declared in a TOML file.
+
+    Args:
+        path (str): the path of the pipeline file
+
+    Raises:
+        ValueError: If the file declares no pipelines, a pipeline misses a setting,
+            or two pipelines share a name or state namespace.
+
+    Returns:
+        List[dict]: the settings of every pipeline
+    """
+    with open(path, 'rb') as pipeline_file:
+        declaration = _expand_environment(tomllib.load(pipeline_file))
+
+    defaults = declaration.get('defaults', {})
+    pipelines = [
+        _pipeline_settings(_merge_defaults(defaults, pipeline))
+        for pipeline in declaration.get('pipelines', [])
+    ]
+    if not pipelines:
+        raise ValueError(f'no pipelines declared in {path}')
+
+    for key in ('name', 'state_namespace'):
+        values = [pipeline[key] for pipeline in pipelines]
+        duplicates = {value for value in values if values.count(value) > 1}
+        if duplicates:
+            raise ValueError(f'pipelines share the {key} {sorted(duplicates)}')
+
+    return pipelines
+
+
+def _pipeline_settings(declaration: dict) -> dict:
+    """
+    Build the settings of a pipeline from its declaration.
+
+    Args:
+        declaration (dict): the pipeline declaration merged with the defaults
+
+    Raises:
+        ValueError: If the declaration misses a required setting.
+
+    Returns:
+        dict: the pipeline settings
+    """
+    for key in ('name', 'postgres', 'elasticsearch_hosts', 'index', 'update_schema'):
+        if key not in declaration:
+            raise ValueError(f"pipeline {declaration.get('name')} misses the setting {key}")
+
+    elasticsearch_hosts = declaration['elasticsearch_hosts']
+    if isinstance(elasticsearch_hosts, str):
+        elasticsearch_hosts = parse_hosts(elasticsearch_hosts)
+
+    entities_update_schema = {
+        schema_name: {'enricher': None, **update_schema}
+        for schema_name, update_schema in declaration['update_schema'].items()
+    }
+
+    derived_indices = {}
+    for derived_index in declaration.get('derived_indices', []):
+        document_class, source_entity = DERIVED_DOCUMENTS[derived_index['document']]
+        derived_indices[document_class] = {
+            'index_name': derived_index['name'],
+            'index_settings': _load_index_settings(derived_index['settings']),
+            'source_entity': derived_index.get('source_entity', source_entity),
+        }
+
+    loader_settings = get_loader_settings()
+    loader_settings['transport_settings'].update(declaration.get('transport', {}))
+    if 'bulk_routing' in declaration:
+        loader_settings['bulk_routing'] = declaration['bulk_routing']
+
+    return {
+        'name': declaration['name'],
+        'state_namespace': declaration.get('state_namespace', declaration['name']),
+        'postgres_dsn': declaration['postgres'],
+        'elasticsearch_hosts': elasticsearch_hosts,
+        'loader_settings': loader_settings,
+        'entities_update_schema': entities_update_schema,
+        'lane_settings': declaration.get('lanes', LANE_SETTINGS),
+        'index_schema': {
+            'index_name': declaration['index']['name'],
+            'index_settings': _load_index_settings(declaration['index']['settings']),
+        },
+        'derived_indices': derived_indices,
+        'derived_documents': tuple(
+            derived_index['document'] for derived_index in declaration.get('derived_indices', [])
+        ),
+        'configurations': declaration.get('settings', {}),
+    }
+
+
+def _merge_defaults(defaults: dict, declaration: dict) -> dict:
+    """Apply the defaults to a pipeline declaration."""
+    merged = {**defaults, **declaration}
+    for table in MERGED_TABLES:
+        if table in defaults and table in declaration:
+            merged[table] = {**defaults[table], **declaration[table]}
+
+    return merged
+
+
+def _load_index_settings(path: str) -> dict:
+    """Load the settings and mappings of an index from a JSON file."""
+    with open(path) as index_schema:
+        return json.load(index_schema)
+
+
+def _expand_environment(value: Any) -> Any:
+    """Replace the environment variables in all strings of a declaration."""
+    if isinstance(value, str):
+        return os.path.expandvars(value)
+    if isinstance(value, dict):
+        return {key: _expand_environment(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_expand_environment(item) for item in value]
+
+    return value
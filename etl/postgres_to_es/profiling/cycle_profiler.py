@@ -0,0 +1,355 @@
+import cProfile
+import json
+import pstats
+import signal
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from time import perf_counter
+from types import FrameType
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from util.configuration import LOGGER
+
+
+# The unit of the collapsed stacks converted from cProfile, in seconds: counts are microseconds.
+COLLAPSED_TIME_UNIT = 1e-6
+
+
+def frame_name(filename: str, line_number: int, function_name: str) -> str:
+    """Return the name of a function in a collapsed stack."""
+    if filename == '~':
+        return function_name
+    return f'{function_name} ({Path(filename).name}:{line_number})'
+
+
+def collapse_profile_stats(stats: pstats.Stats) -> Counter:
+    """
+    Convert cProfile statistics to collapsed stacks.
+
+    cProfile records the time per caller and callee only, not per stack. The stacks
+    are rebuilt from the functions without callers: the time of a function in a stack
+    is split into its own time and the time of every callee in proportion to the
+    totals recorded by cProfile. Recursive calls end a stack, branches below one
+    time unit are dropped.
+
+    Args:
+        stats (pstats.Stats): The statistics of a profile.
+
+    Returns:
+        Counter: The time per collapsed stack in microseconds.
+    """
+    callees: Dict[tuple, Dict[tuple, float]] = {}
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        for caller, (_, _, _, caller_cumulative_time) in callers.items():
+            callees.setdefault(caller, {})[function] = caller_cumulative_time
+
+    stacks = Counter()
+
+    def collapse(function: tuple, stack: Tuple[str, ...], stack_time: float) -> None:
+        _, _, own_time, cumulative_time, _ = stats.stats[function]
+        stack = stack + (frame_name(*function),)
+        if not cumulative_time:
+            return
+
+        own_stack_time = stack_time * min(own_time / cumulative_time, 1)
+        if own_stack_time >= COLLAPSED_TIME_UNIT:
+            stacks[';'.join(stack)] += round(own_stack_time / COLLAPSED_TIME_UNIT)
+
+        for callee, callee_time in callees.get(function, {}).items():
+            callee_stack_time = stack_time * callee_time / cumulative_time
+            if frame_name(*callee) in stack or callee_stack_time < COLLAPSED_TIME_UNIT:
+                continue
+            collapse(callee, stack, callee_stack_time)
+
+    for function, (_, _, _, cumulative_time, callers) in stats.stats.items():
+        if not callers:
+            collapse(function, (), cumulative_time)
+
+    return stacks
+
+
+def write_collapsed_stacks(stacks: Counter, profile_path: Path) -> None:
+    """Write collapsed stacks, the most frequent first."""
+    with open(profile_path, 'w') as profile_file:
+        for stack, count in stacks.most_common():
+            profile_file.write(f'{stack} {count}\n')
+
+
+class StackSampler:
+    """
+    Sampling profiler of a single thread.
+
+    A background thread takes the stack of the profiled thread every
+    `interval` seconds and counts the collapsed stacks, which is the input
+    format of `flamegraph.pl` and speedscope.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        """
+        Initialize a StackSampler object.
+
+        Args:
+            thread_id (int): The identifier of the thread to sample.
+            interval (float): The sampling interval in seconds. Defaults to 5 ms.
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+
+        self.stacks: Counter = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self) -> None:
+        """Start sampling."""
+        self.thread.start()
+
+    def stop(self) -> Counter:
+        """
+        Stop sampling.
+
+        Returns:
+            Counter: The number of samples per collapsed stack.
+        """
+        self.stopped.set()
+        self.thread.join()
+        return self.stacks
+
+    def _sample(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[self._collapse(frame)] += 1
+
+    @staticmethod
+    def _collapse(frame: FrameType) -> str:
+        """Return the stack of a frame as `;` separated functions, outermost first."""
+        functions = []
+        while frame is not None:
+            code = frame.f_code
+            functions.append(frame_name(code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+
+        return ';'.join(reversed(functions))
+
+
+class CycleProfiler:
+    """
+    Profile the next ETL cycles on demand.
+
+    Profiling is armed for a number of cycles by `SIGUSR1`, by the HTTP toggle
+    or automatically after a cycle slower than `slow_cycle_threshold`.
+    Every profiled cycle is written to its own `.folded` file of collapsed
+    stacks (input of `flamegraph.pl`): sample counts of the sampling profiler or
+    microseconds converted from cProfile. cProfile also writes a `.prof` file
+    (viewable with snakeviz or `python -m pstats`).
+
+    Only the thread running the cycle is profiled.
+    """
+
+    CPROFILE_MODE = 'cprofile'
+    SAMPLING_MODE = 'sampling'
+
+    def __init__(
+        self,
+        directory: str,
+        mode: str = CPROFILE_MODE,
+        cycles: int = 3,
+        slow_cycle_threshold: Optional[float] = None,
+        sample_interval: float = 0.005,
+    ):
+        """
+        Initialize a CycleProfiler object.
+
+        Args:
+            directory (str): The directory of the profile files.
+            mode (str): The default profiler, `cprofile` or `sampling`. Defaults to `cprofile`.
+            cycles (int): The number of cycles profiled when armed without a count. Defaults to 3.
+            slow_cycle_threshold (float, optional): The cycle duration in seconds after which
+                the next cycles are profiled automatically. Defaults to None (disabled).
+            sample_interval (float): The interval of the sampling profiler in seconds.
+                Defaults to 5 ms.
+        """
+        self.directory = Path(directory)
+        self.mode = mode
+        self.cycles = cycles
+        self.slow_cycle_threshold = slow_cycle_threshold
+        self.sample_interval = sample_interval
+
+        # Reentrant, as the signal handler runs in the thread that may hold the lock.
+        self.lock = threading.RLock()
+        self.remaining_cycles = 0
+        self.armed_mode = mode
+        self.last_cycle_duration = None
+
+    @classmethod
+    def create_profiler(cls, **kwargs):
+        """
+        Create a new instance of the CycleProfiler class with a default directory.
+
+        Returns:
+            CycleProfiler: A new instance of the CycleProfiler class.
+        """
+        return CycleProfiler('profiling/profile_data_storage', **kwargs)
+
+    def arm(self, cycles: Optional[int] = None, mode: Optional[str] = None) -> None:
+        """
+        Profile the next cycles.
+
+        Args:
+            cycles (int, optional): The number of cycles. Defaults to `cycles`.
+            mode (str, optional): The profiler, `cprofile` or `sampling`. Defaults to `mode`.
+
+        Raises:
+            ValueError: If the mode is unknown.
+        """
+        mode = mode or self.mode
+        if mode not in {self.CPROFILE_MODE, self.SAMPLING_MODE}:
+            raise ValueError(f'unknown profiler mode: {mode}')
+
+        with self.lock:
+            self.remaining_cycles = cycles or self.cycles
+            self.armed_mode = mode
+
+        LOGGER.info('Profile the next %s cycles with %s', cycles or self.cycles, mode)
+
+    def install_signal_handler(self, signal_number: int = signal.SIGUSR1) -> None:
+        """
+        Arm the profiler when the process receives a signal.
+
+        Args:
+            signal_number (int): The signal. Defaults to `SIGUSR1`.
+        """
+        signal.signal(signal_number, lambda *_: self.arm())
+
+    def start_http_toggle(self, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+        """
+        Serve the HTTP toggle in a background thread.
+
+        `POST /profile?cycles=5&mode=sampling` arms the profiler,
+        `GET /profile` returns its state.
+
+        Args:
+            port (int): The port.
+            host (str): The address to listen on. Defaults to localhost.
+
+        Returns:
+            ThreadingHTTPServer: The started server.
+        """
+        profiler = self
+
+        class ProfilerToggleHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if urlparse(self.path).path != '/profile':
+                    self._send_json(404, {'error': 'not found'})
+                    return
+                self._send_json(200, profiler.status())
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                if url.path != '/profile':
+                    self._send_json(404, {'error': 'not found'})
+                    return
+
+                query = parse_qs(url.query)
+                try:
+                    profiler.arm(
+                        cycles=int(query.get('cycles', [0])[0]),
+                        mode=query.get('mode', [None])[0],
+                    )
+                except ValueError as error:
+                    self._send_json(400, {'error': str(error)})
+                    return
+                self._send_json(200, profiler.status())
+
+            def log_message(self, *args):
+                """Keep the ETL log clean."""
+
+            def _send_json(self, status: int, payload: dict) -> None:
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), ProfilerToggleHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        LOGGER.info('Profiler toggle listens on %s:%s', host, server.server_port)
+        return server
+
+    def status(self) -> dict:
+        """
+        Return the state of the profiler.
+
+        Returns:
+            dict: the remaining profiled cycles, the profiler and the last cycle duration.
+        """
+        with self.lock:
+            return {
+                'remaining_cycles': self.remaining_cycles,
+                'mode': self.armed_mode,
+                'last_cycle_s': self.last_cycle_duration,
+            }
+
+    @contextmanager
+    def profile_cycle(self):
+        """
+        Profile the enclosed cycle if the profiler is armed.
+
+        Measures the cycle duration in any case and arms the profiler
+        for the next cycles if it exceeded `slow_cycle_threshold`.
+        """
+        with self.lock:
+            mode = self.armed_mode if self.remaining_cycles else None
+            self.remaining_cycles = max(self.remaining_cycles - 1, 0)
+
+        profile_name = datetime.now(timezone.utc).strftime('cycle-%Y%m%dT%H%M%S.%fZ')
+        profiler = self._start(mode)
+        started_at = perf_counter()
+        try:
+            yield
+        finally:
+            duration = perf_counter() - started_at
+            self._stop(mode, profiler, profile_name)
+            self.last_cycle_duration = round(duration, 3)
+
+        if self.slow_cycle_threshold and duration > self.slow_cycle_threshold and not mode:
+            LOGGER.warning('Slow cycle took %.1f s, profile the next cycles', duration)
+            self.arm()
+
+    def _start(self, mode: Optional[str]):
+        if mode == self.CPROFILE_MODE:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler
+
+        if mode == self.SAMPLING_MODE:
+            profiler = StackSampler(threading.get_ident(), interval=self.sample_interval)
+            profiler.start()
+            return profiler
+
+        return None
+
+    def _stop(self, mode: Optional[str], profiler, profile_name: str) -> None:
+        if profiler is None:
+            return
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        profile_path = self.directory / f'{profile_name}.folded'
+        if mode == self.CPROFILE_MODE:
+            profiler.disable()
+            profiler.dump_stats(self.directory / f'{profile_name}.prof')
+            stacks = collapse_profile_stats(pstats.Stats(profiler))
+        else:
+            stacks = profiler.stop()
+
+        write_collapsed_stacks(stacks, profile_path)
+        LOGGER.info('Cycle profile written to %s', profile_path)
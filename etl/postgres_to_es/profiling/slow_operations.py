@@ -0,0 +1,62 @@
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+
+from util.configuration import LOGGER
+
+
+class SlowOperationLog:
+    """
+    Record operations that exceeded their latency threshold.
+
+    Every slow operation is logged as a warning. If a directory is set, it is
+    also appended as one JSON line to `slow_operations.ndjson` together with
+    its details, e.g. the query plan of a slow query.
+    """
+
+    log_file_name = 'slow_operations.ndjson'
+
+    def __init__(self, directory: Optional[str] = None):
+        """
+        Initialize a SlowOperationLog object.
+
+        Args:
+            directory (str, optional): The directory of the log file.
+                Defaults to None, which only logs the operations.
+        """
+        self.directory = directory
+        self.lock = Lock()
+        self.recorded_count = 0
+
+    def record(self, kind: str, duration: float, **details) -> None:
+        """
+        Record a slow operation.
+
+        Args:
+            kind (str): The kind of the operation, e.g. `query` or `bulk`.
+            duration (float): The duration of the operation in seconds.
+            **details: The JSON serializable details of the operation.
+        """
+        LOGGER.warning('Slow %s took %.3f s', kind, duration)
+
+        with self.lock:
+            self.recorded_count += 1
+            if not self.directory:
+                return
+
+            directory = Path(self.directory)
+            directory.mkdir(parents=True, exist_ok=True)
+
+            record = {
+                'recorded_at': datetime.now(timezone.utc).isoformat(),
+                'kind': kind,
+                'duration_ms': round(duration * 1000, 1),
+                **details,
+            }
+            with open(directory / self.log_file_name, 'a') as log_file:
+                log_file.write(json.dumps(record, default=str) + '\n')
+
+
+SLOW_OPERATION_LOG = SlowOperationLog()
@@ -0,0 +1,294 @@
+import json
+import mmap
+import os
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from util.configuration import LOGGER
+
+# Compact UTF-8 lines, the encoding of the lines the loader serializes itself.
+encode_record = json.JSONEncoder(default=str, ensure_ascii=False, separators=(',', ':')).encode
+
+
+class SpoolFullError(Exception):
+    """Raised when appending records would exceed the spool size cap."""
+
+
+class WriteAheadSpool:
+    """
+    Disk-backed spool between the transform and the load stage.
+
+    Records are appended as NDJSON lines to numbered segment files. The loader
+    reads them back in order through memory-mapped files and confirms the
+    loaded position with `commit`. The read position is stored in a checkpoint
+    file that is replaced atomically, fully consumed segments are removed.
+
+    Attributes:
+        directory (Path): The directory of the segment and checkpoint files.
+        segment_max_bytes (int): The size after which a new segment is started.
+        max_spool_bytes (int): The maximum size of all pending segments.
+    """
+
+    segment_file_pattern = 'segment-{:012d}.ndjson'
+    checkpoint_file_name = 'checkpoint.json'
+
+    def __init__(
+        self,
+        directory: str,
+        segment_max_bytes: int = 16 * 1024 * 1024,
+        max_spool_bytes: int = 1024 * 1024 * 1024,
+    ):
+        """
+        Initialize a WriteAheadSpool object and recover its state from the directory.
+
+        Args:
+            directory (str): The directory of the segment and checkpoint files.
+            segment_max_bytes (int): The size after which a new segment is started.
+                Defaults to 16 MiB.
+            max_spool_bytes (int): The maximum size of all pending segments.
+                Defaults to 1 GiB.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self.segment_max_bytes = segment_max_bytes
+        self.max_spool_bytes = max_spool_bytes
+
+        self.appended_records = 0
+        self.drained_records = 0
+
+        self.read_segment, self.read_offset = self._retrieve_checkpoint()
+
+        segments = self._list_segments()
+        self.write_segment = max(segments[-1], self.read_segment) if segments else self.read_segment
+        self._truncate_incomplete_record(self.write_segment)
+
+    @classmethod
+    def create_spool(cls, namespace: Optional[str] = None, **kwargs):
+        """
+        Create a new instance of the WriteAheadSpool class with a default directory.
+
+        Args:
+            namespace (str, optional): The namespace of a pipeline, spooled in its own
+                sub-directory. Defaults to None (the spool of the ETL process).
+
+        Returns:
+            WriteAheadSpool: A new instance of the WriteAheadSpool class.
+        """
+        directory = 'spool/spool_data_storage'
+        if namespace:
+            directory = f'{directory}/{namespace}'
+        return WriteAheadSpool(directory, **kwargs)
+
+    def append(self, records: List[dict]) -> None:
+        """
+        Append records to the spool and flush them to disk.
+
+        Args:
+            records (List[dict]): The records to append.
+
+        Raises:
+            SpoolFullError: If the records don't fit into the spool size cap.
+        """
+        self.append_lines([encode_record(record) for record in records])
+
+    def append_lines(self, lines: List[str]) -> None:
+        """
+        Append records already serialized to JSON to the spool and flush them to disk.
+
+        Args:
+            lines (List[str]): The JSON records to append, without line breaks.
+
+        Raises:
+            SpoolFullError: If the records don't fit into the spool size cap.
+        """
+        if not lines:
+            return
+
+        payload = ''.join(line + '\n' for line in lines).encode('utf-8')
+
+        if self.pending_bytes + len(payload) > self.max_spool_bytes:
+            raise SpoolFullError(
+                f'spool size cap of {self.max_spool_bytes} bytes reached in {self.directory}',
+            )
+
+        if self._segment_size(self.write_segment) >= self.segment_max_bytes:
+            self.write_segment += 1
+
+        with open(self._segment_path(self.write_segment), 'ab') as segment_file:
+            segment_file.write(payload)
+            segment_file.flush()
+            os.fsync(segment_file.fileno())
+
+        self.appended_records += len(lines)
+
+    def read_batch(self, max_records: int) -> Tuple[List[dict], Optional[Tuple[int, int]]]:
+        """
+        Read the next records from the spool without consuming them.
+
+        Args:
+            max_records (int): The maximum number of records to read.
+
+        Returns:
+            Tuple[List[dict], Optional[Tuple[int, int]]]: the records and the position
+                to pass to `commit` once they are loaded.
+        """
+        self._skip_consumed_segments()
+
+        segment_path = self._segment_path(self.read_segment)
+        segment_size = self._segment_size(self.read_segment)
+        if segment_size <= self.read_offset:
+            return [], None
+
+        records = []
+        offset = self.read_offset
+        with open(segment_path, 'rb') as segment_file:
+            with mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ) as segment:
+                while len(records) < max_records:
+                    line_end = segment.find(b'\n', offset)
+                    if line_end == -1:
+                        break
+                    records.append(json.loads(segment[offset:line_end]))
+                    offset = line_end + 1
+
+        return records, (self.read_segment, offset)
+
+    def commit(self, position: Tuple[int, int]) -> None:
+        """
+        Mark the records up to the given position as loaded.
+
+        Args:
+            position (Tuple[int, int]): the position returned by `read_batch`.
+        """
+        segment, offset = position
+        if segment == self.read_segment and offset > self.read_offset:
+            self.drained_records += self._count_records(segment, self.read_offset, offset)
+
+        self.read_segment, self.read_offset = segment, offset
+        self._save_checkpoint()
+        self._skip_consumed_segments()
+
+    @property
+    def pending_bytes(self) -> int:
+        """Return the number of bytes not loaded yet."""
+        pending_bytes = sum(
+            self._segment_size(segment)
+            for segment in self._list_segments()
+            if segment >= self.read_segment
+        )
+        return max(pending_bytes - self.read_offset, 0)
+
+    def metrics(self) -> dict:
+        """
+        Return the spool depth metrics.
+
+        Returns:
+            dict: pending bytes and segments, appended and drained records of this process.
+        """
+        return {
+            'pending_bytes': self.pending_bytes,
+            'pending_segments': len([
+                segment for segment in self._list_segments() if segment >= self.read_segment
+            ]),
+            'appended_records': self.appended_records,
+            'drained_records': self.drained_records,
+        }
+
+    def _skip_consumed_segments(self) -> None:
+        """Move the read position behind fully loaded segments and remove them."""
+        while (
+            self.read_segment < self.write_segment
+            and self.read_offset >= self._segment_size(self.read_segment)
+        ):
+            self.read_segment += 1
+            self.read_offset = 0
+            self._save_checkpoint()
+
+        for segment in self._list_segments():
+            if segment < self.read_segment:
+                self._segment_path(segment).unlink(missing_ok=True)
+
+    def _retrieve_checkpoint(self) -> Tuple[int, int]:
+        """
+        Load the read position from the checkpoint file.
+
+        Returns:
+            Tuple[int, int]: the segment number and the byte offset.
+        """
+        try:
+            with open(self.directory / self.checkpoint_file_name, 'r') as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+        except FileNotFoundError:
+            segments = self._list_segments()
+            return (segments[0] if segments else 0), 0
+
+        return checkpoint['segment'], checkpoint['offset']
+
+    def _save_checkpoint(self) -> None:
+        """Replace the checkpoint file atomically with the current read position."""
+        checkpoint_path = self.directory / self.checkpoint_file_name
+        temporary_path = checkpoint_path.with_suffix('.tmp')
+
+        with open(temporary_path, 'w') as checkpoint_file:
+            json.dump({'segment': self.read_segment, 'offset': self.read_offset}, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+
+        os.replace(temporary_path, checkpoint_path)
+
+    def _truncate_incomplete_record(self, segment: int) -> None:
+        """
+        Cut off a partially written last record, e.g. after a crash during `append`.
+
+        Args:
+            segment (int): the segment number
+        """
+        segment_size = self._segment_size(segment)
+        if not segment_size:
+            return
+
+        with open(self._segment_path(segment), 'r+b') as segment_file:
+            with mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ) as segment_map:
+                complete_size = segment_map.rfind(b'\n') + 1
+
+            if complete_size < segment_size:
+                LOGGER.warning(
+                    'Drop %s bytes of an incomplete spool record in segment %s',
+                    segment_size - complete_size,
+                    segment,
+                )
+                segment_file.truncate(complete_size)
+
+    def _count_records(self, segment: int, start: int, end: int) -> int:
+        """
+        Count the records of a segment between two offsets.
+
+        Args:
+            segment (int): the segment number
+            start (int): the start offset
+            end (int): the end offset
+
+        Returns:
+            int: the number of records
+        """
+        with open(self._segment_path(segment), 'rb') as segment_file:
+            with mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ) as segment_map:
+                return segment_map[start:end].count(b'\n')
+
+    def _list_segments(self) -> List[int]:
+        """Return the sorted numbers of the existing segments."""
+        return sorted(
+            int(path.stem.split('-')[1])
+            for path in self.directory.glob('segment-*.ndjson')
+        )
+
+    def _segment_path(self, segment: int) -> Path:
+        """Return the path of a segment."""
+        return self.directory / self.segment_file_pattern.format(segment)
+
+    def _segment_size(self, segment: int) -> int:
+        """Return the size of a segment, 0 if it doesn't exist."""
+        try:
+            return self._segment_path(segment).stat().st_size
+        except FileNotFoundError:
+            return 0
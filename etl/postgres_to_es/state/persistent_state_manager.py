@@ -83,12 +83,50 @@ class JsonFileStorage(BaseStorage):
             json.dump(state, json_file)
 
     @classmethod
-    def create_storage(cls):
+    def create_storage(cls, namespace: Optional[str] = None):
         """
         Create a new instance of the JsonFileStorage class with a default file path.
 
+        Args:
+            namespace (str, optional): The state namespace of a pipeline, stored in
+                its own file. Defaults to None (the state file of the ETL process).
+
         Returns:
             JsonFileStorage: A new instance of the JsonFileStorage class.
         """
         json_file_storage = 'state/state_data_storage/json_state_storage.json'
+        if namespace:
+            json_file_storage = f'state/state_data_storage/{namespace}.json'
         return JsonFileStorage(json_file_storage)
+
+
+class MemoryStorage(BaseStorage):
+    """
+    A storage implementation that keeps the state in memory only.
+
+    Used by runs that must not touch the persisted state, e.g. a backfill.
+
+    Attributes:
+        state (dict): The stored state.
+    """
+
+    def __init__(self, state: Optional[dict] = None):
+        self.state = dict(state or {})
+
+    def retrieve_state(self) -> dict:
+        """
+        Return a copy of the stored state.
+
+        Returns:
+            dict: A dictionary representing the stored state.
+        """
+        return dict(self.state)
+
+    def save_state(self, state: dict) -> None:
+        """
+        Keep a copy of the given state.
+
+        Args:
+            state (dict): A dictionary representing the state to save.
+        """
+        self.state = dict(state)
@@ -0,0 +1,27 @@
+import pytest
+
+from extractor.components import coalescer, lane_scheduler
+from loader.elasticsearch import elasticsearch_loader
+from util.common import retry_policy
+from util.logger import logger
+
+# The modules whose `monotonic` is replaced by the `clock` fixture.
+CLOCK_MODULES = (coalescer, elasticsearch_loader, lane_scheduler, logger, retry_policy)
+
+
+class Clock:
+    """A settable replacement of `monotonic`."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    for module in CLOCK_MODULES:
+        monkeypatch.setattr(module, 'monotonic', clock)
+    return clock
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backfill import BackfillProgress
+from etl_settings import ENTITIES_UPDATE_SCHEMA
+
+SESSION_TIME_ZONE = timezone(timedelta(hours=3))
+
+
+def producer_states(position: datetime) -> dict:
+    return {
+        f"producer.{update_schema['producer']['entity_name']}": (position, 'id')
+        for update_schema in ENTITIES_UPDATE_SCHEMA.values()
+    }
+
+
+@pytest.mark.parametrize(
+    'slice_start',
+    [
+        datetime(2023, 5, 1, 0, 0, tzinfo=timezone.utc),
+        datetime(2023, 5, 1, 3, 0),
+    ],
+)
+def test_update_compares_positions_in_session_time_zone(slice_start):
+    progress = BackfillProgress(
+        [(slice_start, slice_start + timedelta(hours=10))],
+        session_time_zone=SESSION_TIME_ZONE,
+    )
+
+    progress.update(0, producer_states(datetime(2023, 5, 1, 8, 0, tzinfo=SESSION_TIME_ZONE)), 0)
+
+    assert progress.slice_progress[0] == pytest.approx(0.5)
@@ -0,0 +1,53 @@
+from util.common.batch_size_controller import AIMDBatchSizeController
+
+
+def create_controller(initial_size: int = 100) -> AIMDBatchSizeController:
+    return AIMDBatchSizeController(
+        name='merger',
+        initial_size=initial_size,
+        target_latency=1.0,
+        min_size=50,
+        max_size=300,
+        additive_step=50,
+        decrease_factor=0.5,
+    )
+
+
+def test_fast_batches_increase_the_size_up_to_the_maximum():
+    controller = create_controller()
+
+    sizes = []
+    for _ in range(5):
+        controller.observe(latency=1.0)
+        sizes.append(controller.size)
+
+    assert sizes == [150, 200, 250, 300, 300]
+
+
+def test_slow_batches_decrease_the_size_down_to_the_minimum():
+    controller = create_controller(initial_size=300)
+
+    sizes = []
+    for _ in range(4):
+        controller.observe(latency=1.5)
+        sizes.append(controller.size)
+
+    assert sizes == [150, 75, 50, 50]
+
+
+def test_cancelled_query_decreases_the_size():
+    controller = create_controller(initial_size=250)
+
+    controller.decrease()
+
+    assert controller.size == 125
+
+
+def test_persisted_size_is_kept_within_the_bounds():
+    controller = create_controller()
+
+    controller.size = 1000
+    assert controller.size == 300
+
+    controller.size = 10
+    assert controller.size == 50
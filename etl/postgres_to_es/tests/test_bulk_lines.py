@@ -0,0 +1,81 @@
+import uuid
+
+import pytest
+from elasticsearch import Elasticsearch
+
+from extractor.extractor import BaseExtractor
+from loader import ElasticsearchLoader
+from spool.write_ahead_spool import WriteAheadSpool
+
+FILM_WORKS = [
+    {
+        'fw_id': uuid.UUID('6e3c4f4e-2b1c-4b8e-9a55-0c1b9f2d7a10'),
+        'title': 'L\'Étoile "noire"',
+        'description': 'Line one\nline two \\ 星',
+        'rating': 7.5,
+        'genres': ['Drama', 'Sci-Fi'],
+        'persons': [
+            {'person_id': 'actor-1', 'full_name': 'Zoë "Z" Smith', 'person_role': 'actor'},
+            {'person_id': 'writer-1', 'full_name': 'Ann Lee', 'person_role': 'writer'},
+            {'person_id': 'director-1', 'full_name': 'Ann Lee', 'person_role': 'director'},
+            {'person_id': 'actor-2', 'full_name': 'Bob', 'person_role': 'actor'},
+            {'person_id': 'director-2', 'full_name': 'Carl', 'person_role': 'director'},
+        ],
+        'version': 12,
+    },
+    {
+        'fw_id': 'film-2',
+        'title': 'No persons',
+        'description': None,
+        'rating': None,
+        'genres': [],
+        'persons': None,
+        'version': None,
+    },
+    {
+        'fw_id': 'film-3',
+        'title': 'Unknown director',
+        'description': '',
+        'rating': 3,
+        'genres': ['Comedy'],
+        'persons': [
+            {'person_id': 'director-3', 'full_name': None, 'person_role': 'director'},
+            {'person_id': 'writer-3', 'full_name': 'Writer', 'person_role': 'writer'},
+        ],
+        'version': 3,
+    },
+]
+
+
+@pytest.fixture(params=[ElasticsearchLoader.UPDATE_MODE, ElasticsearchLoader.EXTERNAL_VERSION_MODE])
+def loader(request) -> ElasticsearchLoader:
+    return ElasticsearchLoader(
+        host={'scheme': 'http', 'host': 'localhost', 'port': 9200},
+        index_name='movies',
+        index_settings={},
+        indexing_mode=request.param,
+        client=Elasticsearch('http://localhost:9200'),
+    )
+
+
+def spooled_bytes(directory, append) -> bytes:
+    spool = WriteAheadSpool(str(directory))
+    append(spool)
+    return spool._segment_path(spool.write_segment).read_bytes()
+
+
+def test_film_work_lines_are_spooled_like_the_movie_actions(loader, tmp_path):
+    movies = BaseExtractor._transform_film_works_to_dataclass(None, film_works=FILM_WORKS)
+    actions = loader.prepare_actions(documents=movies)
+
+    movie_bytes = spooled_bytes(tmp_path / 'movies', lambda spool: spool.append(actions))
+    line_bytes = spooled_bytes(
+        tmp_path / 'lines',
+        lambda spool: spool.append_lines(
+            loader.prepare_lines(documents=loader.prepare_film_work_lines(film_works=FILM_WORKS)),
+        ),
+    )
+
+    assert line_bytes == movie_bytes
+    assert len(line_bytes.splitlines()) == len(FILM_WORKS)
+
@@ -0,0 +1,43 @@
+from extractor.components.coalescer import ChangeCoalescer
+
+
+def test_changes_are_released_after_a_quiet_window(clock):
+    coalescer = ChangeCoalescer(window=5, max_delay=30)
+    coalescer.add(['film-1', 'film-2'])
+
+    clock.now += 3
+    coalescer.add(['film-1'])
+    assert coalescer.release() == []
+
+    clock.now += 2
+    assert coalescer.release() == ['film-2']
+    assert 'film-1' in coalescer
+
+    clock.now += 3
+    assert coalescer.release() == ['film-1']
+    assert 'film-1' not in coalescer
+
+
+def test_repeated_changes_are_released_after_the_max_delay(clock):
+    coalescer = ChangeCoalescer(window=5, max_delay=12)
+
+    for _ in range(3):
+        coalescer.add(['film-1'])
+        assert coalescer.release() == []
+        clock.now += 4
+
+    coalescer.add(['film-1'])
+    assert coalescer.release() == ['film-1']
+    assert coalescer.metrics() == {
+        'received': 4,
+        'released': 1,
+        'buffered': 0,
+        'coalesce_ratio': 4.0,
+    }
+
+
+def test_without_window_changes_are_released_in_the_same_cycle(clock):
+    coalescer = ChangeCoalescer()
+    coalescer.add(['film-1', 'film-2', 'film-1'])
+
+    assert coalescer.release() == ['film-1', 'film-2']
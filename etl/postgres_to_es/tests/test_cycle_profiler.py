@@ -0,0 +1,25 @@
+from profiling.cycle_profiler import CycleProfiler
+
+
+def inner() -> int:
+    return sum(number * number for number in range(100000))
+
+
+def outer() -> int:
+    return inner()
+
+
+def test_cprofile_cycle_writes_collapsed_stacks(tmp_path):
+    profiler = CycleProfiler(str(tmp_path), mode=CycleProfiler.CPROFILE_MODE)
+    profiler.arm(cycles=1)
+
+    with profiler.profile_cycle():
+        outer()
+
+    assert len(list(tmp_path.glob('*.prof'))) == 1
+    folded_path, = tmp_path.glob('*.folded')
+    stacks = dict(line.rsplit(' ', 1) for line in folded_path.read_text().splitlines())
+
+    outer_stacks = [stack for stack in stacks if stack.startswith('outer (')]
+    assert any(';inner (test_cycle_profiler.py:' in stack for stack in outer_stacks)
+    assert all(int(count) > 0 for count in stacks.values())
@@ -0,0 +1,134 @@
+from elasticsearch import Elasticsearch
+
+from data.dataclasses import Genre, Person
+from loader.elasticsearch import elasticsearch_loader
+from loader.elasticsearch.elasticsearch_loader import ElasticsearchLoader
+
+
+class Client:
+    """A client which counts its `close` calls."""
+
+    def __init__(self):
+        self.close_count = 0
+
+    def close(self):
+        self.close_count += 1
+
+
+def create_loader(client) -> ElasticsearchLoader:
+    return ElasticsearchLoader(
+        host={'scheme': 'http', 'host': 'localhost', 'port': 9200},
+        index_name='movies',
+        index_settings={},
+        client=client,
+        bulk_routing=ElasticsearchLoader.PRIMARY_NODE_BULK_ROUTING,
+    )
+
+
+def test_unreachable_node_is_retried_after_refresh_interval(clock):
+    loader = create_loader(Elasticsearch('http://localhost:9200'))
+    loader.unreachable_nodes['es-1:9200'] = clock.now
+
+    clock.now += loader.shard_router.refresh_interval - 1
+    assert not loader._is_node_reachable('es-1:9200')
+
+    clock.now += 1
+    assert loader._is_node_reachable('es-1:9200')
+    assert not loader.unreachable_nodes
+
+
+def test_close_keeps_shared_client_open():
+    shared_client = Client()
+    node_client = Client()
+    loader = create_loader(shared_client)
+    loader.node_clients['es-1:9200'] = node_client
+
+    loader.close()
+
+    assert node_client.close_count == 1
+    assert shared_client.close_count == 0
+    assert not loader.node_clients
+
+
+def test_version_conflicts_are_logged_per_index(monkeypatch, caplog):
+    results = [
+        (True, {'index': {'_index': 'movies', '_id': 'a', 'status': 201}}),
+        (False, {'index': {'_index': 'movies', '_id': 'b', 'status': 409}}),
+        (False, {'index': {'_index': 'persons', '_id': 'c', 'status': 409}}),
+        (False, {'index': {'_index': 'persons', '_id': 'd', 'status': 409}}),
+    ]
+    monkeypatch.setattr(elasticsearch_loader, 'streaming_bulk', lambda *args, **kwargs: results)
+    loader = create_loader(Client())
+    loader.shard_router = None
+
+    loader._bulk_update_documents(actions=[])
+
+    conflicts = {record.index: record.conflict_count for record in caplog.records}
+    assert conflicts == {'movies': 1, 'persons': 2}
+
+
+class SourceDataProvider:
+    """A source with a fixed set of existing IDs."""
+
+    def __init__(self, existing_ids):
+        self.existing_ids = existing_ids
+        self.requested_ids = []
+
+    def select_existing_entity_ids(self, *, entity, entity_ids):
+        self.requested_ids.extend(entity_ids)
+        return [{'id': entity_id} for entity_id in entity_ids if entity_id in self.existing_ids]
+
+
+def test_delete_missing_docs_skips_ids_which_are_no_uuids(monkeypatch):
+    existing_id = '6d1b7b1c-2b9e-4f5a-9a59-2f8b4b1c0a01'
+    missing_id = '0c2a8d7e-5f4b-4c3a-8e1d-9b7a6c5d4e02'
+    hits = [{'_id': existing_id.upper()}, {'_id': missing_id}, {'_id': "x') OR true --"}]
+    monkeypatch.setattr(elasticsearch_loader, 'scan', lambda *args, **kwargs: iter(hits))
+    loader = create_loader(Client())
+    deleted_ids = []
+    monkeypatch.setattr(
+        loader,
+        'delete_documents',
+        lambda document_ids, index_name: deleted_ids.extend(document_ids),
+    )
+    source_data_provider = SourceDataProvider({existing_id})
+
+    loader._delete_missing_docs(
+        source_data_provider,
+        source_entity='film_work',
+        index_name='movies',
+    )
+
+    assert source_data_provider.requested_ids == [existing_id, missing_id]
+    assert deleted_ids == [missing_id]
+
+
+def test_linked_documents_are_read_from_the_indexed_documents(monkeypatch):
+    indexed_hits = {
+        'persons': [{'_id': 'person-1'}],
+        'movies': [{'_id': 'film-1', '_source': {'genre': ['Drama', 'Comedy']}}],
+        'genres': [{'_id': 'genre-1'}, {'_id': 'genre-2'}],
+    }
+    queries = {}
+
+    def scan(client, *, index, query, **kwargs):
+        queries[index] = query['query']
+        return iter(indexed_hits[index])
+
+    monkeypatch.setattr(elasticsearch_loader, 'scan', scan)
+    loader = ElasticsearchLoader(
+        host={'scheme': 'http', 'host': 'localhost', 'port': 9200},
+        index_name='movies',
+        index_settings={},
+        derived_indices={
+            Person: {'index_name': 'persons', 'index_settings': {}, 'source_entity': 'person'},
+            Genre: {'index_name': 'genres', 'index_settings': {}, 'source_entity': 'genre'},
+        },
+        client=Client(),
+    )
+
+    linked_document_ids = loader.select_linked_document_ids(['film-1'])
+
+    assert linked_document_ids == {Person: ['person-1'], Genre: ['genre-1', 'genre-2']}
+    assert queries['persons']['nested']['query'] == {'terms': {'films.id': ['film-1']}}
+    assert sorted(queries['genres']['terms']['name.raw']) == ['Comedy', 'Drama']
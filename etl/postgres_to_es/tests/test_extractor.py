@@ -0,0 +1,178 @@
+from datetime import datetime, timezone
+
+from data.dataclasses import Person
+from etl_settings import ENTITIES_UPDATE_SCHEMA
+from extractor import MultipleQueryExtractor
+from extractor.source_database.postgres import PostgresConnection
+from state.persistent_state_manager import MemoryStorage
+
+UTC = timezone.utc
+MODIFIED = datetime(2023, 5, 1, tzinfo=UTC)
+
+
+def uuid(number: int) -> str:
+    return f'00000000-0000-0000-0000-{number:012d}'
+
+
+class FakePostgresConnection:
+    """The queries of the extractor on tables of `(id, modified)` rows and actor links."""
+
+    def __init__(self, tables: dict, package_limit: int = 1000, person_film_works=()):
+        self.tables = tables
+        self.package_limit = package_limit
+        self.person_film_works = set(person_film_works)
+
+    def select_last_modified_entity_ids(
+        self,
+        *,
+        entity,
+        modified_timestamp,
+        after_id=None,
+        limit=None,
+        modified_until=None,
+    ):
+        if isinstance(modified_timestamp, str):
+            modified_timestamp = datetime.fromisoformat(modified_timestamp)
+        modified_timestamp = modified_timestamp.replace(tzinfo=modified_timestamp.tzinfo or UTC)
+
+        rows = sorted((modified, entity_id) for entity_id, modified in self.tables[entity].items())
+        if after_id is None:
+            rows = [row for row in rows if row[0] > modified_timestamp]
+        else:
+            rows = [row for row in rows if row > (modified_timestamp, after_id)]
+
+        limit = limit or self.package_limit
+        return [{'id': entity_id, 'modified': modified} for modified, entity_id in rows[:limit]]
+
+    def select_film_work_related_fields(self, film_work_ids):
+        return [
+            {
+                'fw_id': film_work_id,
+                'rating': None,
+                'genres': [],
+                'title': film_work_id,
+                'description': '',
+                'persons': [
+                    {'person_role': 'actor', 'person_id': person_id, 'full_name': person_id}
+                    for person_id, linked_film_work_id in sorted(self.person_film_works)
+                    if linked_film_work_id == film_work_id
+                ],
+                'genre_ids': [],
+            }
+            for film_work_id in film_work_ids
+        ]
+
+    def select_person_related_fields(self, person_ids):
+        return [
+            {
+                'id': person_id,
+                'full_name': person_id,
+                'films': [
+                    {'id': film_work_id, 'roles': ['actor']}
+                    for linked_person_id, film_work_id in sorted(self.person_film_works)
+                    if linked_person_id == person_id
+                ],
+            }
+            for person_id in person_ids
+        ]
+
+
+class FakePersonsIndex:
+    """The films of the indexed persons."""
+
+    def __init__(self):
+        self.films = {}
+
+    def load(self, documents):
+        for document in documents:
+            if isinstance(document, Person):
+                self.films[document.id] = {film['id'] for film in document.films}
+
+    def select_linked_document_ids(self, film_work_ids):
+        return {
+            Person: [
+                person_id
+                for person_id, films in self.films.items()
+                if films.intersection(film_work_ids)
+            ],
+        }
+
+
+def create_extractor(db_connection, storage, **kwargs) -> MultipleQueryExtractor:
+    return MultipleQueryExtractor(
+        db_connection=db_connection,
+        persistant_state_storage=storage,
+        entities_update_schema={'updateMovie': ENTITIES_UPDATE_SCHEMA['updateMovie']},
+        **kwargs,
+    )
+
+
+def test_last_modified_entity_ids_query_pages_by_modified_and_id():
+    sql_query = PostgresConnection.last_modified_entity_ids_query(
+        entity='film_work',
+        modified_timestamp='2023-05-01 00:00:00+00:00',
+        after_id=uuid(1),
+        limit=2,
+    )
+
+    assert f"(modified, id) > ('2023-05-01 00:00:00+00:00', '{uuid(1)}')" in sql_query
+    assert 'ORDER BY modified, id' in sql_query
+
+
+def test_extract_data_pages_rows_sharing_a_modified_timestamp():
+    film_work_ids = [uuid(number) for number in range(5)]
+    db_connection = FakePostgresConnection(
+        {'film_work': dict.fromkeys(film_work_ids, MODIFIED)},
+        package_limit=2,
+    )
+    storage = MemoryStorage()
+    extractor = create_extractor(db_connection, storage)
+
+    extracted_ids = []
+    for _ in range(4):
+        extracted_ids.extend(movie.id for movie in extractor.extract_data())
+        extractor.commit_state()
+
+    assert extracted_ids == film_work_ids
+    assert storage.state['producer.film_work'] == [MODIFIED.isoformat(), film_work_ids[-1]]
+
+
+def test_extract_data_resumes_from_the_persisted_position():
+    film_work_ids = [uuid(number) for number in range(5)]
+    db_connection = FakePostgresConnection(
+        {'film_work': dict.fromkeys(film_work_ids, MODIFIED)},
+        package_limit=2,
+    )
+    storage = MemoryStorage()
+    extractor = create_extractor(db_connection, storage)
+    extractor.extract_data()
+    extractor.commit_state()
+
+    resumed_extractor = create_extractor(db_connection, storage)
+
+    assert [movie.id for movie in resumed_extractor.extract_data()] == film_work_ids[2:4]
+
+
+def test_extract_data_updates_the_persons_unlinked_from_a_film():
+    film_work_id = uuid(1)
+    person_id = uuid(2)
+    db_connection = FakePostgresConnection(
+        {'film_work': {film_work_id: MODIFIED}},
+        person_film_works=[(person_id, film_work_id)],
+    )
+    persons_index = FakePersonsIndex()
+    extractor = create_extractor(
+        db_connection,
+        MemoryStorage(),
+        derived_documents=[MultipleQueryExtractor.PERSON_DOCUMENT],
+        linked_documents_provider=persons_index.select_linked_document_ids,
+    )
+    persons_index.load(extractor.extract_data())
+    extractor.commit_state()
+    assert persons_index.films == {person_id: {film_work_id}}
+
+    db_connection.person_film_works.clear()
+    db_connection.tables['film_work'][film_work_id] = MODIFIED.replace(hour=1)
+    persons_index.load(extractor.extract_data())
+
+    assert persons_index.films == {person_id: set()}
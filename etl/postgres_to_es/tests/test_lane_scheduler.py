@@ -0,0 +1,176 @@
+from extractor.components.lane_scheduler import LaneScheduler
+
+LANES = {
+    'film': {'weight': 8, 'slo': 5},
+    'genre': {'weight': 1, 'slo': 300},
+}
+
+
+def documents(lane_name: str, count: int) -> list:
+    return [(lane_name, number) for number in range(count)]
+
+
+def served_per_lane(served: list) -> dict:
+    counts = {}
+    for lane_name, _ in served:
+        counts[lane_name] = counts.get(lane_name, 0) + 1
+    return counts
+
+
+def test_schedule_serves_all_documents_without_budget(clock):
+    scheduler = LaneScheduler(lanes=LANES)
+    scheduler.add(documents('film', 3), 'film')
+    scheduler.add(documents('genre', 4), 'genre')
+
+    assert len(scheduler.schedule()) == 7
+    assert not scheduler.schedule()
+
+
+def test_schedule_shares_budget_by_lane_weight(clock):
+    scheduler = LaneScheduler(lanes=LANES, budget=90)
+    scheduler.add(documents('film', 100), 'film')
+    scheduler.add(documents('genre', 100), 'genre')
+
+    assert served_per_lane(scheduler.schedule()) == {'film': 80, 'genre': 10}
+
+
+def test_schedule_gives_unused_share_to_other_lanes(clock):
+    scheduler = LaneScheduler(lanes=LANES, budget=90)
+    scheduler.add(documents('film', 5), 'film')
+    scheduler.add(documents('genre', 100), 'genre')
+
+    assert served_per_lane(scheduler.schedule()) == {'film': 5, 'genre': 85}
+
+
+def test_schedule_spreads_fan_out_over_cycles(clock):
+    scheduler = LaneScheduler(lanes=LANES, budget=1000)
+    scheduler.add(documents('genre', 2600), 'genre')
+
+    served_counts = []
+    for _ in range(4):
+        served_counts.append(len(scheduler.schedule()))
+        scheduler.acknowledge()
+
+    assert served_counts == [1000, 1000, 600, 0]
+
+
+def test_schedule_boosts_overdue_lane_with_half_of_budget(clock):
+    scheduler = LaneScheduler(lanes=LANES, budget=10)
+    scheduler.add(documents('genre', 20), 'genre')
+    clock.now += 400
+    scheduler.add(documents('film', 20), 'film')
+
+    assert served_per_lane(scheduler.schedule()) == {'genre': 5, 'film': 5}
+
+
+def test_schedule_boosts_only_overdue_documents(clock):
+    scheduler = LaneScheduler(lanes=LANES, budget=10)
+    scheduler.add(documents('genre', 2), 'genre')
+    clock.now += 400
+    scheduler.add([('genre', 'new')], 'genre')
+    scheduler.add(documents('film', 20), 'film')
+
+    assert scheduler.schedule() == documents('genre', 2) + documents('film', 8)
+
+
+def test_schedule_without_overdue_lane_uses_weights(clock):
+    scheduler = LaneScheduler(lanes=LANES, budget=10)
+    scheduler.add(documents('genre', 20), 'genre')
+    scheduler.add(documents('film', 20), 'film')
+
+    assert served_per_lane(scheduler.schedule()) == {'film': 9, 'genre': 1}
+
+
+def test_add_moves_document_to_higher_priority_lane(clock):
+    scheduler = LaneScheduler(lanes=LANES)
+    scheduler.add(['a'], 'genre')
+    clock.now += 10
+    scheduler.add(['a'], 'film')
+    clock.now += 10
+
+    assert scheduler.queued_lanes == {'a': 'film'}
+    assert not scheduler.lanes['genre'].queue
+    assert scheduler.lanes['film'].oldest_wait(clock.now) == 20
+
+
+def test_add_keeps_document_in_higher_priority_lane(clock):
+    scheduler = LaneScheduler(lanes=LANES)
+    scheduler.add(['a'], 'film')
+    scheduler.add(['a'], 'genre')
+
+    assert scheduler.queued_lanes == {'a': 'film'}
+    assert not scheduler.lanes['genre'].queue
+
+
+def test_add_queues_unknown_lane_in_lowest_priority_lane(clock):
+    scheduler = LaneScheduler(lanes=LANES)
+    scheduler.add(['a'], 'unknown')
+    scheduler.add(['b'])
+
+    assert scheduler.queued_lanes == {'a': 'genre', 'b': 'genre'}
+
+
+def test_requeue_puts_documents_back_to_head_in_order(clock):
+    scheduler = LaneScheduler(lanes=LANES, budget=2)
+    scheduler.add(['a', 'b', 'c', 'd'], 'film')
+
+    assert scheduler.schedule() == ['a', 'b']
+    scheduler.requeue()
+
+    scheduler.budget = None
+    assert scheduler.schedule() == ['a', 'b', 'c', 'd']
+
+
+def test_requeue_keeps_queueing_time(clock):
+    scheduler = LaneScheduler(lanes=LANES, budget=1)
+    scheduler.add(['a'], 'film')
+    clock.now += 10
+    scheduler.add(['b'], 'film')
+
+    scheduler.schedule()
+    scheduler.requeue()
+
+    assert scheduler.lanes['film'].oldest_wait(clock.now) == 10
+
+
+def test_requeue_skips_documents_queued_again(clock):
+    scheduler = LaneScheduler(lanes=LANES)
+    scheduler.add(['a'], 'genre')
+    scheduler.schedule()
+    scheduler.add(['a'], 'film')
+
+    scheduler.requeue()
+
+    assert scheduler.queued_lanes == {'a': 'film'}
+    assert list(scheduler.lanes['genre'].queue) == []
+
+
+def test_acknowledge_records_latency_and_slo_violations(clock):
+    scheduler = LaneScheduler(lanes=LANES)
+    scheduler.add(['a', 'b'], 'film')
+    scheduler.schedule()
+    clock.now += 6
+
+    scheduler.acknowledge()
+
+    metrics = scheduler.metrics()['film']
+    assert metrics['served'] == 2
+    assert metrics['slo_violations'] == 2
+    assert metrics['p99_latency_s'] == 6
+    assert not scheduler.in_flight
+
+
+def test_schedule_rotates_lanes_when_budget_is_below_total_weight(clock):
+    scheduler = LaneScheduler(
+        lanes={'film': {'weight': 8}, 'person': {'weight': 3}, 'genre': {'weight': 1}},
+        budget=10,
+    )
+    for lane_name in ('film', 'person', 'genre'):
+        scheduler.add(documents(lane_name, 100), lane_name)
+
+    served = []
+    for _ in range(6):
+        served.extend(scheduler.schedule())
+        scheduler.acknowledge()
+
+    assert served_per_lane(served) == {'film': 40, 'person': 15, 'genre': 5}
@@ -0,0 +1,52 @@
+import logging
+
+import pytest
+
+from util.logger.logger import RateLimitFilter, SamplingFilter
+
+
+def record(message: str = 'Lane metrics: %s', level: int = logging.INFO, **extra):
+    return logging.makeLogRecord(
+        {'name': 'ETL', 'msg': message, 'levelno': level, 'rate_limited': True, **extra},
+    )
+
+
+@pytest.mark.parametrize(('sample_rate', 'expected'), [(1, 30), (0.5, 15), (0.1, 3)])
+def test_sampling_filter_passes_the_share_of_the_per_batch_records(sample_rate, expected):
+    sampling_filter = SamplingFilter(sample_rate)
+
+    log_records = [record() for _ in range(30)]
+    passed = [log_record for log_record in log_records if sampling_filter.filter(log_record)]
+
+    assert len(passed) == expected
+    assert all(log_record.sample_rate == sample_rate for log_record in passed)
+
+
+def test_sampling_filter_samples_per_template_and_pipeline():
+    sampling_filter = SamplingFilter(0.1)
+
+    assert sampling_filter.filter(record(pipeline='movies'))
+    assert sampling_filter.filter(record(pipeline='series'))
+    assert sampling_filter.filter(record('Spool metrics: %s', pipeline='movies'))
+    assert not sampling_filter.filter(record(pipeline='movies'))
+
+
+def test_sampling_filter_passes_other_records():
+    sampling_filter = SamplingFilter(0.1)
+    sampling_filter.filter(record())
+
+    assert sampling_filter.filter(record(level=logging.ERROR))
+    assert sampling_filter.filter(record(rate_limited=False))
+
+
+def test_rate_limit_filter_counts_the_suppressed_records(clock):
+    rate_limit_filter = RateLimitFilter(rate=1)
+
+    assert rate_limit_filter.filter(record())
+    assert not rate_limit_filter.filter(record())
+    assert not rate_limit_filter.filter(record())
+
+    clock.now += 1
+    passed_record = record()
+    assert rate_limit_filter.filter(passed_record)
+    assert passed_record.suppressed == 2
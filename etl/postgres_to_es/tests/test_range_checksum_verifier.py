@@ -0,0 +1,99 @@
+from contextlib import contextmanager
+from dataclasses import replace
+
+from data.dataclasses import Movie
+from loader.elasticsearch.elasticsearch_loader import ElasticsearchLoader
+from verifier.range_checksum_verifier import RangeChecksumVerifier
+
+
+def uuid(number: int) -> str:
+    return f'{number:08x}-0000-0000-0000-000000000000'
+
+
+def movie(number: int, title: str = 'title') -> Movie:
+    return Movie(id=uuid(number), imdb_rating=7.5, title=title, description='', version=1)
+
+
+class FakePostgresConnection:
+    """The statement timeouts set by the verifier."""
+
+    def __init__(self):
+        self.statement_timeouts = []
+
+    @contextmanager
+    def statement_timeout_override(self, statement_timeout):
+        self.statement_timeouts.append(statement_timeout)
+        yield
+
+
+class FakeExtractor:
+    """The movies built from Postgres."""
+
+    def __init__(self, movies):
+        self.db_connection = FakePostgresConnection()
+        self.movies = {movie.id: movie for movie in movies}
+
+    def extract_movie_ranges(self, prefixes):
+        for film_work_id, source_movie in sorted(self.movies.items()):
+            if any(film_work_id.startswith(prefix) for prefix in prefixes):
+                yield source_movie
+
+    def extract_movies(self, film_work_ids):
+        return [self.movies[film_work_id] for film_work_id in film_work_ids]
+
+
+class FakeLoader:
+    """The movies index as sources by document ID."""
+
+    document_source = staticmethod(ElasticsearchLoader.document_source)
+
+    def __init__(self, movies):
+        self.sources = {}
+        self.load_data(movies)
+
+    def load_data(self, documents):
+        for document in documents:
+            self.sources[document.id] = self.document_source(document)
+
+    def delete_documents(self, document_ids):
+        for document_id in document_ids:
+            del self.sources[document_id]
+
+    def select_range_digests(self, prefixes):
+        digests = {}
+        for prefix in prefixes:
+            hashes = [
+                source['content_hash']
+                for document_id, source in self.sources.items()
+                if document_id.startswith(prefix)
+            ]
+            digests[prefix] = (len(hashes), sum(hashes))
+        return digests
+
+    def select_content_hashes(self, prefixes):
+        return {
+            document_id: source['content_hash']
+            for document_id, source in self.sources.items()
+            if any(document_id.startswith(prefix) for prefix in prefixes)
+        }
+
+
+def test_verify_finds_changed_content_of_the_same_version():
+    indexed_movies = [movie(number) for number in range(0x10, 0x40)]
+    source_movies = indexed_movies[1:] + [movie(0x50)]
+    source_movies[0] = replace(source_movies[0], title='changed title')
+    extractor = FakeExtractor(source_movies)
+    loader = FakeLoader(indexed_movies)
+    verifier = RangeChecksumVerifier(
+        extractor=extractor,
+        loader=loader,
+        leaf_size=4,
+        statement_timeout=600,
+    )
+
+    report = verifier.verify()
+
+    assert sorted(report['reindexed']) == [uuid(0x11), uuid(0x50)]
+    assert report['deleted'] == [uuid(0x10)]
+    assert extractor.db_connection.statement_timeouts == [600]
+    assert verifier.verify()['divergent_ranges'] == 0
@@ -0,0 +1,115 @@
+import pytest
+
+from util.common import retry_policy
+from util.common.retry_policy import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+
+class TransientError(Exception):
+    pass
+
+
+class FlakyFunction:
+    """A function which fails a number of times before it returns."""
+
+    def __init__(self, failures: int, error_class=TransientError):
+        self.failures = failures
+        self.error_class = error_class
+        self.call_count = 0
+
+    def __call__(self):
+        self.call_count += 1
+        if self.call_count <= self.failures:
+            raise self.error_class('failed')
+        return 'result'
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> list:
+    sleeps = []
+    monkeypatch.setattr(retry_policy, 'sleep', sleeps.append)
+    return sleeps
+
+
+def test_circuit_breaker_state_transitions(clock):
+    circuit_breaker = CircuitBreaker('postgres', failure_threshold=2, recovery_timeout=30)
+
+    circuit_breaker.record_failure()
+    assert circuit_breaker.state == CircuitBreaker.CLOSED
+
+    circuit_breaker.record_failure()
+    assert circuit_breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        circuit_breaker.before_call()
+
+    clock.now += 30
+    assert circuit_breaker.state == CircuitBreaker.HALF_OPEN
+    circuit_breaker.before_call()
+
+    circuit_breaker.record_failure()
+    assert circuit_breaker.state == CircuitBreaker.OPEN
+
+    clock.now += 30
+    circuit_breaker.record_success()
+    assert circuit_breaker.state == CircuitBreaker.CLOSED
+    assert circuit_breaker.failure_count == 0
+
+
+def test_retry_policy_retries_transient_errors(sleeps):
+    reset_errors = []
+    policy = RetryPolicy(
+        name='postgres',
+        retry_on=(TransientError,),
+        max_attempts=3,
+        base_delay=1,
+        max_delay=3,
+        on_retry=reset_errors.append,
+    )
+    function = FlakyFunction(failures=2)
+
+    assert policy.call(function) == 'result'
+    assert function.call_count == 3
+    assert len(reset_errors) == 2
+    assert 0 <= sleeps[0] <= 2
+    assert 0 <= sleeps[1] <= 3
+
+
+def test_retry_policy_gives_up_after_max_attempts(sleeps):
+    policy = RetryPolicy(name='postgres', retry_on=(TransientError,), max_attempts=3)
+    function = FlakyFunction(failures=3)
+
+    with pytest.raises(TransientError):
+        policy.call(function)
+
+    assert function.call_count == 3
+    assert len(sleeps) == 2
+
+
+def test_retry_policy_raises_other_errors_at_once(sleeps):
+    policy = RetryPolicy(name='postgres', retry_on=(TransientError,))
+    function = FlakyFunction(failures=1, error_class=ValueError)
+
+    with pytest.raises(ValueError):
+        policy.call(function)
+
+    assert function.call_count == 1
+    assert not sleeps
+
+
+def test_retry_policy_rejects_calls_while_the_circuit_is_open(clock, sleeps):
+    circuit_breaker = CircuitBreaker('elasticsearch', failure_threshold=2, recovery_timeout=30)
+    policy = RetryPolicy(
+        name='elasticsearch',
+        retry_on=(TransientError,),
+        max_attempts=5,
+        circuit_breaker=circuit_breaker,
+    )
+    function = FlakyFunction(failures=5)
+
+    with pytest.raises(CircuitOpenError):
+        policy.call(function)
+    assert function.call_count == 2
+
+    clock.now += 30
+    function.failures = 0
+    assert policy.call(function) == 'result'
+    assert circuit_breaker.state == CircuitBreaker.CLOSED
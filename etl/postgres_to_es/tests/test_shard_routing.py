@@ -0,0 +1,75 @@
+import pytest
+
+from loader.elasticsearch.shard_routing import (
+    calculate_routing_shards,
+    murmur3_32,
+    routing_hash,
+    shard_for_id,
+)
+
+
+def signed(hash_value: int) -> int:
+    return hash_value - (1 << 32) if hash_value & 0x80000000 else hash_value
+
+
+@pytest.mark.parametrize(
+    ('data', 'seed', 'expected'),
+    [
+        (b'', 0, 0),
+        (b'', 1, 0x514e28b7),
+        (b'\xff\xff\xff\xff', 0, 0x76293b50),
+        (b'!Ce\x87', 0, 0xf55b516b),
+        (b'test', 0, 0xba6bd213),
+        (b'Hello, world!', 1234, 0xfaf6cdb3),
+    ],
+)
+def test_murmur3_32_matches_reference_vectors(data, seed, expected):
+    assert murmur3_32(data, seed) == signed(expected)
+
+
+# The vectors of Elasticsearch's `Murmur3HashFunctionTests`.
+@pytest.mark.parametrize(
+    ('routing', 'expected'),
+    [
+        ('hell', 0x5a0cb7c3),
+        ('hello', 0xd7c31989),
+        ('hello w', 0x22ab2984),
+        ('hello wo', 0xdf0ca123),
+        ('hello wor', 0xe7744d61),
+        ('The quick brown fox jumps over the lazy dog', 0xe07db09c),
+        ('The quick brown fox jumps over the lazy cog', 0x4e63d2ad),
+    ],
+)
+def test_routing_hash_matches_elasticsearch(routing, expected):
+    assert routing_hash(routing) == signed(expected)
+
+
+# The vectors of Elasticsearch's `MetadataCreateIndexServiceTests`.
+@pytest.mark.parametrize(
+    ('number_of_shards', 'expected'),
+    [(1, 1024), (2, 1024), (3, 768), (5, 640), (9, 576), (512, 1024), (1024, 2048), (2048, 4096)],
+)
+def test_calculate_routing_shards_matches_elasticsearch(number_of_shards, expected):
+    assert calculate_routing_shards(number_of_shards) == expected
+
+
+@pytest.mark.parametrize(
+    ('document_id', 'number_of_shards', 'routing_shards', 'expected'),
+    [
+        ('hell', 1, 1024, 0),
+        ('hell', 2, 1024, 1),
+        ('hell', 3, 768, 0),
+        ('hell', 5, 640, 1),
+        ('hello', 2, 1024, 0),
+        ('hello', 3, 768, 2),
+        ('hello', 5, 640, 4),
+        ('hello', 5, 5, 1),
+    ],
+)
+def test_shard_for_id_routes_like_elasticsearch(
+    document_id,
+    number_of_shards,
+    routing_shards,
+    expected,
+):
+    assert shard_for_id(document_id, number_of_shards, routing_shards) == expected
@@ -0,0 +1,67 @@
+import pytest
+
+from spool.write_ahead_spool import SpoolFullError, WriteAheadSpool
+
+
+def records(start: int, stop: int) -> list:
+    return [
+        {'_id': str(number), 'doc': {'title': f'film {number}'}}
+        for number in range(start, stop)
+    ]
+
+
+def test_records_are_read_in_order_across_segments(tmp_path):
+    spool = WriteAheadSpool(str(tmp_path), segment_max_bytes=100)
+    for start in range(0, 9, 3):
+        spool.append(records(start, start + 3))
+
+    read_records = []
+    while True:
+        batch, position = spool.read_batch(max_records=2)
+        if not batch:
+            break
+        read_records.extend(batch)
+        spool.commit(position)
+
+    assert read_records == records(0, 9)
+    assert spool.pending_bytes == 0
+    assert len(list(tmp_path.glob('segment-*.ndjson'))) == 1
+    assert spool.metrics()['drained_records'] == 9
+
+
+def test_torn_write_is_truncated_on_recovery(tmp_path):
+    spool = WriteAheadSpool(str(tmp_path))
+    spool.append(records(0, 2))
+    segment_path = spool._segment_path(spool.write_segment)
+    with open(segment_path, 'ab') as segment_file:
+        segment_file.write(b'{"_id": "2", "doc": {"tit')
+
+    recovered_spool = WriteAheadSpool(str(tmp_path))
+    recovered_spool.append(records(3, 4))
+
+    batch, _ = recovered_spool.read_batch(max_records=10)
+    assert batch == records(0, 2) + records(3, 4)
+
+
+def test_uncommitted_records_are_read_again(tmp_path):
+    spool = WriteAheadSpool(str(tmp_path))
+    spool.append(records(0, 4))
+    batch, position = spool.read_batch(max_records=2)
+    spool.commit(position)
+
+    batch, _ = spool.read_batch(max_records=2)
+    assert batch == records(2, 4)
+    assert spool.read_batch(max_records=2)[0] == records(2, 4)
+
+    restarted_spool = WriteAheadSpool(str(tmp_path))
+    assert restarted_spool.read_batch(max_records=10)[0] == records(2, 4)
+
+
+def test_append_beyond_the_size_cap_is_rejected(tmp_path):
+    spool = WriteAheadSpool(str(tmp_path), max_spool_bytes=200)
+    spool.append(records(0, 2))
+
+    with pytest.raises(SpoolFullError):
+        spool.append(records(2, 6))
+
+    assert spool.read_batch(max_records=10)[0] == records(0, 2)
@@ -0,0 +1,70 @@
+from util.configuration import LOGGER
+
+
+class AIMDBatchSizeController:
+    """
+    Adaptive batch size using additive-increase/multiplicative-decrease.
+
+    The batch size grows by `additive_step` while the observed query latency stays
+    below `target_latency`, and is multiplied by `decrease_factor` once it exceeds it
+    or the query is cancelled by the statement timeout.
+    """
+
+    def __init__(
+        self,
+        *,
+        name: str,
+        initial_size: int,
+        target_latency: float,
+        min_size: int = 10,
+        max_size: int = 10000,
+        additive_step: int = 50,
+        decrease_factor: float = 0.5,
+    ):
+        """
+        Initialize an AIMDBatchSizeController object.
+
+        Args:
+            name (str): The query type the batch size is controlled for.
+            initial_size (int): The batch size to start with.
+            target_latency (float): The latency objective in seconds.
+            min_size (int): The lower bound of the batch size. Defaults to 10.
+            max_size (int): The upper bound of the batch size. Defaults to 10000.
+            additive_step (int): The increase after a fast batch. Defaults to 50.
+            decrease_factor (float): The factor applied after a slow batch. Defaults to 0.5.
+        """
+        self.name = name
+        self.target_latency = target_latency
+        self.min_size = min_size
+        self.max_size = max_size
+        self.additive_step = additive_step
+        self.decrease_factor = decrease_factor
+
+        self.size = initial_size
+
+    @property
+    def size(self) -> int:
+        """Return the current batch size."""
+        return self._size
+
+    @size.setter
+    def size(self, size: int) -> None:
+        self._size = min(max(int(size), self.min_size), self.max_size)
+
+    def observe(self, latency: float) -> None:
+        """
+        Adjust the batch size to the latency of a finished query.
+
+        Args:
+            latency (float): The query latency in seconds.
+        """
+        if latency > self.target_latency:
+            self.decrease()
+        else:
+            self.size += self.additive_step
+
+    def decrease(self) -> None:
+        """Decrease the batch size multiplicatively."""
+        previous_size = self.size
+        self.size = previous_size * self.decrease_factor
+        LOGGER.debug('Decrease %s batch size: %s -> %s', self.name, previous_size, self.size)
@@ -0,0 +1,194 @@
+import random
+from time import monotonic, sleep
+from typing import Callable, Optional, Tuple, Type
+
+from util.configuration import LOGGER
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker guarding a single dependency (e.g. Postgres or Elasticsearch).
+
+    The breaker is `closed` while calls succeed. After `failure_threshold` consecutive
+    failures it becomes `open` and rejects calls immediately. Once `recovery_timeout`
+    seconds have passed it becomes `half_open` and lets one trial call through:
+    a success closes the circuit again, a failure re-opens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30):
+        """
+        Initialize a CircuitBreaker object.
+
+        Args:
+            name (str): The name of the guarded dependency, used for logging.
+            failure_threshold (int): Consecutive failures before the circuit opens. Defaults to 5.
+            recovery_timeout (float): Seconds to wait before a trial call. Defaults to 30.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+
+        self.failure_count = 0
+        self.opened_at = None
+
+    @property
+    def state(self) -> str:
+        """Return the current state of the circuit."""
+        if self.opened_at is None:
+            return self.CLOSED
+        if monotonic() - self.opened_at >= self.recovery_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def before_call(self) -> None:
+        """
+        Check whether a call to the dependency is allowed.
+
+        Raises:
+            CircuitOpenError: If the circuit is open.
+        """
+        if self.state == self.OPEN:
+            raise CircuitOpenError(f'circuit breaker {self.name} is open')
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful call."""
+        if self.opened_at is not None:
+            LOGGER.info('Circuit breaker %s closed', self.name)
+
+        self.failure_count = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        """Count a failed call and open the circuit once the threshold is reached."""
+        self.failure_count += 1
+
+        if self.state == self.HALF_OPEN or self.failure_count >= self.failure_threshold:
+            if self.state != self.OPEN:
+                LOGGER.warning(
+                    'Circuit breaker %s opened after %s failures',
+                    self.name,
+                    self.failure_count,
+                )
+            self.opened_at = monotonic()
+
+
+class RetryPolicy:
+    """
+    Retry policy for calls to a single dependency.
+
+    Uses exponential backoff with full jitter: the sleep time before retry `n` is a random
+    value between 0 and `min(max_delay, base_delay * 2 ** n)`. Only the failed call is
+    repeated, so connections and progress of the caller are kept.
+    """
+
+    def __init__(
+        self,
+        *,
+        name: str,
+        retry_on: Tuple[Type[BaseException], ...],
+        max_attempts: int = 5,
+        base_delay: float = 0.1,
+        max_delay: float = 10,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        on_retry: Optional[Callable[[BaseException], None]] = None,
+    ):
+        """
+        Initialize a RetryPolicy object.
+
+        Args:
+            name (str): The name of the guarded dependency, used for logging.
+            retry_on (Tuple[Type[BaseException], ...]): The exception types considered transient.
+            max_attempts (int): The maximum number of attempts per call. Defaults to 5.
+            base_delay (float): The base of the exponential backoff in seconds. Defaults to 0.1.
+            max_delay (float): The upper bound of a single sleep in seconds. Defaults to 10.
+            circuit_breaker (CircuitBreaker, optional): The breaker guarding the dependency.
+            on_retry (Callable, optional): A hook called with the error before each retry,
+                e.g. to reset a broken connection.
+        """
+        self.name = name
+        self.retry_on = retry_on
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.circuit_breaker = circuit_breaker
+        self.on_retry = on_retry
+
+    def call(self, function: Callable, *args, **kwargs):
+        """
+        Call the function and retry it on transient errors.
+
+        Args:
+            function (Callable): The function to call.
+            *args: Positional arguments passed to the function.
+            **kwargs: Keyword arguments passed to the function.
+
+        Raises:
+            CircuitOpenError: If the circuit breaker rejects the call.
+            Exception: The last transient error once the attempts are exhausted,
+                or any non-transient error immediately.
+
+        Returns:
+            Any: The return value of the function.
+        """
+        attempt = 0
+        while True:
+            if self.circuit_breaker:
+                self.circuit_breaker.before_call()
+
+            attempt += 1
+            try:
+                result = function(*args, **kwargs)
+            except self.retry_on as error:
+                if self.circuit_breaker:
+                    self.circuit_breaker.record_failure()
+
+                if attempt >= self.max_attempts:
+                    LOGGER.error(
+                        '%s call %s() failed after %s attempts: %s',
+                        self.name,
+                        getattr(function, '__name__', function),
+                        attempt,
+                        error,
+                    )
+                    raise
+
+                sleep_time = self._compute_sleep_time(attempt)
+                LOGGER.warning(
+                    '%s call %s() failed (%s). Attempt %s/%s, next try in %.2f seconds',
+                    self.name,
+                    getattr(function, '__name__', function),
+                    error.__class__.__name__,
+                    attempt,
+                    self.max_attempts,
+                    sleep_time,
+                )
+                sleep(sleep_time)
+
+                if self.on_retry:
+                    self.on_retry(error)
+                continue
+
+            if self.circuit_breaker:
+                self.circuit_breaker.record_success()
+            return result
+
+    def _compute_sleep_time(self, attempt: int) -> float:
+        """
+        Compute the full jitter sleep time for the given attempt.
+
+        Args:
+            attempt (int): The number of the failed attempt, starting with 1.
+
+        Returns:
+            float: The sleep time in seconds.
+        """
+        backoff_ceiling = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(0, backoff_ceiling)
@@ -8,10 +8,54 @@ def read_app_config():
 
     process_sleep_time = config.getint('settings', 'PROCESS_SLEEP_TIME')
     page_data_size_limit = config.getint('settings', 'PAGE_DATA_SIZE_LIMIT')
+    coalesce_window = config.getfloat('settings', 'COALESCE_WINDOW', fallback=0)
+    coalesce_max_delay = config.getfloat('settings', 'COALESCE_MAX_DELAY', fallback=30)
+    adaptive_batch_size = config.getboolean('settings', 'ADAPTIVE_BATCH_SIZE', fallback=False)
+    batch_size_min = config.getint('settings', 'BATCH_SIZE_MIN', fallback=50)
+    batch_size_max = config.getint('settings', 'BATCH_SIZE_MAX', fallback=5000)
+    producer_target_latency = config.getfloat('settings', 'PRODUCER_TARGET_LATENCY', fallback=0.2)
+    enricher_target_latency = config.getfloat('settings', 'ENRICHER_TARGET_LATENCY', fallback=0.5)
+    merger_target_latency = config.getfloat('settings', 'MERGER_TARGET_LATENCY', fallback=1.0)
+    statement_timeout = config.getfloat('settings', 'STATEMENT_TIMEOUT', fallback=0)
+    slow_query_threshold = config.getfloat('settings', 'SLOW_QUERY_THRESHOLD', fallback=0)
+    slow_bulk_threshold = config.getfloat('settings', 'SLOW_BULK_THRESHOLD', fallback=0)
+    slow_cycle_threshold = config.getfloat('settings', 'SLOW_CYCLE_THRESHOLD', fallback=0)
+    profile_cycles = config.getint('settings', 'PROFILE_CYCLES', fallback=3)
+    profile_mode = config.get('settings', 'PROFILE_MODE', fallback='cprofile')
+    lane_cycle_budget = config.getint('settings', 'LANE_CYCLE_BUDGET', fallback=0)
+    reconcile_interval = config.getfloat('settings', 'RECONCILE_INTERVAL', fallback=0)
+    reconcile_statement_timeout = config.getfloat(
+        'settings',
+        'RECONCILE_STATEMENT_TIMEOUT',
+        fallback=0,
+    )
+    preflight_create_indexes = config.getboolean(
+        'settings',
+        'PREFLIGHT_CREATE_INDEXES',
+        fallback=False,
+    )
 
     configurations = {
         'PROCESS_SLEEP_TIME': process_sleep_time,
         'PAGE_DATA_SIZE_LIMIT': page_data_size_limit,
+        'COALESCE_WINDOW': coalesce_window,
+        'COALESCE_MAX_DELAY': coalesce_max_delay,
+        'ADAPTIVE_BATCH_SIZE': adaptive_batch_size,
+        'BATCH_SIZE_MIN': batch_size_min,
+        'BATCH_SIZE_MAX': batch_size_max,
+        'PRODUCER_TARGET_LATENCY': producer_target_latency,
+        'ENRICHER_TARGET_LATENCY': enricher_target_latency,
+        'MERGER_TARGET_LATENCY': merger_target_latency,
+        'STATEMENT_TIMEOUT': statement_timeout,
+        'SLOW_QUERY_THRESHOLD': slow_query_threshold,
+        'SLOW_BULK_THRESHOLD': slow_bulk_threshold,
+        'SLOW_CYCLE_THRESHOLD': slow_cycle_threshold,
+        'PROFILE_CYCLES': profile_cycles,
+        'PROFILE_MODE': profile_mode,
+        'PREFLIGHT_CREATE_INDEXES': preflight_create_indexes,
+        'LANE_CYCLE_BUDGET': lane_cycle_budget,
+        'RECONCILE_INTERVAL': reconcile_interval,
+        'RECONCILE_STATEMENT_TIMEOUT': reconcile_statement_timeout,
     }
     return configurations
 
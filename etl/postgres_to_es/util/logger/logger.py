@@ -1,25 +1,317 @@
+import atexit
+import json
 import logging
 import os
+import queue
 import re
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+from threading import Lock
+from time import monotonic
+from typing import Dict, Iterable, Optional, Tuple
+
+SYNC_MODE = 'sync'
+ASYNC_MODE = 'async'
+
+TEXT_FORMAT = 'text'
+JSON_FORMAT = 'json'
+
+# The attributes of every log record and the rate limit flag, the others were passed with `extra`.
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {
+    'message',
+    'asctime',
+    'taskName',
+    'rate_limited',
+}
+
+# The loggers of per-request events, all their records below ERROR are rate limited.
+RATE_LIMITED_LOGGERS = frozenset({'elastic_transport.transport'})
+
+
+class TextFormatter(logging.Formatter):
+    """Formatter of plain text log entries, which mentions suppressed records."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        sample_rate = getattr(record, 'sample_rate', None)
+        if sample_rate:
+            message = f'{message} [sampled at {sample_rate:g}]'
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            message = f'{message} [{suppressed} similar records suppressed]'
+        return message
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formatter of structured log entries, one JSON object per line.
+
+    Besides the time, level, logger and message, every field passed with
+    `extra` is written as a field of its own.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(
+            (key, value) for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES
+        )
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+def is_per_batch_record(record: logging.LogRecord, logger_names: frozenset) -> bool:
+    """
+    Return whether a log record is a per-batch event.
+
+    Args:
+        record (logging.LogRecord): The log record.
+        logger_names (frozenset): The loggers whose records are all per-batch events.
+
+    Returns:
+        bool: True for the records of the loggers and the records logged
+            with `extra={'rate_limited': True}`.
+    """
+    return getattr(record, 'rate_limited', False) or record.name in logger_names
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Sampling of the log records of per-batch events per message template.
+
+    The same records as by `RateLimitFilter` are sampled, the others always pass.
+    Of every template the share `sample_rate` of the records passes, evenly
+    spread and separately per `pipeline` field, starting with the first record.
+    The passed records carry the rate in their `sample_rate` field, so counts
+    can be scaled back. Records from `max_level` on always pass.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float,
+        max_level: int = logging.ERROR,
+        logger_names: Iterable[str] = RATE_LIMITED_LOGGERS,
+    ):
+        """
+        Initialize a SamplingFilter object.
+
+        Args:
+            sample_rate (float): The share of the records passed, between 0 and 1.
+            max_level (int): The level from which records always pass. Defaults to ERROR.
+            logger_names (Iterable[str]): The loggers whose records are all sampled.
+                Defaults to the transport logger.
+
+        Raises:
+            ValueError: If the sample rate isn't between 0 and 1.
+        """
+        if not 0 < sample_rate <= 1:
+            raise ValueError(f'sample rate not between 0 and 1: {sample_rate}')
+
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.max_level = max_level
+        self.logger_names = frozenset(logger_names)
+
+        self.lock = Lock()
+        # The share of a record passed so far per template, a record passes at 1.
+        self.credits: Dict[tuple, float] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.max_level:
+            return True
+        if not is_per_batch_record(record, self.logger_names):
+            return True
+
+        key = (record.name, record.levelno, record.msg, getattr(record, 'pipeline', None))
+        with self.lock:
+            credit = self.credits.get(key, 1 - self.sample_rate) + self.sample_rate
+            # The tolerance passes e.g. every tenth record at 0.1 despite the rounding.
+            if credit < 1 - 1e-9:
+                self.credits[key] = credit
+                return False
+            self.credits[key] = credit - 1
+
+        record.sample_rate = self.sample_rate
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Rate limit of the log records of per-batch events per message template.
+
+    Only the records of the `logger_names` and the records logged with
+    `extra={'rate_limited': True}` are limited, the others always pass. Every
+    template may log `rate` records per second on average and `burst` records
+    at once, separately per `pipeline` field. Further records are dropped before
+    they are formatted or queued, the next passed record of the template carries
+    the number of dropped records in its `suppressed` field. Records from
+    `max_level` on always pass.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: Optional[int] = None,
+        max_level: int = logging.ERROR,
+        logger_names: Iterable[str] = RATE_LIMITED_LOGGERS,
+    ):
+        """
+        Initialize a RateLimitFilter object.
+
+        Args:
+            rate (float): The records per second and message template.
+            burst (int, optional): The records passed at once. Defaults to the rate, at least 1.
+            max_level (int): The level from which records always pass. Defaults to ERROR.
+            logger_names (Iterable[str]): The loggers whose records are all rate limited.
+                Defaults to the transport logger.
+        """
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or max(int(rate), 1)
+        self.max_level = max_level
+        self.logger_names = frozenset(logger_names)
+
+        self.lock = Lock()
+        self.buckets: Dict[tuple, Tuple[float, float, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.max_level:
+            return True
+        if not is_per_batch_record(record, self.logger_names):
+            return True
+
+        key = (record.name, record.levelno, record.msg, getattr(record, 'pipeline', None))
+        now = monotonic()
+        with self.lock:
+            tokens, updated_at, suppressed = self.buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens < 1:
+                self.buckets[key] = (tokens, now, suppressed + 1)
+                return False
+            self.buckets[key] = (tokens - 1, now, 0)
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queue handler which leaves the formatting to the listener thread.
+
+    The standard `QueueHandler` formats every record on the logging thread so it
+    can be pickled. The queue of this handler stays in the process, so the record
+    is queued as it is. Objects passed as arguments are formatted later and must
+    not be changed after they were logged.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def create_log_handler(
+    log_filepath: Optional[str] = None,
+    message_format: Optional[str] = None,
+    mode: str = SYNC_MODE,
+    log_format: str = TEXT_FORMAT,
+    rate_limit: float = 0,
+    sample_rate: float = 1,
+) -> Tuple[logging.Handler, Optional[QueueListener]]:
+    """
+    Create the handler of the log records.
+
+    Args:
+        log_filepath (str, optional): The file path where the log is written. Defaults to stderr.
+        message_format (str, optional): The format of the text log entries.
+        mode (str): `sync` to write in the logging thread, or `async` to queue the records
+            to a listener thread, which formats and writes them. Defaults to `sync`.
+        log_format (str): `text` or `json` for one JSON object per entry. Defaults to `text`.
+        rate_limit (float): The records per second and message template of the per-batch
+            events below ERROR, see `RateLimitFilter`. Defaults to 0 (unlimited).
+        sample_rate (float): The share of the records of the per-batch events below ERROR
+            which is logged, see `SamplingFilter`. The sampled records are rate limited
+            afterwards. Defaults to 1 (all).
+
+    Raises:
+        ValueError: If the mode, the log format or the sample rate is invalid.
+
+    Returns:
+        Tuple[logging.Handler, Optional[QueueListener]]: The handler and, in `async` mode,
+            the started listener, which has to be stopped to write the queued records.
+    """
+    if mode not in {SYNC_MODE, ASYNC_MODE}:
+        raise ValueError(f'unknown log mode: {mode}')
+    if log_format not in {TEXT_FORMAT, JSON_FORMAT}:
+        raise ValueError(f'unknown log format: {log_format}')
+
+    handler = logging.FileHandler(log_filepath) if log_filepath else logging.StreamHandler()
+    if log_format == JSON_FORMAT:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter(message_format))
+
+    listener = None
+    if mode == ASYNC_MODE:
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, handler, respect_handler_level=True)
+        listener.start()
+        handler = DeferredQueueHandler(log_queue)
+
+    if sample_rate != 1:
+        handler.addFilter(SamplingFilter(sample_rate))
+    if rate_limit:
+        handler.addFilter(RateLimitFilter(rate_limit))
+
+    return handler, listener
 
 
 class Logger:
     """Helper class for logger setup."""
 
-    def __init__(self, log_filepath: str = None, message_format: str = None, level: int = logging.INFO):
+    def __init__(
+        self,
+        log_filepath: str = None,
+        message_format: str = None,
+        level: int = logging.INFO,
+        mode: str = SYNC_MODE,
+        log_format: str = TEXT_FORMAT,
+        rate_limit: float = 0,
+        sample_rate: float = 1,
+    ):
         """Initialize the Logger.
 
         Args:
             log_filepath (str): The file path where the log is written.
             message_format (str, optional): format of the log entry. Defaults to None.
+            mode (str): `sync` or `async` logging, see `create_log_handler`. Defaults to `sync`.
+            log_format (str): `text` or `json`. Defaults to `text`.
+            rate_limit (float): The records per second and message template of the per-batch
+                events below ERROR. Defaults to 0 (unlimited).
+            sample_rate (float): The share of the records of the per-batch events below ERROR
+                which is logged. Defaults to 1 (all).
         """
         if not message_format:
             message_format = '[%(name)s] >> [%(levelname)s] %(asctime)s >> %(message)s'
 
-        logging.basicConfig(filename=log_filepath,
-                            format=message_format,
-                            level=level)
+        handler, self.listener = create_log_handler(
+            log_filepath=log_filepath,
+            message_format=message_format,
+            mode=mode,
+            log_format=log_format,
+            rate_limit=rate_limit,
+            sample_rate=sample_rate,
+        )
+        if self.listener:
+            atexit.register(self.listener.stop)
+
+        logging.basicConfig(handlers=[handler], level=level)
 
         self.logger = logging.getLogger('ETL')
 
@@ -27,6 +319,13 @@ class Logger:
 def get_default_logger(log_filepath: str = None):
     log_filepath = None
     level = os.environ.get('LOG_LEVEL', 'INFO')
+    settings = {
+        'level': level,
+        'mode': os.environ.get('LOG_MODE', SYNC_MODE),
+        'log_format': os.environ.get('LOG_FORMAT', TEXT_FORMAT),
+        'rate_limit': float(os.environ.get('LOG_RATE_LIMIT', 0)),
+        'sample_rate': float(os.environ.get('LOG_SAMPLE_RATE', 1)),
+    }
 
     if log_filepath:
         filepath_parent_directories = re.split('[\\\/]', log_filepath)[:-1]
@@ -34,8 +333,8 @@ def get_default_logger(log_filepath: str = None):
 
         Path.mkdir(filepath_parent_directories, parents=True, exist_ok=True)
 
-        logger = Logger(log_filepath, level=level)
+        logger = Logger(log_filepath, **settings)
     else:
-        logger = Logger(level=level)
+        logger = Logger(**settings)
 
     return logger.logger
@@ -0,0 +1,211 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from extractor import MultipleQueryExtractor
+from loader import ElasticsearchLoader
+from util.configuration import LOGGER
+
+HEX_DIGITS = '0123456789abcdef'
+
+# The first group of a UUID, longer prefixes would have to skip the dash.
+MAX_PREFIX_LENGTH = 8
+
+# The divergent ranges compared document by document in one query per side.
+RANGES_PER_COMPARISON = 16
+
+
+class RangeChecksumVerifier:
+    """
+    Consistency check of the movies index against Postgres by ID range digests.
+
+    The film work ID space is split by ID prefix. For every range, the document count
+    and the sum of the per-document content hashes are computed on both sides.
+    The content hash is the hash of the serialized document source. The loader stores
+    it with every document, the movies of the range are built from Postgres and hashed
+    the same way. Only the ranges that differ are split further, one level
+    of 16 sub-ranges per round trip, until a range holds at most `leaf_size` documents.
+    The documents of these ranges are compared one by one, divergent documents
+    are re-indexed and documents missing in Postgres are deleted.
+    """
+
+    def __init__(
+        self,
+        *,
+        extractor: MultipleQueryExtractor,
+        loader: ElasticsearchLoader,
+        leaf_size: int = 1000,
+        batch_size: int = 500,
+        statement_timeout: Optional[float] = None,
+    ) -> None:
+        """
+        Initialize a RangeChecksumVerifier object.
+
+        Args:
+            extractor (MultipleQueryExtractor): The extractor used for the Postgres
+                queries and to re-extract divergent movies.
+            loader (ElasticsearchLoader): The loader of the movies index.
+            leaf_size (int): The document count up to which a divergent range is
+                compared document by document. Defaults to 1000.
+            batch_size (int): The number of movies re-indexed at once. Defaults to 500.
+            statement_timeout (float, optional): The `statement_timeout` of the Postgres
+                queries of the verification, which read whole ranges.
+                Defaults to None (no timeout).
+        """
+        LOGGER.debug("Initialize %s", type(self).__name__)
+        self.extractor = extractor
+        self.db_connection = extractor.db_connection
+        self.loader = loader
+        self.leaf_size = leaf_size
+        self.batch_size = batch_size
+        self.statement_timeout = statement_timeout
+
+    def verify(self, repair: bool = True) -> dict:
+        """
+        Compare the movies index with Postgres.
+
+        Args:
+            repair (bool): Re-index and delete the divergent documents. Defaults to True.
+
+        Returns:
+            dict: the number of compared ranges, queries per side, divergent ranges,
+                and the IDs of the re-indexed and deleted documents.
+        """
+        with self.db_connection.statement_timeout_override(self.statement_timeout):
+            divergent_ranges, compared_ranges, round_trips = self._find_divergent_ranges()
+
+            documents_to_index, documents_to_delete = [], []
+            for position in range(0, len(divergent_ranges), RANGES_PER_COMPARISON):
+                to_index, to_delete = self._compare_documents(
+                    divergent_ranges[position:position + RANGES_PER_COMPARISON],
+                )
+                documents_to_index.extend(to_index)
+                documents_to_delete.extend(to_delete)
+                round_trips += 1
+
+        if repair:
+            self._repair(documents_to_index, documents_to_delete)
+
+        report = {
+            'compared_ranges': compared_ranges,
+            'queries_per_side': round_trips,
+            'divergent_ranges': len(divergent_ranges),
+            'reindexed': documents_to_index,
+            'deleted': documents_to_delete,
+        }
+        LOGGER.info(
+            'Verified %s ranges with %s queries per side: %s divergent ranges, '
+            '%s documents to re-index, %s to delete',
+            compared_ranges,
+            round_trips,
+            len(divergent_ranges),
+            len(documents_to_index),
+            len(documents_to_delete),
+        )
+        return report
+
+    def _find_divergent_ranges(self) -> Tuple[List[str], int, int]:
+        """
+        Drill down into the ID ranges whose digests differ.
+
+        Returns:
+            Tuple[List[str], int, int]: the prefixes of the divergent leaf ranges,
+                the number of compared ranges and the number of queries per side
+        """
+        parent_prefixes = ['']
+        divergent_ranges = []
+        compared_ranges = 0
+        round_trips = 0
+
+        while parent_prefixes:
+            source_digests = self._select_source_digests(parent_prefixes)
+            prefixes = [prefix + digit for prefix in parent_prefixes for digit in HEX_DIGITS]
+            target_digests = self.loader.select_range_digests(prefixes=prefixes)
+            compared_ranges += len(prefixes)
+            round_trips += 1
+
+            parent_prefixes = []
+            for prefix in prefixes:
+                source_digest = source_digests.get(prefix, (0, 0))
+                target_digest = target_digests.get(prefix, (0, 0))
+                if source_digest == target_digest:
+                    continue
+
+                document_count = max(source_digest[0], target_digest[0])
+                if document_count <= self.leaf_size or len(prefix) >= MAX_PREFIX_LENGTH:
+                    divergent_ranges.append(prefix)
+                else:
+                    parent_prefixes.append(prefix)
+
+        return divergent_ranges, compared_ranges, round_trips
+
+    def _select_source_digests(self, prefixes: List[str]) -> Dict[str, tuple]:
+        """
+        Return the document count and content hash sum per child prefix in Postgres.
+
+        Args:
+            prefixes (List[str]): the parent prefixes
+
+        Returns:
+            Dict[str, tuple]: the document count and content hash sum per child prefix
+        """
+        prefix_length = len(prefixes[0]) + 1
+
+        digests = {}
+        for document_id, source_hash in self._source_hashes(prefixes):
+            prefix = document_id[:prefix_length]
+            document_count, digest = digests.get(prefix, (0, 0))
+            digests[prefix] = (document_count + 1, digest + source_hash)
+
+        return digests
+
+    def _source_hashes(self, prefixes: List[str]) -> Iterator[Tuple[str, int]]:
+        """
+        Hash the movies built from Postgres with the given ID prefixes like the loader.
+
+        Args:
+            prefixes (List[str]): the ID prefixes
+
+        Yields:
+            Tuple[str, int]: the document ID and content hash of a movie
+        """
+        for movie in self.extractor.extract_movie_ranges(prefixes):
+            yield str(movie.id), self.loader.document_source(movie)['content_hash']
+
+    def _compare_documents(self, prefixes: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        Compare the documents of divergent ranges one by one.
+
+        Args:
+            prefixes (List[str]): the prefixes of the divergent ranges
+
+        Returns:
+            Tuple[List[str], List[str]]: the IDs of the documents to re-index and to delete
+        """
+        source_hashes = dict(self._source_hashes(prefixes))
+        target_hashes = self.loader.select_content_hashes(prefixes=prefixes)
+
+        documents_to_index = [
+            document_id
+            for document_id, source_hash in source_hashes.items()
+            if target_hashes.get(document_id) != source_hash
+        ]
+        documents_to_delete = [
+            document_id for document_id in target_hashes if document_id not in source_hashes
+        ]
+        return documents_to_index, documents_to_delete
+
+    def _repair(self, documents_to_index: List[str], documents_to_delete: List[str]) -> None:
+        """
+        Re-index and delete divergent documents.
+
+        Args:
+            documents_to_index (List[str]): the IDs of the documents to re-index
+            documents_to_delete (List[str]): the IDs of the documents to delete
+        """
+        for position in range(0, len(documents_to_index), self.batch_size):
+            movies = self.extractor.extract_movies(
+                documents_to_index[position:position + self.batch_size],
+            )
+            self.loader.load_data(documents=movies)
+
+        if documents_to_delete:
+            self.loader.delete_documents(documents_to_delete)
@@ -0,0 +1,85 @@
+"""
+Verify the movies index against Postgres and repair divergent documents.
+
+The film work ID space is compared by range digests, only the ranges that
+differ are drilled into. Divergent documents are re-indexed from Postgres,
+documents missing in Postgres are deleted.
+
+Usage:
+    python verify.py
+    python verify.py --report-only --leaf-size 500
+"""
+import argparse
+from contextlib import closing
+
+from etl_settings import (
+    ENTITIES_UPDATE_SCHEMA,
+    get_elasticsearch_host,
+    get_loader_settings,
+    get_postgres_dsn,
+    load_elasticsearch_indices,
+)
+from extractor import MultipleQueryExtractor
+from extractor.source_database.postgres import PostgresConnection
+from loader import ElasticsearchLoader
+from pipeline import create_retry_policies
+from state.persistent_state_manager import MemoryStorage
+from util.configuration import read_app_config
+from verifier.range_checksum_verifier import RangeChecksumVerifier
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        '--report-only',
+        action='store_true',
+        help='report the divergent documents without repairing them',
+    )
+    parser.add_argument(
+        '--leaf-size',
+        type=int,
+        default=1000,
+        help='document count up to which a divergent range is compared document by document',
+    )
+    arguments = parser.parse_args()
+
+    configurations = read_app_config()
+    elasticsearch_index_schema, _ = load_elasticsearch_indices()
+
+    pg_connection = PostgresConnection(
+        dsn=get_postgres_dsn(),
+        package_limit=configurations['PAGE_DATA_SIZE_LIMIT'],
+        statement_timeout=None,
+    )
+
+    with closing(pg_connection) as pg_conn:
+        postgres_policy, _ = create_retry_policies(pg_conn)
+
+        extractor = MultipleQueryExtractor(
+            db_connection=pg_conn,
+            entities_update_schema=ENTITIES_UPDATE_SCHEMA,
+            persistant_state_storage=MemoryStorage(),
+            retry_policy=postgres_policy,
+        )
+
+        loader = ElasticsearchLoader(
+            host=get_elasticsearch_host(),
+            index_name=elasticsearch_index_schema['index_name'],
+            index_settings=elasticsearch_index_schema['index_settings'],
+            **get_loader_settings(),
+        )
+
+        with closing(loader):
+            verifier = RangeChecksumVerifier(
+                extractor=extractor,
+                loader=loader,
+                leaf_size=arguments.leaf_size,
+            )
+            verifier.verify(repair=not arguments.report_only)
+
+
+if __name__ == '__main__':
+    main()